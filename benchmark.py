@@ -0,0 +1,274 @@
+"""Retrieval and generation benchmarks with regression tracking.
+
+Generates synthetic corpora, then measures chunking and embedding
+throughput, index build time, VectorStore.search latency percentiles and
+QPS for several k, bytes per vector and recall of compressed storage, and
+LLMGenerator tokens per second. Metrics are written
+as a flat JSON dict; compare flags metrics that got worse than a baseline.
+
+    python benchmark.py run --sizes 1000,10000 --output bench.json
+    python benchmark.py run --sizes 1000 --baseline bench.json
+    python benchmark.py compare bench.json new.json --threshold 0.1
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+# Metric name suffixes where larger values are better; all other timings are lower-is-better
+_HIGHER_IS_BETTER = ("_per_s", "qps", "recall")
+
+
+def synthetic_corpus(folder: str, num_docs: int, words_per_doc: int = 400, vocabulary: int = 20000,
+                     seed: int = 0) -> List[str]:
+    """Write num_docs .txt files of Zipf-distributed pseudo-words and return their paths"""
+    rng = np.random.default_rng(seed)
+    syllables = ["ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "ze", "qua", "ber", "don"]
+    words = ["".join(rng.choice(syllables, size=rng.integers(2, 5))) + str(i % 97) for i in range(vocabulary)]
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for d in range(num_docs):
+        ranks = np.minimum(rng.zipf(1.2, size=words_per_doc), vocabulary) - 1
+        sentences = [" ".join(words[r] for r in ranks[i:i + 12]) + "." for i in range(0, words_per_doc, 12)]
+        path = os.path.join(folder, f"doc_{d:06d}.txt")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(" ".join(sentences))
+        paths.append(path)
+    return paths
+
+
+def percentiles(latencies: Sequence[float], prefix: str) -> Dict[str, float]:
+    """p50/p95/p99 in milliseconds and QPS for a list of per-query seconds"""
+    values = np.asarray(latencies) * 1000
+    return {
+        f"{prefix}/p50_ms": float(np.percentile(values, 50)),
+        f"{prefix}/p95_ms": float(np.percentile(values, 95)),
+        f"{prefix}/p99_ms": float(np.percentile(values, 99)),
+        f"{prefix}/qps": len(values) / (values.sum() / 1000) if values.sum() else 0.0
+    }
+
+
+def bench_ingest(paths: List[str], prefix: str) -> Tuple[List[str], Dict[str, float]]:
+    """DocumentProcessor chunking throughput"""
+    from document_processor import DocumentProcessor
+    processor = DocumentProcessor()
+    size = sum(os.path.getsize(path) for path in paths)
+    start = time.perf_counter()
+    chunks = [chunk for path in paths for chunk in processor.iter_chunks(path)]
+    elapsed = time.perf_counter() - start
+    return chunks, {
+        f"{prefix}/ingest/docs_per_s": len(paths) / elapsed,
+        f"{prefix}/ingest/mb_per_s": size / 1e6 / elapsed,
+        f"{prefix}/ingest/chunks_per_s": len(chunks) / elapsed,
+        f"{prefix}/ingest/chunks": len(chunks)
+    }
+
+
+def bench_embedding(store, chunks: List[str], prefix: str) -> Tuple[np.ndarray, Dict[str, float]]:
+    """Embedding throughput with the embedding cache bypassed"""
+    store.embedding_model  # exclude model load
+    start = time.perf_counter()
+    vectors = store.embedding_model.encode(chunks, batch_size=256, normalize_embeddings=True)
+    elapsed = time.perf_counter() - start
+    return np.asarray(vectors, dtype=np.float32), {f"{prefix}/embed/chunks_per_s": len(chunks) / elapsed}
+
+
+def bench_index_build(vectors: np.ndarray, index_types: Sequence[str], prefix: str) -> Dict[str, float]:
+    """Train + add time for each index type"""
+    from index_factory import build_index, train_index, DEFAULT_INDEX_PARAMS
+    metrics = {}
+    for index_type in index_types:
+        params = dict(DEFAULT_INDEX_PARAMS)
+        # Small corpora cannot train the default number of IVF lists
+        params["nlist"] = max(1, min(params["nlist"], len(vectors) // 39))
+        params["sq_min_train"] = min(params["sq_min_train"], len(vectors))
+        start = time.perf_counter()
+        index = build_index(index_type, vectors.shape[1], params)
+        train_index(index, vectors, params["train_size"], params["sq_min_train"])
+        index.add(vectors)
+        metrics[f"{prefix}/build/{index_type}_s"] = time.perf_counter() - start
+    return metrics
+
+
+def bench_compression(vectors: np.ndarray, queries: np.ndarray, k: int, prefix: str) -> Dict[str, float]:
+    """Bytes per vector and recall@k of float32, fp16 and sq8 storage, with and without exact re-scoring"""
+    from index_factory import compression_report
+    metrics = {}
+    for row in compression_report(vectors, queries, k):
+        name = f"{prefix}/compression/{row['setting'].replace(' ', '_')}"
+        metrics[f"{name}/recall"] = row['recall']
+        metrics[f"{name}/query_ms"] = row['ms_per_query']
+        metrics[f"{name}/bytes_per_vector"] = row['bytes_per_vector']
+    return metrics
+
+
+def bench_search(store, queries: List[str], ks: Sequence[int], prefix: str) -> Dict[str, float]:
+    """Per-query latency of VectorStore.search (end to end) and of the index alone"""
+    metrics = {}
+    query_vectors = np.asarray(store.embedding_model.encode(queries, normalize_embeddings=True), dtype=np.float32)
+    store.search(queries[0], max(ks))  # warm up
+    for k in ks:
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            store.search(query, k)
+            latencies.append(time.perf_counter() - start)
+        metrics.update(percentiles(latencies, f"{prefix}/search/k={k}"))
+
+        latencies = []
+        for row in range(len(query_vectors)):
+            start = time.perf_counter()
+            store.search_vectors(query_vectors[row:row + 1], k)
+            latencies.append(time.perf_counter() - start)
+        metrics.update(percentiles(latencies, f"{prefix}/index_search/k={k}"))
+    return metrics
+
+
+def bench_generator(model_name: str, prompts: List[Tuple[str, List[str]]], max_new_tokens: int) -> Dict[str, float]:
+    """LLMGenerator decode throughput and time to first token"""
+    from llm_generator import LLMGenerator
+    generator = LLMGenerator(model_name)
+    generator.warm_up()
+    tokens, elapsed, first_token = 0, 0.0, []
+    for query, context in prompts:
+        start = time.perf_counter()
+        pieces = []
+        for piece in generator.stream_response(query, context, max_new_tokens):
+            if not pieces:
+                first_token.append(time.perf_counter() - start)
+            pieces.append(piece)
+        elapsed += time.perf_counter() - start
+        tokens += len(generator.tokenizer.encode("".join(pieces)))
+    return {
+        "llm/tokens_per_s": tokens / elapsed if elapsed else 0.0,
+        "llm/first_token_p50_ms": float(np.percentile(first_token, 50)) * 1000 if first_token else 0.0
+    }
+
+
+def run(args) -> Dict:
+    from vector_store import VectorStore
+    ks = [int(k) for k in args.ks.split(",")]
+    metrics: Dict[str, float] = {}
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+    try:
+        store_model = VectorStore(args.embedding_model, cache_dir=None)
+        for size in (int(s) for s in args.sizes.split(",")):
+            prefix = f"corpus={size}"
+            paths = synthetic_corpus(os.path.join(workdir, str(size)), size, args.words_per_doc, seed=size)
+            chunks, ingest = bench_ingest(paths, prefix)
+            metrics.update(ingest)
+
+            vectors, embed = bench_embedding(store_model, chunks, prefix)
+            metrics.update(embed)
+            metrics.update(bench_index_build(vectors, args.index_types.split(","), prefix))
+
+            store = VectorStore(args.embedding_model, cache_dir=None)
+            store._embedding_model = store_model.embedding_model
+            store.add_vectors(chunks, vectors)
+            rng = random.Random(size)
+            # Queries are snippets of random chunks, like a user quoting the documents
+            queries = [" ".join(rng.choice(chunks).split()[:10]) for _ in range(args.queries)]
+            metrics.update(bench_search(store, queries, ks, prefix))
+            query_vectors = store.embedding_model.encode(queries, normalize_embeddings=True)
+            metrics.update(bench_compression(vectors, query_vectors, max(ks), prefix))
+            print(f"corpus={size}: {len(chunks)} chunks done", file=sys.stderr)
+
+        if not args.skip_llm:
+            prompts = [(" ".join(chunk.split()[:8]) + "?", [chunk]) for chunk in chunks[:args.prompts]]
+            metrics.update(bench_generator(args.llm, prompts, args.max_new_tokens))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    import faiss
+    return {
+        'meta': {
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'faiss': faiss.__version__,
+            'args': vars(args)
+        },
+        'metrics': metrics
+    }
+
+
+def compare(baseline: Dict, current: Dict, threshold: float) -> List[Dict]:
+    """Metrics present in both runs, marking those worse than baseline by more than threshold"""
+    rows = []
+    for name, old in sorted(baseline['metrics'].items()):
+        new = current['metrics'].get(name)
+        if new is None or not old:
+            continue
+        change = (new - old) / old
+        higher_is_better = name.endswith(_HIGHER_IS_BETTER)
+        # Chunk counts and other plain values are informational
+        tracked = higher_is_better or name.endswith(("_ms", "_s"))
+        regressed = tracked and (change < -threshold if higher_is_better else change > threshold)
+        rows.append({'metric': name, 'baseline': old, 'current': new, 'change': change, 'regressed': regressed})
+    return rows
+
+
+def print_comparison(rows: List[Dict]) -> int:
+    """Print a comparison table and return the number of regressions"""
+    for row in rows:
+        flag = "REGRESSION" if row['regressed'] else ""
+        print(f"{row['metric']:<48}{row['baseline']:>12.3f}{row['current']:>12.3f}{row['change']:>+9.1%}  {flag}")
+    regressions = sum(row['regressed'] for row in rows)
+    print(f"{regressions} regression(s) in {len(rows)} metrics")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmarks")
+    run_parser.add_argument("--sizes", default="1000", help="Comma-separated corpus sizes in documents")
+    run_parser.add_argument("--words-per-doc", type=int, default=400)
+    run_parser.add_argument("--ks", default="1,5,20")
+    run_parser.add_argument("--queries", type=int, default=200)
+    run_parser.add_argument("--index-types", default="flat,ivf_flat,hnsw")
+    run_parser.add_argument("--embedding-model", default="all-MiniLM-L6-v2")
+    run_parser.add_argument("--llm", default="microsoft/DialoGPT-medium")
+    run_parser.add_argument("--prompts", type=int, default=4)
+    run_parser.add_argument("--max-new-tokens", type=int, default=32)
+    run_parser.add_argument("--skip-llm", action="store_true")
+    run_parser.add_argument("--output", help="Write results to this JSON file")
+    run_parser.add_argument("--baseline", help="Compare against this results file")
+    run_parser.add_argument("--threshold", type=float, default=0.1, help="Allowed relative slowdown")
+
+    compare_parser = commands.add_parser("compare", help="Compare two results files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="Allowed relative slowdown")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        with open(args.current, 'r', encoding='utf-8') as f:
+            current = json.load(f)
+        sys.exit(1 if print_comparison(compare(baseline, current, args.threshold)) else 0)
+
+    results = run(args)
+    print(json.dumps(results['metrics'], indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        sys.exit(1 if print_comparison(compare(baseline, results, args.threshold)) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Compare load time and memory of full-read and memory-mapped index loading.
+
+Each mode runs in a fresh process so RSS is not shared between them.
+
+    python benchmark_load.py --store vector_store/store     # VectorStore prefix
+    python benchmark_load.py --chatbot vector_store         # RAGChatbot directory
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+from startup_timing import rss_bytes
+
+
+def measure(kind: str, path: str, mmap: bool, query: str = None) -> dict:
+    """Load once in this process and report timings and RSS"""
+    if kind == "store":
+        from vector_store import VectorStore
+        store = VectorStore()
+        baseline = rss_bytes()
+        start = time.perf_counter()
+        store.load(path, mmap=mmap)
+        load_seconds = time.perf_counter() - start
+        search = (lambda q: store.search(q, 5)) if query else None
+    else:
+        from rag_chatbot import RAGChatbot
+        chatbot = RAGChatbot(use_simple_llm=True)
+        chatbot.embeddings  # model load is not part of the index load
+        baseline = rss_bytes()
+        start = time.perf_counter()
+        if not chatbot.load_vector_store(path, mmap=mmap):
+            raise SystemExit(f"Could not load {path}")
+        load_seconds = time.perf_counter() - start
+        search = (lambda q: chatbot.get_relevant_contexts(q)) if query else None
+
+    result = {
+        'mode': 'mmap' if mmap else 'read',
+        'load_ms': load_seconds * 1000,
+        'rss_mb': rss_bytes() / 1e6,
+        'load_rss_delta_mb': (rss_bytes() - baseline) / 1e6
+    }
+    if search:
+        start = time.perf_counter()
+        search(query)
+        result['first_query_ms'] = (time.perf_counter() - start) * 1000
+        result['rss_after_query_mb'] = rss_bytes() / 1e6
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--store", help="Prefix of a saved VectorStore")
+    target.add_argument("--chatbot", help="Directory saved by RAGChatbot.save_vector_store")
+    parser.add_argument("--query", help="Also time one search after loading")
+    parser.add_argument("--child", choices=["read", "mmap"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    kind, path = ("store", args.store) if args.store else ("chatbot", args.chatbot)
+
+    if args.child:
+        print(json.dumps(measure(kind, path, args.child == "mmap", args.query)))
+        return
+
+    results = []
+    for mode in ("read", "mmap"):
+        command = [sys.executable, __file__, f"--{kind}", path, "--child", mode]
+        if args.query:
+            command += ["--query", args.query]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    for result in results:
+        line = f"{result['mode']:<5} load {result['load_ms']:>9.1f} ms  RSS {result['rss_mb']:>8.1f} MB  (+{result['load_rss_delta_mb']:.1f} MB)"
+        if 'first_query_ms' in result:
+            line += f"  first query {result['first_query_ms']:.1f} ms, RSS {result['rss_after_query_mb']:.1f} MB"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Compare fp32 and int8 dynamic-quantized models on CPU.
+
+Reports latency, serialized model size and quality for the embedding model
+(agreement of embeddings and top-k retrieval with fp32) and the generator
+(throughput and next-token agreement with fp32 on the same text).
+
+    python benchmark_quantization.py --docs documents
+"""
+import argparse
+import glob
+import json
+import os
+import time
+from typing import List
+
+import numpy as np
+
+from document_processor import DocumentProcessor
+from llm_generator import LLMGenerator
+from quantization import load_quantized, model_size_bytes
+
+
+def load_chunks(docs_folder: str, limit: int) -> List[str]:
+    """Chunk the documents in a folder"""
+    processor = DocumentProcessor()
+    chunks = []
+    for path in sorted(glob.glob(os.path.join(docs_folder, "*"))):
+        if path.endswith(('.pdf', '.txt')):
+            chunks.extend(processor.iter_chunks(path))
+    return chunks[:limit]
+
+
+def benchmark_embeddings(model_name: str, chunks: List[str], k: int) -> dict:
+    from sentence_transformers import SentenceTransformer
+
+    fp32 = SentenceTransformer(model_name, device="cpu")
+    int8 = load_quantized(model_name, lambda: SentenceTransformer(model_name, device="cpu"))
+    # Use the opening words of each chunk as a query
+    queries = [" ".join(chunk.split()[:12]) for chunk in chunks]
+
+    results, vectors = {}, {}
+    for label, model in (("fp32", fp32), ("int8", int8)):
+        start = time.perf_counter()
+        doc_vectors = model.encode(chunks, normalize_embeddings=True)
+        elapsed = time.perf_counter() - start
+        query_vectors = model.encode(queries, normalize_embeddings=True)
+        vectors[label] = (doc_vectors, query_vectors)
+        results[label] = {
+            "chunks_per_s": len(chunks) / elapsed,
+            "size_mb": model_size_bytes(model) / 1e6
+        }
+
+    fp32_docs, fp32_queries = vectors["fp32"]
+    int8_docs, int8_queries = vectors["int8"]
+    top_fp32 = np.argsort(-fp32_queries @ fp32_docs.T, axis=1)[:, :k]
+    top_int8 = np.argsort(-int8_queries @ int8_docs.T, axis=1)[:, :k]
+    results["quality"] = {
+        "mean_cosine_to_fp32": float(np.mean(np.sum(fp32_docs * int8_docs, axis=1))),
+        f"top{k}_overlap": float(np.mean([len(set(a) & set(b)) / k for a, b in zip(top_fp32, top_int8)]))
+    }
+    return results
+
+
+def benchmark_generator(model_name: str, chunks: List[str], max_new_tokens: int, prompts: int) -> dict:
+    import torch
+
+    generators = {"fp32": LLMGenerator(model_name), "int8": LLMGenerator(model_name, quantize=True)}
+    results, predictions = {}, {}
+    for label, generator in generators.items():
+        generator.warm_up()
+        tokens, elapsed = 0, 0.0
+        for chunk in chunks[:prompts]:
+            start = time.perf_counter()
+            answer = generator.generate_response("What is this about?", [chunk], max_new_tokens)
+            elapsed += time.perf_counter() - start
+            tokens += max(len(generator.tokenizer.encode(answer)), 1)
+
+        # Teacher-forced next-token predictions for quality comparison
+        with torch.no_grad():
+            predictions[label] = [
+                generator.model(input_ids=torch.tensor([generator.tokenizer.encode(chunk)[:128]])).logits[0].argmax(-1)
+                for chunk in chunks[:prompts]
+            ]
+        results[label] = {
+            "tokens_per_s": tokens / elapsed if elapsed else 0.0,
+            "size_mb": model_size_bytes(generator.model) / 1e6
+        }
+
+    agree = [(a == b).float().mean().item() for a, b in zip(predictions["fp32"], predictions["int8"])]
+    results["quality"] = {"next_token_agreement": float(np.mean(agree)) if agree else 0.0}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", default="documents")
+    parser.add_argument("--embedding-model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--llm", default="microsoft/DialoGPT-medium")
+    parser.add_argument("--chunks", type=int, default=256, help="Max chunks to embed")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--prompts", type=int, default=4, help="Generation prompts per model")
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--skip-llm", action="store_true")
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    chunks = load_chunks(args.docs, args.chunks)
+    if not chunks:
+        parser.error(f"No .txt or .pdf chunks found in {args.docs}")
+
+    report = {"embedding": benchmark_embeddings(args.embedding_model, chunks, args.k)}
+    if not args.skip_llm:
+        report["generator"] = benchmark_generator(args.llm, chunks, args.max_new_tokens, args.prompts)
+
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import json
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Hashable, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens; identifiers such as snake_case names stay whole"""
+    return _TOKEN.findall(text.lower())
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Hashable]], k: int = 60) -> List[Tuple[Hashable, float]]:
+    """Fuse ranked lists by summing 1 / (k + rank); best first"""
+    scores: Dict[Hashable, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            scores[key] += 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+
+class BM25Index:
+    """Okapi BM25 keyword index over chunk texts.
+
+    Postings for every term live in two flat arrays, document ids (uint32,
+    ascending within a term) and term frequencies (uint16), sliced by a
+    per-term offsets array. Documents added since the last compaction sit
+    in a small pending dict and are folded in on the next search or save.
+    Document ids are insertion positions, matching VectorStore ids.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.vocabulary: Dict[str, int] = {}
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._doc_ids = np.empty(0, dtype=np.uint32)
+        self._tfs = np.empty(0, dtype=np.uint16)
+        self._doc_lengths = np.empty(0, dtype=np.uint32)
+        self._length_norm = np.empty(0, dtype=np.float32)
+        self._pending = defaultdict(list)  # term id -> [(doc id, tf)]
+        self._pending_lengths: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self._doc_lengths) + len(self._pending_lengths)
+
+    def add(self, texts: Iterable[str]):
+        """Index texts as the next document ids"""
+        for text in texts:
+            doc_id = len(self)
+            counts = Counter(tokenize(text))
+            for term, tf in counts.items():
+                term_id = self.vocabulary.setdefault(term, len(self.vocabulary))
+                self._pending[term_id].append((doc_id, min(tf, 65535)))
+            self._pending_lengths.append(sum(counts.values()))
+
+    def compact(self):
+        """Merge pending postings into the flat arrays; searches are read-only afterwards"""
+        if not self._pending_lengths:
+            return
+        old_counts = np.diff(self._offsets)
+        counts = np.zeros(len(self.vocabulary), dtype=np.int64)
+        counts[:len(old_counts)] = old_counts
+        for term_id, postings in self._pending.items():
+            counts[term_id] += len(postings)
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        doc_ids = np.empty(offsets[-1], dtype=np.uint32)
+        tfs = np.empty(offsets[-1], dtype=np.uint16)
+        if len(self._doc_ids):
+            # Existing postings keep their order at the front of each term's slice
+            terms = np.repeat(np.arange(len(old_counts)), old_counts)
+            dest = offsets[terms] + np.arange(len(self._doc_ids)) - self._offsets[terms]
+            doc_ids[dest] = self._doc_ids
+            tfs[dest] = self._tfs
+        for term_id, postings in self._pending.items():
+            start = offsets[term_id] + (old_counts[term_id] if term_id < len(old_counts) else 0)
+            postings = np.asarray(postings, dtype=np.int64)
+            doc_ids[start:start + len(postings)] = postings[:, 0]
+            tfs[start:start + len(postings)] = postings[:, 1]
+
+        self._offsets, self._doc_ids, self._tfs = offsets, doc_ids, tfs
+        self._doc_lengths = np.concatenate([self._doc_lengths, np.asarray(self._pending_lengths, dtype=np.uint32)])
+        self._pending.clear()
+        self._pending_lengths = []
+        self._update_length_norm()
+
+    def _update_length_norm(self):
+        average = float(self._doc_lengths.mean()) if len(self._doc_lengths) else 0.0
+        self._length_norm = (self.k1 * (1 - self.b + self.b * self._doc_lengths / (average or 1.0))).astype(np.float32)
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[int, float]]:
+        """Top-k (document id, BM25 score) pairs; documents sharing no term with the query are skipped"""
+        self.compact()
+        n = len(self._doc_lengths)
+        term_ids = {self.vocabulary[term] for term in tokenize(query) if term in self.vocabulary}
+        if not n or not term_ids or k <= 0:
+            return []
+
+        scores = np.zeros(n, dtype=np.float32)
+        matched = []
+        for term_id in term_ids:
+            start, end = self._offsets[term_id], self._offsets[term_id + 1]
+            ids = self._doc_ids[start:end]
+            tf = self._tfs[start:end].astype(np.float32)
+            idf = math.log(1 + (n - (end - start) + 0.5) / ((end - start) + 0.5))
+            # Ids are unique within one term's postings, so fancy-index += is safe
+            scores[ids] += idf * tf * (self.k1 + 1) / (tf + self._length_norm[ids])
+            matched.append(ids)
+
+        candidates = np.unique(np.concatenate(matched))
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        top = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(int(doc_id), float(scores[doc_id])) for doc_id in top]
+
+    @staticmethod
+    def exists(prefix: str) -> bool:
+        return os.path.exists(f"{prefix}.bm25.npz") and os.path.exists(f"{prefix}.bm25.json")
+
+    def save(self, prefix: str):
+        """Write {prefix}.bm25.npz (postings) and {prefix}.bm25.json (terms and parameters)"""
+        self.compact()
+        with open(f"{prefix}.bm25.npz.tmp", 'wb') as f:
+            np.savez(f, offsets=self._offsets, doc_ids=self._doc_ids, tfs=self._tfs, doc_lengths=self._doc_lengths)
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        with open(f"{prefix}.bm25.json.tmp", 'w', encoding='utf-8') as f:
+            json.dump({'k1': self.k1, 'b': self.b, 'terms': terms}, f)
+        os.replace(f"{prefix}.bm25.npz.tmp", f"{prefix}.bm25.npz")
+        os.replace(f"{prefix}.bm25.json.tmp", f"{prefix}.bm25.json")
+
+    @classmethod
+    def load(cls, prefix: str) -> "BM25Index":
+        with open(f"{prefix}.bm25.json", 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        index = cls(data['k1'], data['b'])
+        index.vocabulary = {term: i for i, term in enumerate(data['terms'])}
+        with np.load(f"{prefix}.bm25.npz") as arrays:
+            index._offsets = arrays['offsets']
+            index._doc_ids = arrays['doc_ids']
+            index._tfs = arrays['tfs']
+            index._doc_lengths = arrays['doc_lengths']
+        index._update_length_norm()
+        return index
@@ -0,0 +1,328 @@
+"""Build a VectorStore from large document trees without the UI.
+
+Files are extracted and chunked on a process pool, embedded in large
+batches and flushed to disk as flat segment stores every --segment-chunks
+chunks. {work-dir}/state.json lists the files each flushed segment holds,
+so an interrupted run picks up after the last segment when started again
+with the same arguments. Once every file is in a segment, the segments are
+merged into one store of the requested index type at --output.
+
+    python bulk_ingest.py /data/docs --output vector_store/store
+    python bulk_ingest.py /data/docs /data/more --output vector_store/store --index-type ivf_flat --nlist 4096
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from document_processor import DocumentProcessor
+from index_factory import INDEX_TYPES, build_index, train_index
+from vector_store import VectorStore
+
+EXTENSIONS = ('.txt', '.pdf')
+
+# Model batch sizes tried by --batch-size auto
+BATCH_CANDIDATES = (16, 32, 64, 128, 256)
+
+
+def find_documents(roots: Iterable[str]) -> List[str]:
+    """Every .txt and .pdf file under the roots, in a stable order"""
+    paths = []
+    for root in roots:
+        if os.path.isfile(root):
+            paths.append(os.path.abspath(root))
+            continue
+        for directory, subdirs, files in os.walk(root):
+            subdirs.sort()
+            paths.extend(os.path.abspath(os.path.join(directory, name))
+                         for name in sorted(files) if name.lower().endswith(EXTENSIONS))
+    return paths
+
+
+def _file_stamp(path: str) -> List[int]:
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def tune_batch_size(encode, texts: Sequence[str], candidates: Sequence[int] = BATCH_CANDIDATES) -> int:
+    """Model batch size with the highest throughput on a sample of texts"""
+    sample = list(texts[:2 * max(candidates)])
+    encode(sample[:min(candidates)], min(candidates))  # warm-up
+    best, best_rate = candidates[0], 0.0
+    for batch_size in candidates:
+        start = time.perf_counter()
+        encode(sample, batch_size)
+        rate = len(sample) / (time.perf_counter() - start)
+        if rate > best_rate:
+            best, best_rate = batch_size, rate
+    return best
+
+
+class Progress:
+    """Running counts, printed as rates with an ETA based on bytes read"""
+
+    def __init__(self, total_docs: int, total_bytes: int, interval: float = 5.0):
+        self.total_docs = total_docs
+        self.total_bytes = total_bytes
+        self.interval = interval
+        self.start = time.perf_counter()
+        self._last = self.start
+        self.docs = 0
+        self.errors = 0
+        self.bytes = 0
+        self.chunks = 0
+        self.embeddings = 0
+
+    def line(self) -> str:
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        line = (f"[{elapsed:8.1f}s] {self.docs}/{self.total_docs} docs"
+                f"  {self.docs / elapsed:.1f} docs/s  {self.chunks / elapsed:.1f} chunks/s"
+                f"  {self.embeddings / elapsed:.1f} embeddings/s")
+        if self.bytes:
+            remaining = (self.total_bytes - self.bytes) / (self.bytes / elapsed)
+            line += f"  ETA {int(remaining // 60)}m{int(remaining % 60):02d}s"
+        return line + (f"  ({self.errors} failed)" if self.errors else "")
+
+    def report(self, force: bool = False):
+        now = time.perf_counter()
+        if force or now - self._last >= self.interval:
+            self._last = now
+            print(self.line(), flush=True)
+
+
+class BulkIngest:
+    """Segmented, resumable ingestion into a saved VectorStore.
+
+    Segments are flushed only at file boundaries and state.json is
+    replaced only after a segment is fully written, so a crash loses at
+    most the files since the last flush. Chunking and model settings are
+    recorded in the state; resuming with different ones is refused,
+    while the final index type may change between runs.
+    """
+
+    def __init__(self, work_dir: str, model_name: str = "all-MiniLM-L6-v2", cache_dir: str = None,
+                 chunk_size: int = 1000, chunk_overlap: int = 200, batch_size: Optional[int] = None,
+                 encode_chunks: int = 2048, segment_chunks: int = 20000, max_workers: int = None,
+                 quantize: bool = False, restart: bool = False):
+        self.work_dir = work_dir
+        self.processor = DocumentProcessor(chunk_size, chunk_overlap)
+        # Only the encoder goes through the embedding cache; segments store what it returns
+        self.encoder = VectorStore(model_name, cache_dir=cache_dir, quantize=quantize)
+        self.encode_chunks = encode_chunks
+        self.segment_chunks = segment_chunks
+        self.max_workers = max_workers
+        self.settings = {'model_name': model_name, 'quantize': quantize,
+                         'chunk_size': chunk_size, 'chunk_overlap': chunk_overlap}
+        if restart and os.path.exists(work_dir):
+            shutil.rmtree(work_dir)
+        os.makedirs(work_dir, exist_ok=True)
+        self.state = self._load_state()
+        # None tunes on the first batch; a resumed run reuses the tuned size
+        self.batch_size = batch_size or self.state.get('batch_size')
+
+    @property
+    def _state_path(self) -> str:
+        return os.path.join(self.work_dir, "state.json")
+
+    def _load_state(self) -> Dict:
+        if not os.path.exists(self._state_path):
+            return {'settings': self.settings, 'segments': [], 'files': {}}
+        with open(self._state_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if state['settings'] != self.settings:
+            raise ValueError(f"{self.work_dir} was started with {state['settings']}; "
+                             "pass the same settings to resume or --restart to start over")
+        return state
+
+    def _save_state(self):
+        with open(f"{self._state_path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        os.replace(f"{self._state_path}.tmp", self._state_path)
+
+    @property
+    def segment_paths(self) -> List[str]:
+        return [os.path.join(self.work_dir, name) for name in self.state['segments']]
+
+    def _new_segment(self) -> VectorStore:
+        segment = VectorStore(self.settings['model_name'], cache_dir=None)
+        segment._embedding_model = self.encoder.embedding_model
+        return segment
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        if self.batch_size is None:
+            self.batch_size = tune_batch_size(
+                lambda sample, size: self.encoder.embedding_model.encode(sample, batch_size=size,
+                                                                         normalize_embeddings=True), texts)
+            self.state['batch_size'] = self.batch_size
+            print(f"Model batch size: {self.batch_size}", flush=True)
+        return self.encoder._encode_documents(texts, self.batch_size)
+
+    def pending_files(self, paths: Sequence[str]) -> List[str]:
+        """Files not yet in a segment; files changed since they were ingested are reported and skipped"""
+        pending = []
+        for path in paths:
+            stamp = self.state['files'].get(path)
+            if stamp is None:
+                pending.append(path)
+            elif stamp != _file_stamp(path):
+                print(f"Changed since it was ingested, keeping the old chunks: {path} "
+                      "(use --restart to rebuild)", file=sys.stderr)
+        return pending
+
+    def run(self, paths: Sequence[str], progress_interval: float = 5.0) -> Progress:
+        """Ingest the files not yet checkpointed, flushing a segment every segment_chunks chunks"""
+        pending = self.pending_files(paths)
+        if len(pending) < len(paths):
+            print(f"Resuming: {len(paths) - len(pending)} files already in "
+                  f"{len(self.state['segments'])} segments", flush=True)
+        progress = Progress(len(pending), sum(os.path.getsize(path) for path in pending), progress_interval)
+        segment = self._new_segment()
+        segment_files = {}
+        texts: List[str] = []
+        metadatas: List[Dict] = []
+
+        def embed_buffered():
+            if texts:
+                segment.add_vectors(texts, self._encode(texts), metadatas)
+                progress.embeddings += len(texts)
+                texts.clear()
+                metadatas.clear()
+
+        for path, chunks, error in self.processor.process_documents(pending, self.max_workers, with_metadata=True):
+            progress.docs += 1
+            progress.bytes += os.path.getsize(path)
+            if error is not None:
+                # Not recorded, so the file is retried on the next run
+                progress.errors += 1
+                print(f"Skipping {path}: {error}", file=sys.stderr)
+                progress.report()
+                continue
+            for chunk, metadata in chunks:
+                texts.append(chunk)
+                metadatas.append(metadata)
+                if len(texts) >= self.encode_chunks:
+                    embed_buffered()
+            progress.chunks += len(chunks)
+            segment_files[path] = _file_stamp(path)
+            if len(segment.documents) + len(texts) >= self.segment_chunks:
+                embed_buffered()
+                self._flush(segment, segment_files)
+                segment, segment_files = self._new_segment(), {}
+            progress.report()
+
+        embed_buffered()
+        if segment_files:
+            self._flush(segment, segment_files)
+        progress.report(force=True)
+        return progress
+
+    def _flush(self, segment: VectorStore, files: Dict[str, List[int]]):
+        """Write a segment and record its files as done"""
+        name = f"segment_{len(self.state['segments']):05d}"
+        if len(segment.documents):
+            segment.save(os.path.join(self.work_dir, name))
+            self.state['segments'].append(name)
+        self.state['files'].update(files)
+        self._save_state()
+
+    def merge(self, output: str, index_type: str = "flat", index_params: Dict = None,
+              rescore_factor: int = 0) -> VectorStore:
+        """Combine the segments into one store saved at output"""
+        store = VectorStore(self.settings['model_name'], cache_dir=None, index_type=index_type,
+                            index_params=index_params, quantize=self.settings['quantize'],
+                            rescore_factor=rescore_factor)
+        segments = []
+        for path in self.segment_paths:
+            segment = VectorStore(self.settings['model_name'], cache_dir=None)
+            segment.load(path, mmap=True)
+            segments.append(segment)
+        if not segments:
+            raise ValueError("No chunks were ingested")
+        store.index = build_index(index_type, segments[0].index.d, store.index_params)
+
+        if not store.index.is_trained:
+            # Train on a sample spread over all segments rather than on the first one
+            total = sum(segment.index.ntotal for segment in segments)
+            fraction = min(1.0, store.index_params["train_size"] / total)
+            rng = np.random.default_rng(0)
+            sample = []
+            for segment in segments:
+                vectors = segment.get_vectors()
+                take = max(1, int(round(len(vectors) * fraction)))
+                sample.append(vectors[np.sort(rng.choice(len(vectors), take, replace=False))])
+            train_index(store.index, np.concatenate(sample), store.index_params["train_size"],
+                        store.index_params["sq_min_train"])
+
+        for segment in segments:
+            store.add_vectors(list(segment.documents), segment.get_vectors(),
+                              [segment.metadata.get(i) for i in range(len(segment.documents))])
+        directory = os.path.dirname(output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        store.save(output)
+        return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("roots", nargs="+", help="Directories (searched recursively) or files to ingest")
+    parser.add_argument("--output", required=True, help="Prefix of the VectorStore to write")
+    parser.add_argument("--work-dir", help="Segment and checkpoint directory (default: {output}.segments)")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--quantize", action="store_true", help="Embed with the int8 model")
+    parser.add_argument("--cache-dir", help="Also go through the embedding cache in this directory")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--batch-size", default="auto",
+                        help="Model batch size, or 'auto' to pick the fastest on the first chunks")
+    parser.add_argument("--encode-chunks", type=int, default=2048, help="Chunks per encode call")
+    parser.add_argument("--segment-chunks", type=int, default=20000, help="Chunks per checkpointed segment")
+    parser.add_argument("--workers", type=int, help="Extraction processes (default: CPU count)")
+    parser.add_argument("--index-type", default="flat", choices=INDEX_TYPES)
+    parser.add_argument("--nlist", type=int, help="IVF lists")
+    parser.add_argument("--rescore-factor", type=int, default=0)
+    parser.add_argument("--progress-interval", type=float, default=5.0, help="Seconds between progress lines")
+    parser.add_argument("--restart", action="store_true", help="Discard existing segments and start over")
+    parser.add_argument("--keep-segments", action="store_true", help="Keep the work directory after merging")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or f"{args.output}.segments"
+    try:
+        ingest = BulkIngest(work_dir, args.model, args.cache_dir, args.chunk_size, args.chunk_overlap,
+                            None if args.batch_size == "auto" else int(args.batch_size),
+                            args.encode_chunks, args.segment_chunks, args.workers, args.quantize, args.restart)
+    except ValueError as e:
+        raise SystemExit(str(e))
+
+    paths = find_documents(args.roots)
+    print(f"Found {len(paths)} documents", flush=True)
+    try:
+        progress = ingest.run(paths, args.progress_interval)
+    except KeyboardInterrupt:
+        print(f"\nInterrupted; {len(ingest.state['files'])} files are checkpointed in {work_dir}. "
+              "Run the same command again to resume.", file=sys.stderr)
+        sys.exit(130)
+
+    start = time.perf_counter()
+    index_params = {"nlist": args.nlist} if args.nlist else None
+    try:
+        store = ingest.merge(args.output, args.index_type, index_params, args.rescore_factor)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    print(f"Merged {len(ingest.state['segments'])} segments into {args.output}: {len(store.documents)} chunks "
+          f"({args.index_type}) in {time.perf_counter() - start:.1f}s", flush=True)
+    if progress.errors:
+        # Keep the checkpoints so a rerun only retries the failed files
+        print(f"{progress.errors} files failed and were left out; segments are kept in {work_dir}, "
+              "run again to retry them", file=sys.stderr)
+    elif not args.keep_segments:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import os
+from typing import Iterable, Iterator, List, Union
+
+import numpy as np
+
+
+class ChunkList:
+    """Append-only list of chunk texts backed by an offsets file and a UTF-8 blob.
+
+    ``{prefix}.chunks`` holds the concatenated UTF-8 texts and
+    ``{prefix}.offsets.npy`` the n + 1 byte offsets into it. Opened stores
+    are memory-mapped, so a text is only decoded when it is accessed.
+    """
+
+    def __init__(self, texts: Iterable[str] = None):
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._blob = b""
+        self._tail = list(texts or [])
+
+    @staticmethod
+    def exists(prefix: str) -> bool:
+        return os.path.exists(f"{prefix}.chunks") and os.path.exists(f"{prefix}.offsets.npy")
+
+    @classmethod
+    def open(cls, prefix: str, mmap: bool = True) -> "ChunkList":
+        """Open a saved chunk store, lazily by default"""
+        chunks = cls()
+        chunks._offsets = np.load(f"{prefix}.offsets.npy", mmap_mode='r' if mmap else None)
+        if mmap and os.path.getsize(f"{prefix}.chunks") > 0:
+            chunks._blob = np.memmap(f"{prefix}.chunks", dtype=np.uint8, mode='r')
+        else:
+            with open(f"{prefix}.chunks", 'rb') as f:
+                chunks._blob = f.read()
+        return chunks
+
+    @property
+    def _base_len(self) -> int:
+        return len(self._offsets) - 1
+
+    def __len__(self) -> int:
+        return self._base_len + len(self._tail)
+
+    def _get(self, i: int) -> str:
+        if i < self._base_len:
+            start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+            return bytes(self._blob[start:end]).decode('utf-8')
+        return self._tail[i - self._base_len]
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(i, slice):
+            return [self._get(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("chunk index out of range")
+        return self._get(i)
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self._get(i)
+
+    def append(self, text: str):
+        self._tail.append(text)
+
+    def extend(self, texts: Iterable[str]):
+        self._tail.extend(texts)
+
+    def save(self, prefix: str):
+        """Write the store to disk and remap it from the new files"""
+        offsets = np.empty(len(self) + 1, dtype=np.int64)
+        offsets[0] = 0
+        with open(f"{prefix}.chunks.tmp", 'wb') as f:
+            # Already-encoded texts are copied as raw bytes
+            base_bytes = int(self._offsets[-1])
+            for start in range(0, base_bytes, 1 << 24):
+                f.write(bytes(self._blob[start:min(start + (1 << 24), base_bytes)]))
+            offsets[:self._base_len + 1] = self._offsets
+            position = base_bytes
+            for j, text in enumerate(self._tail, start=self._base_len + 1):
+                data = text.encode('utf-8')
+                f.write(data)
+                position += len(data)
+                offsets[j] = position
+        with open(f"{prefix}.offsets.npy.tmp", 'wb') as f:
+            np.save(f, offsets)
+
+        # Release the old mapping before replacing the files it points to
+        self._blob = b""
+        self._offsets = np.zeros(1, dtype=np.int64)
+        os.replace(f"{prefix}.chunks.tmp", f"{prefix}.chunks")
+        os.replace(f"{prefix}.offsets.npy.tmp", f"{prefix}.offsets.npy")
+        saved = ChunkList.open(prefix)
+        self._offsets, self._blob, self._tail = saved._offsets, saved._blob, []
@@ -0,0 +1,121 @@
+import threading
+from collections import OrderedDict
+from typing import List, Sequence, Tuple
+
+
+def _overlap(a: str, b: str, min_overlap: int, max_overlap: int) -> int:
+    """Length of the longest suffix of a that is a prefix of b (0 if shorter than min_overlap)"""
+    probe = b[:min_overlap]
+    if len(probe) < min_overlap:
+        return 0
+    index = a.find(probe, max(len(a) - max_overlap, 0))
+    while index != -1:
+        # The first match leaves the longest suffix
+        if b.startswith(a[index:]):
+            return len(a) - index
+        index = a.find(probe, index + 1)
+    return 0
+
+
+def merge_overlapping(texts: Sequence[str], min_overlap: int = 50, max_overlap: int = 1000) -> List[str]:
+    """Drop repeated and contained chunks and join chunks that continue each other.
+
+    Consecutive DocumentProcessor chunks share chunk_overlap characters;
+    when two retrieved chunks do, they become one segment holding the
+    shared text once. Segments keep the rank of their best-ranked chunk.
+    """
+    segments: List[str] = []
+    for text in texts:
+        if any(text in segment for segment in segments):
+            continue
+        # Absorb every segment the new text contains or overlaps, at the earliest rank
+        position = len(segments)
+        merged = text
+        changed = True
+        while changed:
+            changed = False
+            for i, segment in enumerate(segments):
+                if segment not in merged:
+                    before = _overlap(segment, merged, min_overlap, max_overlap)
+                    after = 0 if before else _overlap(merged, segment, min_overlap, max_overlap)
+                    if before:
+                        merged = segment + merged[before:]
+                    elif after:
+                        merged = merged + segment[after:]
+                    else:
+                        continue
+                del segments[i]
+                position = min(position, i)
+                changed = True
+                break
+        segments.insert(position, merged)
+    return segments
+
+
+class ContextPacker:
+    """Packs ranked context chunks into an exact token budget.
+
+    Token ids are computed once per chunk and kept in an LRU cache, so
+    chunks that come back for later questions are not re-tokenized. The
+    packed ids are fed to the model as-is, so the budget is exact.
+    """
+
+    def __init__(self, tokenizer, separator: str = "\n", cache_size: int = 4096,
+                 min_partial_tokens: int = 32, min_overlap: int = 50):
+        self.tokenizer = tokenizer
+        self.separator_ids = list(tokenizer.encode(separator))
+        self.cache_size = cache_size
+        # A chunk that does not fit is cut to the remaining budget only if at least this many tokens remain
+        self.min_partial_tokens = min_partial_tokens
+        self.min_overlap = min_overlap
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+
+    def token_ids(self, text: str) -> Tuple[int, ...]:
+        """Token ids of one chunk, from the cache when possible"""
+        with self._lock:
+            ids = self._cache.get(text)
+            if ids is not None:
+                self._cache.move_to_end(text)
+                self.hits += 1
+                return ids
+        ids = tuple(self.tokenizer.encode(text))
+        with self._lock:
+            self.misses += 1
+            self._cache[text] = ids
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return ids
+
+    def pack(self, contexts: Sequence[str], budget: int) -> List[int]:
+        """Separator-joined token ids of the best contexts that fit in budget tokens.
+
+        contexts are in rank order. Chunks are taken greedily by rank,
+        skipping any that do not fit; leftover room is filled with the head
+        of the best skipped chunk.
+        """
+        packed: List[int] = []
+        partial = None
+        for segment in merge_overlapping(contexts, self.min_overlap):
+            ids = self.token_ids(segment)
+            cost = len(ids) + (len(self.separator_ids) if packed else 0)
+            if len(packed) + cost <= budget:
+                if packed:
+                    packed.extend(self.separator_ids)
+                packed.extend(ids)
+            elif partial is None:
+                partial = ids
+        if partial is not None:
+            room = budget - len(packed) - (len(self.separator_ids) if packed else 0)
+            if room >= self.min_partial_tokens:
+                if packed:
+                    packed.extend(self.separator_ids)
+                packed.extend(partial[:room])
+        return packed
+
+    def pack_text(self, contexts: Sequence[str], budget: int) -> str:
+        """pack() decoded back to text, for prompts that are tokenized again downstream"""
+        return self.tokenizer.decode(self.pack(contexts, budget))
@@ -0,0 +1,121 @@
+import re
+from typing import Dict, Hashable, List, Optional
+
+import numpy as np
+
+_EMPTY = np.uint32(0xFFFFFFFF)
+_PRIME = np.uint64(1099511628211)
+
+
+def _mix(x: np.ndarray) -> np.ndarray:
+    """64-bit finalizer (MurmurHash3 fmix64) applied elementwise"""
+    x = x ^ (x >> np.uint64(33))
+    x = x * np.uint64(0xFF51AFD7ED558CCD)
+    x = x ^ (x >> np.uint64(33))
+    x = x * np.uint64(0xC4CEB9FE1A85EC53)
+    return x ^ (x >> np.uint64(33))
+
+
+class NearDuplicateIndex:
+    """MinHash signatures with LSH banding for near-duplicate chunk lookup.
+
+    Texts are lowercased, whitespace-normalized and shingled into
+    overlapping byte n-grams. Signatures use one-permutation hashing: each
+    shingle is hashed once into one of num_perm bins and each bin keeps its
+    minimum, with empty bins filled from the next non-empty one (rotation
+    densification). That costs one hash per shingle rather than num_perm.
+    Bands are sized so that pairs at the threshold become candidates with
+    ~99% probability; candidates are then verified against the full
+    signature, whose agreement estimates the Jaccard similarity of the
+    shingle sets. Texts with fewer shingles than bins use classic MinHash
+    with one hash per permutation instead.
+    """
+
+    def __init__(self, threshold: float = 0.9, num_perm: int = 128, shingle_size: int = 5, seed: int = 0):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self._seeds = _mix(np.arange(seed + 1, seed + 1 + num_perm, dtype=np.uint64))
+        self._rows = self._band_rows(threshold, num_perm)
+        self._bands = num_perm // self._rows
+        self._buckets: List[Dict[bytes, List[Hashable]]] = [{} for _ in range(self._bands)]
+        self.signatures: Dict[Hashable, np.ndarray] = {}
+
+    @staticmethod
+    def _band_rows(threshold: float, num_perm: int) -> int:
+        """Most rows per band that still make threshold-similar pairs candidates 99% of the time"""
+        best = 1
+        for rows in range(1, num_perm + 1):
+            if num_perm % rows:
+                continue
+            if 1 - (1 - threshold ** rows) ** (num_perm // rows) >= 0.99:
+                best = rows
+        return best
+
+    def __len__(self) -> int:
+        return len(self.signatures)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.signatures
+
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature (num_perm uint32 values) of a text"""
+        data = np.frombuffer(re.sub(r'\s+', ' ', text.lower()).strip().encode('utf-8'), dtype=np.uint8)
+        if len(data) < self.shingle_size:
+            data = np.pad(data, (0, self.shingle_size - len(data)))
+        # Polynomial hash of every shingle, wrapping in uint64
+        data = data.astype(np.uint64)
+        count = len(data) - self.shingle_size + 1
+        shingles = data[:count].copy()
+        for offset in range(1, self.shingle_size):
+            shingles = shingles * _PRIME + data[offset:offset + count]
+        shingles = np.unique(shingles)
+        if len(shingles) < self.num_perm:
+            # Too few shingles to fill the bins; densified bins would overstate
+            # similarity, and one hash per permutation is cheap at this size
+            return (_mix(shingles[None, :] ^ self._seeds[:, None]).min(axis=1) >> np.uint64(32)).astype(np.uint32)
+        hashed = _mix(shingles ^ self._seeds[0])
+        
+        # Low bits pick the bin, high bits are the value
+        signature = np.full(self.num_perm, _EMPTY, dtype=np.uint32)
+        np.minimum.at(signature, (hashed % np.uint64(self.num_perm)).astype(np.intp),
+                      (hashed >> np.uint64(32)).astype(np.uint32))
+        empty = np.flatnonzero(signature == _EMPTY)
+        if len(empty):
+            filled = np.flatnonzero(signature != _EMPTY)
+            # Next non-empty bin to the right, wrapping around, offset by the distance
+            nearest = filled[np.searchsorted(filled, empty) % len(filled)]
+            distance = (nearest - empty) % self.num_perm
+            signature[empty] = (signature[nearest].astype(np.uint64) + distance.astype(np.uint64) * _PRIME).astype(np.uint32)
+        return signature
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self._rows:(i + 1) * self._rows].tobytes() for i in range(self._bands)]
+
+    def add(self, key: Hashable, signature: np.ndarray):
+        self.signatures[key] = signature
+        for bucket, band in zip(self._buckets, self._band_keys(signature)):
+            bucket.setdefault(band, []).append(key)
+
+    def remove(self, key: Hashable):
+        signature = self.signatures.pop(key, None)
+        if signature is None:
+            return
+        for bucket, band in zip(self._buckets, self._band_keys(signature)):
+            keys = bucket.get(band)
+            if keys is not None:
+                keys.remove(key)
+                if not keys:
+                    del bucket[band]
+
+    def query(self, signature: np.ndarray) -> Optional[Hashable]:
+        """Key of the most similar indexed text at or above the threshold, or None"""
+        candidates = set()
+        for bucket, band in zip(self._buckets, self._band_keys(signature)):
+            candidates.update(bucket.get(band, ()))
+        best, best_similarity = None, self.threshold
+        for key in candidates:
+            similarity = float(np.mean(self.signatures[key] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = key, similarity
+        return best
@@ -1,21 +1,22 @@
 import PyPDF2
 import os
-from typing import List
+import bisect
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 import re
+from parallel_ingest import iter_extracted_pages
 
 class DocumentProcessor:
     def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+        if chunk_size <= 0:
+            raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+        if not 0 <= chunk_overlap < chunk_size:
+            raise ValueError(f"chunk_overlap must be at least 0 and less than chunk_size ({chunk_size}), got {chunk_overlap}")
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
     
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         """Extract text from PDF file"""
-        text = ""
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            for page in pdf_reader.pages:
-                text += page.extract_text()
-        return text
+        return "".join(self.iter_text_blocks(pdf_path))
     
     def extract_text_from_txt(self, txt_path: str) -> str:
         """Extract text from TXT file"""
@@ -41,13 +42,129 @@ class DocumentProcessor:
         
         return chunks
     
-    def process_document(self, file_path: str) -> List[str]:
-        """Process document and return chunks"""
+    def iter_text_blocks(self, file_path: str, block_size: int = 1 << 16) -> Iterator[str]:
+        """Lazily read a document as PDF pages or fixed-size text blocks"""
         if file_path.endswith('.pdf'):
-            text = self.extract_text_from_pdf(file_path)
+            with open(file_path, 'rb') as file:
+                pdf_reader = PyPDF2.PdfReader(file)
+                for page in pdf_reader.pages:
+                    yield page.extract_text()
         elif file_path.endswith('.txt'):
-            text = self.extract_text_from_txt(file_path)
+            with open(file_path, 'r', encoding='utf-8') as file:
+                for block in iter(lambda: file.read(block_size), ''):
+                    yield block
         else:
             raise ValueError("Unsupported file format. Use PDF or TXT files.")
+    
+    def iter_clean_text(self, blocks: Iterable[str]) -> Iterator[str]:
+        """Streaming equivalent of clean_text over consecutive text blocks"""
+        for _, piece in self._iter_clean_pieces(blocks):
+            yield piece
+    
+    def _iter_clean_pieces(self, blocks: Iterable[str]) -> Iterator[Tuple[int, str]]:
+        """iter_clean_text pieces tagged with the index of the block they came from"""
+        started = False
+        pending_space = False
+        for block_index, block in enumerate(blocks):
+            block = re.sub(r'\s+', ' ', block)
+            # A whitespace run may straddle blocks; hold it back until more
+            # text arrives so it collapses to one space and trailing space is stripped
+            if block.startswith(' '):
+                pending_space = True
+                block = block[1:]
+            if not block:
+                continue
+            trailing_space = block.endswith(' ')
+            if trailing_space:
+                block = block[:-1]
+            if pending_space and started:
+                yield block_index, ' '
+            yield block_index, block
+            started = True
+            pending_space = trailing_space
+    
+    def iter_chunk_text(self, blocks: Iterable[str]) -> Iterator[str]:
+        """Yield the same chunks as chunk_text from a stream of text blocks"""
+        for _, _, chunk in self._iter_positioned_chunks(blocks):
+            yield chunk
+    
+    def _iter_positioned_chunks(self, blocks: Iterable[str]) -> Iterator[Tuple[int, int, str]]:
+        """Yield (offset in cleaned text, index of the block the chunk starts in, chunk)"""
+        step = self.chunk_size - self.chunk_overlap
+        buffer = ""
+        buffer_start = 0  # offset of buffer[0] in the cleaned text
+        position = 0      # start offset of the next chunk
+        # Cleaned-text offsets where each block's text begins, and the block indexes
+        mark_offsets, mark_blocks = [], []
+        
+        def emit(start: int) -> Optional[Tuple[int, int, str]]:
+            chunk = buffer[start - buffer_start:start - buffer_start + self.chunk_size]
+            if not chunk.strip():
+                return None
+            mark = max(bisect.bisect_right(mark_offsets, start) - 1, 0)
+            return start, mark_blocks[mark], chunk.strip()
+        
+        for block_index, piece in self._iter_clean_pieces(blocks):
+            if not mark_blocks or mark_blocks[-1] != block_index:
+                mark_offsets.append(buffer_start + len(buffer))
+                mark_blocks.append(block_index)
+            buffer += piece
+            while position + self.chunk_size <= buffer_start + len(buffer):
+                chunk = emit(position)
+                if chunk:
+                    yield chunk
+                position += step
+            # Drop text no later chunk can reach
+            buffer = buffer[position - buffer_start:]
+            buffer_start = position
+            # Keep only the block marks later chunks can start in
+            first = max(bisect.bisect_right(mark_offsets, position) - 1, 0)
+            del mark_offsets[:first], mark_blocks[:first]
+        
+        while position < buffer_start + len(buffer):
+            chunk = emit(position)
+            if chunk:
+                yield chunk
+            position += step
+    
+    def iter_chunk_records(self, blocks: Iterable[str], source: str, paged: bool = False) -> Iterator[Tuple[str, Dict]]:
+        """Yield (chunk, metadata) with the source path, character offset in the
+        cleaned text and, when blocks are pages, the 1-based page the chunk starts on"""
+        modified = os.path.getmtime(source) if os.path.exists(source) else None
+        for offset, block_index, chunk in self._iter_positioned_chunks(blocks):
+            metadata = {"source": source, "offset": offset, "modified": modified}
+            if paged:
+                metadata["page"] = block_index + 1
+            yield chunk, metadata
+    
+    def iter_chunks(self, file_path: str, block_size: int = 1 << 16) -> Iterator[str]:
+        """Stream chunks from a document with memory bounded by the block size"""
+        return self.iter_chunk_text(self.iter_text_blocks(file_path, block_size))
+    
+    def iter_chunks_with_metadata(self, file_path: str, block_size: int = 1 << 16) -> Iterator[Tuple[str, Dict]]:
+        """Stream (chunk, metadata) pairs from a document"""
+        return self.iter_chunk_records(self.iter_text_blocks(file_path, block_size), file_path,
+                                       paged=file_path.endswith('.pdf'))
+    
+    def process_document(self, file_path: str) -> List[str]:
+        """Process document and return chunks"""
+        if not file_path.endswith(('.pdf', '.txt')):
+            raise ValueError("Unsupported file format. Use PDF or TXT files.")
+        
+        return list(self.iter_chunks(file_path))
+    
+    def process_documents(self, file_paths: Iterable[str], max_workers: int = None,
+                          pages_per_task: int = 20, with_metadata: bool = False) -> Iterator[Tuple[str, List, Optional[Exception]]]:
+        """Process documents on a process pool, yielding (file_path, chunks, error) in input order.
         
-        return self.chunk_text(text)
+        With with_metadata each chunk is a (chunk, metadata) pair as from
+        iter_chunks_with_metadata.
+        """
+        for file_path, pages, error in iter_extracted_pages(file_paths, max_workers, pages_per_task,
+                                                            allow_any_text=False):
+            if error is not None:
+                yield file_path, [], error
+            elif with_metadata:
+                yield file_path, list(self.iter_chunk_records(pages, file_path, paged=file_path.endswith('.pdf'))), None
+            else:
+                yield file_path, list(self.iter_chunk_text(pages)), None
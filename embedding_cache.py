@@ -0,0 +1,317 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+DEFAULT_CACHE_DIR = ".embedding_cache"
+
+
+class _FileLock:
+    """Exclusive lock on a file, held across processes sharing a cache directory"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'a+b')
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        else:
+            self._file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after ten seconds
+                    continue
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+        return False
+
+
+class EmbeddingCache:
+    """On-disk LRU cache of embeddings keyed by model name and chunk text hash.
+
+    Vectors are kept in a fixed-capacity memory-mapped ``vectors.npy`` (one
+    row per entry). ``index.json`` is a snapshot mapping each key to its
+    row, least recently used first, and ``index.log`` appends one
+    ``key row`` line per store or hit since then; it is folded into a new
+    snapshot once it grows past the capacity. When the cache is full the
+    oldest row is reused.
+
+    Every lookup and store holds an exclusive lock on ``lock`` and first
+    replays what other processes appended, so processes sharing a cache
+    directory never hand out the same row for different texts.
+    """
+
+    def __init__(self, model_name: str, cache_dir: str = DEFAULT_CACHE_DIR,
+                 max_entries: int = 100_000, dtype: str = "float32", normalized: bool = False):
+        namespace = re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name)
+        if normalized:
+            namespace += "-normalized"
+        self.model_name = model_name
+        self.directory = os.path.join(cache_dir, namespace)
+        self.max_entries = max_entries
+        self.dtype = np.dtype(dtype)
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> row, least recently used first
+        self._row_keys: Dict[int, str] = {}
+        self._free_rows = set()
+        self._vectors = None
+        # Snapshot generation and how much of its log has been replayed
+        self._generation = None
+        self._log_offset = 0
+        self._log_lines = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._file_lock = _FileLock(os.path.join(self.directory, "lock"))
+        with self._lock, self._file_lock:
+            self._open()
+
+    @property
+    def _index_path(self) -> str:
+        return os.path.join(self.directory, "index.json")
+
+    @property
+    def _log_path(self) -> str:
+        return os.path.join(self.directory, "index.log")
+
+    @property
+    def _vectors_path(self) -> str:
+        return os.path.join(self.directory, "vectors.npy")
+
+    def key(self, text: str) -> str:
+        """Cache key for a chunk of text"""
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode('utf-8')).hexdigest()
+
+    def _open(self):
+        """Open an existing cache, resizing it if the capacity changed"""
+        self._sync()
+        if self._vectors is None:
+            return
+        if self._vectors.dtype != self.dtype:
+            # Stored in a different precision; start over
+            self._create(self._vectors.shape[1])
+        elif self._vectors.shape[0] != self.max_entries:
+            # Capacity changed; keep the most recently used rows
+            entries = list(self._entries.items())[-self.max_entries:]
+            kept = np.array(self._vectors[[row for _, row in entries]]) if entries else []
+            self._create(self._vectors.shape[1])
+            for (key, _), vector in zip(entries, kept):
+                self._store(key, vector)
+            self._vectors.flush()
+            self._write_snapshot()
+
+    def _assign(self, key: str, row: int):
+        """Record key as stored in row and most recently used"""
+        old_row = self._entries.pop(key, None)
+        if old_row is not None and old_row != row:
+            del self._row_keys[old_row]
+            self._free_rows.add(old_row)
+        old_key = self._row_keys.get(row)
+        if old_key is not None and old_key != key:
+            del self._entries[old_key]
+        self._entries[key] = row
+        self._row_keys[row] = key
+        self._free_rows.discard(row)
+
+    def _reload(self, generation: int):
+        """Read the vector file and the snapshot the current log starts from"""
+        with open(self._index_path, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+        self._vectors = np.load(self._vectors_path, mmap_mode='r+')
+        self._entries, self._row_keys = OrderedDict(), {}
+        for key, row in snapshot['entries']:
+            self._assign(key, row)
+        self._free_rows = set(range(len(self._vectors))) - set(self._row_keys)
+        self._generation = generation
+
+    def _sync(self):
+        """Catch up with entries other processes wrote (file lock held)"""
+        try:
+            log = open(self._log_path, 'rb')
+        except FileNotFoundError:
+            if os.path.exists(self._index_path) and os.path.exists(self._vectors_path):
+                # Written before the log existed
+                with open(self._index_path, 'r', encoding='utf-8') as f:
+                    generation = json.load(f).get('generation', 0)
+                self._reload(generation)
+                self._write_log_header()
+            else:
+                self._reset()
+            return
+        with log:
+            generation = json.loads(log.readline())['generation']
+            if generation != self._generation:
+                self._reload(generation)
+                self._log_offset, self._log_lines = log.tell(), 0
+            log.seek(self._log_offset)
+            data = log.read()
+        # A line cut short by a crash has no newline yet and is left for later
+        complete = data[:data.rfind(b"\n") + 1]
+        self._log_offset += len(complete)
+        for line in complete.decode('utf-8').splitlines():
+            parts = line.split()
+            if len(parts) == 2 and parts[1].isdigit() and int(parts[1]) < len(self._vectors):
+                self._assign(parts[0], int(parts[1]))
+                self._log_lines += 1
+
+    def _reset(self):
+        self._vectors = None
+        self._entries, self._row_keys, self._free_rows = OrderedDict(), {}, set()
+        self._generation = None
+        self._log_offset = self._log_lines = 0
+
+    def _write_log_header(self):
+        with open(f"{self._log_path}.tmp", 'wb') as f:
+            f.write(json.dumps({'generation': self._generation}).encode('utf-8') + b"\n")
+            self._log_offset = f.tell()
+        os.replace(f"{self._log_path}.tmp", self._log_path)
+        self._log_lines = 0
+
+    def _append(self, keys: Iterable[str]):
+        """Log the current rows of keys, compacting the log once it outgrows the cache"""
+        lines = "".join(f"{key} {self._entries[key]}\n" for key in keys)
+        with open(self._log_path, 'ab') as f:
+            f.write(lines.encode('utf-8'))
+            self._log_offset = f.tell()
+        self._log_lines += lines.count("\n")
+        if self._log_lines > max(self.max_entries, 1024):
+            self._write_snapshot()
+
+    def _write_snapshot(self):
+        """Replace the snapshot with the current entries and start an empty log"""
+        self._generation = (self._generation or 0) + 1
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'model_name': self.model_name, 'generation': self._generation,
+                       'entries': list(self._entries.items())}, f)
+        os.replace(tmp_path, self._index_path)
+        self._write_log_header()
+
+    def _create(self, dimension: int):
+        """Allocate an empty vector file"""
+        # A new file rather than truncating the old one, which other processes may have mapped
+        vectors = np.lib.format.open_memmap(
+            f"{self._vectors_path}.tmp", mode='w+', dtype=self.dtype, shape=(self.max_entries, dimension)
+        )
+        os.replace(f"{self._vectors_path}.tmp", self._vectors_path)
+        self._vectors = vectors
+        self._entries, self._row_keys = OrderedDict(), {}
+        self._free_rows = set(range(self.max_entries))
+        self._write_snapshot()
+
+    def _store(self, key: str, vector: np.ndarray):
+        """Write a vector, evicting the least recently used entry if full"""
+        if key in self._entries:
+            row = self._entries[key]
+        elif self._free_rows:
+            row = self._free_rows.pop()
+        else:
+            row = next(iter(self._entries.values()))
+        self._vectors[row] = vector
+        self._assign(key, row)
+
+    def embed(self, texts: List[str], encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """Return embeddings for texts, calling encode_fn only on cache misses"""
+        if not texts:
+            return np.asarray(encode_fn(texts), dtype=np.float32)
+
+        keys = [self.key(text) for text in texts]
+        found = {}
+        with self._lock, self._file_lock:
+            self._sync()
+            for key in keys:
+                if key not in found and key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[key] = np.array(self._vectors[self._entries[key]], dtype=np.float32)
+            if found:
+                self._append(found)
+
+        missing = OrderedDict()
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+
+        if missing:
+            # Encode outside the locks; only unique unseen texts go through the model
+            encoded = np.asarray(encode_fn(list(missing.values())), dtype=np.float32)
+            with self._lock, self._file_lock:
+                self._sync()
+                if self._vectors is None:
+                    self._create(encoded.shape[1])
+                for key, vector in zip(missing, encoded):
+                    self._store(key, vector)
+                    found[key] = vector
+                # Vectors reach the file before the log lines that point at them
+                self._vectors.flush()
+                self._append(key for key in missing if key in self._entries)
+
+        with self._lock:
+            misses = sum(1 for key in keys if key in missing)
+            self.misses += misses
+            self.hits += len(keys) - misses
+        return np.stack([found[key] for key in keys])
+
+    def flush(self):
+        """Persist vectors and fold the log into a new index snapshot"""
+        with self._lock, self._file_lock:
+            self._sync()
+            if self._vectors is None:
+                return
+            self._vectors.flush()
+            self._write_snapshot()
+
+    def stats(self) -> dict:
+        """Hit/miss counters and occupancy"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self._entries),
+            'max_entries': self.max_entries
+        }
+
+
+class CachedEmbeddings:
+    """LangChain embeddings wrapper that serves document embeddings from an EmbeddingCache.
+
+    Registered as a virtual subclass of LangChain's ``Embeddings`` once
+    langchain is imported, so this module stays cheap to import.
+    """
+
+    def __init__(self, embeddings, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.cache.embed(texts, self.embeddings.embed_documents).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of queries in one call without caching them"""
+        return self.embeddings.embed_documents(texts)
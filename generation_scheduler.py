@@ -0,0 +1,238 @@
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from typing import List, Optional
+
+from llm_generator import LLMGenerator, sample_next_token
+
+
+def _cache_layers(past) -> list:
+    """(key, value) tensors per layer for any past_key_values format"""
+    if past is None:
+        return []
+    if hasattr(past, "layers"):
+        return [(layer.keys, layer.values) for layer in past.layers]
+    if hasattr(past, "key_cache"):
+        return list(zip(past.key_cache, past.value_cache))
+    return list(past)
+
+
+def _make_cache(layers: list):
+    """Build a past_key_values object the installed transformers accepts"""
+    try:
+        from transformers import DynamicCache
+    except ImportError:
+        return tuple(layers)
+    cache = DynamicCache()
+    for layer_idx, (key, value) in enumerate(layers):
+        cache.update(key, value, layer_idx)
+    return cache
+
+
+class _Request:
+    def __init__(self, prompt_ids: List[int], max_new_tokens: int):
+        self.prompt_ids = prompt_ids
+        self.max_new_tokens = max_new_tokens
+        self.generated: List[int] = []
+        self.future: Future = Future()
+
+
+class BatchingScheduler:
+    """Continuous-batching generation server around an LLMGenerator.
+
+    Prompts submitted from any thread are queued; a worker thread collects
+    them for up to ``batch_window_ms``, left-pads them into one batch and
+    decodes all rows together. Finished sequences leave the batch and queued
+    ones join at the next step boundary. Each caller gets a Future.
+    """
+
+    def __init__(self, generator: LLMGenerator, max_batch_size: int = 8, batch_window_ms: float = 10.0,
+                 max_new_tokens: int = 128, temperature: float = 0.7, top_k: int = 50):
+        self.generator = generator
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window_ms / 1000
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_k = top_k
+        self._queue: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        self._active: List[_Request] = []
+        self._layers = []
+        self._mask = None
+        self._next_tokens = None
+        self._closed = False
+        # Metrics
+        self.steps = 0
+        self.completed = 0
+        self.batch_sizes = Counter()
+        self._worker = threading.Thread(target=self._run, name="generation-scheduler", daemon=True)
+        self._worker.start()
+
+    def submit(self, query: str, context: List[str], max_new_tokens: int = None) -> Future:
+        """Queue a prompt and return a Future resolving to the answer text"""
+        if self._closed:
+            raise RuntimeError("Scheduler is closed")
+        max_new_tokens = max_new_tokens or self.max_new_tokens
+        prefix_ids, suffix_ids = self.generator._prompt_ids(query, context, max_new_tokens)
+        request = _Request(prefix_ids + suffix_ids, max_new_tokens)
+        self._queue.put(request)
+        return request.future
+
+    def metrics(self) -> dict:
+        """Queue depth, current batch size and batch-size distribution"""
+        total_rows = sum(size * count for size, count in self.batch_sizes.items())
+        return {
+            'queue_depth': self._queue.qsize(),
+            'active': len(self._active),
+            'steps': self.steps,
+            'completed': self.completed,
+            'avg_batch_size': total_rows / self.steps if self.steps else 0.0,
+            'batch_sizes': dict(self.batch_sizes)
+        }
+
+    def close(self):
+        """Stop the worker after the active batch finishes"""
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join()
+
+    def _collect(self) -> List[_Request]:
+        """Take queued requests that fit in the batch; wait a short window when idle"""
+        slots = self.max_batch_size - len(self._active)
+        joining = []
+        if not self._active:
+            request = self._queue.get()
+            if request is None:
+                return []
+            joining.append(request)
+            deadline = time.monotonic() + self.batch_window
+            while len(joining) < slots:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if request is None:
+                    self._queue.put(None)
+                    break
+                joining.append(request)
+        else:
+            while len(joining) < slots:
+                try:
+                    request = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    self._queue.put(None)
+                    break
+                joining.append(request)
+        return [request for request in joining if request.future.set_running_or_notify_cancel()]
+
+    def _run(self):
+        while not (self._closed and not self._active and self._queue.empty()):
+            joining = self._collect()
+            try:
+                if joining:
+                    self._prefill(joining)
+                if self._active:
+                    self._step()
+            except Exception as e:
+                for request in self._active + joining:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                self._active, self._layers, self._mask, self._next_tokens = [], [], None, None
+
+    def _sample(self, logits):
+        return sample_next_token(logits, self.temperature, self.top_k)
+
+    def _prefill(self, requests: List[_Request]):
+        """Run new prompts as a left-padded batch and merge them into the active batch"""
+        import torch
+        generator = self.generator
+        pad_id = generator.tokenizer.eos_token_id
+        length = max(len(request.prompt_ids) for request in requests)
+        input_ids = torch.full((len(requests), length), pad_id, dtype=torch.long)
+        mask = torch.zeros((len(requests), length), dtype=torch.long)
+        for row, request in enumerate(requests):
+            input_ids[row, length - len(request.prompt_ids):] = torch.tensor(request.prompt_ids)
+            mask[row, length - len(request.prompt_ids):] = 1
+        positions = (mask.cumsum(dim=1) - 1).clamp(min=0)
+
+        with torch.no_grad():
+            outputs = generator.model(input_ids=input_ids.to(generator.device), attention_mask=mask.to(generator.device),
+                                      position_ids=positions.to(generator.device), use_cache=True)
+        next_tokens = self._sample(outputs.logits[:, -1])
+        self._merge(requests, _cache_layers(outputs.past_key_values), mask.to(generator.device), next_tokens)
+
+    def _merge(self, requests: List[_Request], layers: list, mask, next_tokens):
+        """Append rows to the active batch, left-padding the shorter side"""
+        import torch
+        if not self._active:
+            self._active, self._layers, self._mask, self._next_tokens = list(requests), layers, mask, next_tokens
+            return
+
+        def pad(tensor, dim, amount):
+            if amount == 0:
+                return tensor
+            shape = list(tensor.shape)
+            shape[dim] = amount
+            return torch.cat([tensor.new_zeros(shape), tensor], dim=dim)
+
+        length = max(self._mask.shape[1], mask.shape[1])
+        old_pad, new_pad = length - self._mask.shape[1], length - mask.shape[1]
+        self._layers = [
+            (torch.cat([pad(old_key, 2, old_pad), pad(new_key, 2, new_pad)]),
+             torch.cat([pad(old_value, 2, old_pad), pad(new_value, 2, new_pad)]))
+            for (old_key, old_value), (new_key, new_value) in zip(self._layers, layers)
+        ]
+        self._mask = torch.cat([pad(self._mask, 1, old_pad), pad(mask, 1, new_pad)])
+        self._next_tokens = torch.cat([self._next_tokens, next_tokens])
+        self._active.extend(requests)
+
+    def _step(self):
+        """Feed the pending token of every active row and retire finished rows"""
+        import torch
+        generator = self.generator
+        eos_token_id = generator.tokenizer.eos_token_id
+        self.steps += 1
+        self.batch_sizes[len(self._active)] += 1
+
+        # Record pending tokens; rows that hit EOS or their limit finish now
+        keep = []
+        for row, request in enumerate(self._active):
+            token = self._next_tokens[row].item()
+            if token != eos_token_id:
+                request.generated.append(token)
+            if token == eos_token_id or len(request.generated) >= request.max_new_tokens:
+                text = generator.tokenizer.decode(request.generated, skip_special_tokens=True).strip()
+                request.future.set_result(text)
+                self.completed += 1
+            else:
+                keep.append(row)
+
+        if len(keep) < len(self._active):
+            if not keep:
+                self._active, self._layers, self._mask, self._next_tokens = [], [], None, None
+                return
+            index = torch.tensor(keep, device=self._mask.device)
+            self._active = [self._active[row] for row in keep]
+            self._layers = [(key.index_select(0, index), value.index_select(0, index)) for key, value in self._layers]
+            self._mask = self._mask.index_select(0, index)
+            self._next_tokens = self._next_tokens.index_select(0, index)
+            # Drop leading columns that are padding for every remaining row
+            start = int((self._mask.sum(dim=0) > 0).nonzero()[0])
+            if start:
+                self._mask = self._mask[:, start:]
+                self._layers = [(key[:, :, start:], value[:, :, start:]) for key, value in self._layers]
+
+        mask = torch.cat([self._mask, self._mask.new_ones((len(self._active), 1))], dim=1)
+        positions = (self._mask.sum(dim=1, keepdim=True))
+        with torch.no_grad():
+            outputs = generator.model(input_ids=self._next_tokens, past_key_values=_make_cache(self._layers),
+                                      attention_mask=mask, position_ids=positions, use_cache=True)
+        self._layers = _cache_layers(outputs.past_key_values)
+        self._mask = mask
+        self._next_tokens = self._sample(outputs.logits[:, -1])
@@ -0,0 +1,214 @@
+import time
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw", "fp16", "sq8")
+
+# Index types whose stored vectors are approximations of the originals
+LOSSY_INDEX_TYPES = ("ivf_pq", "fp16", "sq8")
+
+DEFAULT_INDEX_PARAMS = {
+    "nlist": 1024,          # IVF: number of inverted lists
+    "m": 16,                # IVF-PQ: sub-quantizers (must divide the dimension)
+    "nbits": 8,             # IVF-PQ: bits per sub-quantizer code
+    "hnsw_m": 32,           # HNSW: neighbours per node
+    "ef_construction": 200,
+    "nprobe": 16,           # IVF: lists visited per query
+    "ef_search": 64,        # HNSW: candidate list size per query
+    "train_size": 100_000,  # max vectors sampled for training
+    "sq_min_train": 1000,   # sq8: min vectors in the batch its value ranges are learned from
+}
+
+
+def build_index(index_type: str, dimension: int, params: Dict = None) -> faiss.Index:
+    """Create an empty inner-product index of the given type"""
+    params = {**DEFAULT_INDEX_PARAMS, **(params or {})}
+    if index_type == "flat":
+        return faiss.IndexFlatIP(dimension)
+    if index_type == "ivf_flat":
+        quantizer = faiss.IndexFlatIP(dimension)
+        index = faiss.IndexIVFFlat(quantizer, dimension, params["nlist"], faiss.METRIC_INNER_PRODUCT)
+        index.nprobe = params["nprobe"]
+        return index
+    if index_type == "ivf_pq":
+        quantizer = faiss.IndexFlatIP(dimension)
+        index = faiss.IndexIVFPQ(quantizer, dimension, params["nlist"], params["m"], params["nbits"],
+                                 faiss.METRIC_INNER_PRODUCT)
+        index.nprobe = params["nprobe"]
+        return index
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, params["hnsw_m"], faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = params["ef_construction"]
+        index.hnsw.efSearch = params["ef_search"]
+        return index
+    if index_type == "fp16":
+        # Half-precision flat codes: 2 bytes per dimension
+        return faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+    if index_type == "sq8":
+        # 8-bit codes per dimension, with per-dimension ranges learned in training
+        return faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+    raise ValueError(f"Unknown index type: {index_type}. Use one of {', '.join(INDEX_TYPES)}.")
+
+
+def train_index(index: faiss.Index, vectors: np.ndarray, train_size: int = DEFAULT_INDEX_PARAMS["train_size"],
+                sq_min_train: int = DEFAULT_INDEX_PARAMS["sq_min_train"]):
+    """Train an index on a random sample of vectors if it needs training.
+
+    sq8 learns fixed per-dimension ranges and clips everything added later
+    to them, so it is only trained on at least sq_min_train vectors.
+    """
+    if index.is_trained:
+        return
+    if len(vectors) > train_size:
+        sample = np.random.default_rng(0).choice(len(vectors), train_size, replace=False)
+        vectors = vectors[np.sort(sample)]
+    if isinstance(index, faiss.IndexIVF):
+        min_points, hint = faiss.extract_index_ivf(index).nlist, "Lower nlist"
+    elif isinstance(index, faiss.IndexScalarQuantizer):
+        min_points, hint = sq_min_train, "Lower sq_min_train"
+    else:
+        min_points, hint = 1, "Add documents"
+    if len(vectors) < min_points:
+        raise ValueError(
+            f"Need at least {min_points} vectors to train this index, got {len(vectors)}. "
+            f"{hint} or add more documents in the first batch."
+        )
+    index.train(np.ascontiguousarray(vectors, dtype=np.float32))
+
+
+def search_parameters(index: faiss.Index, nprobe: int = None, ef_search: int = None,
+                      selector: faiss.IDSelector = None):
+    """Per-query search parameters overriding the index defaults, or None.
+
+    A selector restricts the scan to the ids it accepts; the caller must
+    keep it (and any array it wraps) alive until the search returns.
+    """
+    if nprobe is None and ef_search is None and selector is None:
+        return None
+    # IVF and HNSW indexes reject parameter objects of the base type
+    if isinstance(index, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF(nprobe=nprobe if nprobe is not None else index.nprobe)
+    elif isinstance(index, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW(efSearch=ef_search if ef_search is not None else index.hnsw.efSearch)
+    elif selector is not None:
+        params = faiss.SearchParameters()
+    else:
+        return None
+    if selector is not None:
+        params.sel = selector
+    return params
+
+
+def rescore(queries: np.ndarray, indices: np.ndarray, vectors_for: Callable[[np.ndarray], np.ndarray],
+            k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Re-rank candidate ids by exact inner product and keep the top k.
+
+    ``vectors_for`` returns full-precision vectors for an array of ids.
+    Rows are padded with -1 ids (and -inf scores) like FAISS results.
+    """
+    scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    result = np.full((len(queries), k), -1, dtype=np.int64)
+    for row, (query, candidates) in enumerate(zip(queries, indices)):
+        candidates = candidates[candidates >= 0]
+        if not len(candidates):
+            continue
+        exact = np.asarray(vectors_for(candidates), dtype=np.float32) @ np.asarray(query, dtype=np.float32)
+        top = np.argsort(-exact, kind='stable')[:k]
+        scores[row, :len(top)] = exact[top]
+        result[row, :len(top)] = candidates[top]
+    return scores, result
+
+
+def index_bytes_per_vector(index: faiss.Index) -> float:
+    """Serialized index size divided by the number of vectors"""
+    return faiss.serialize_index(index).size / max(index.ntotal, 1)
+
+
+def compression_report(vectors: np.ndarray, queries: np.ndarray, k: int = 10,
+                       index_types: Sequence[str] = ("flat", "fp16", "sq8"),
+                       rescore_factors: Sequence[int] = (2, 4)) -> List[Dict]:
+    """Measure bytes per vector, recall@k and latency of flat compressed indexes.
+
+    Lossy types are also measured with exact re-scoring of the top
+    k * factor candidates from the full-precision vectors.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    flat = faiss.IndexFlatIP(vectors.shape[1])
+    flat.add(vectors)
+    _, truth = flat.search(queries, k)
+
+    def recall(indices):
+        hits = sum(len(set(found[found >= 0]) & set(expected[expected >= 0])) for found, expected in zip(indices, truth))
+        return hits / max(int((truth >= 0).sum()), 1)
+
+    report = []
+    for index_type in index_types:
+        index = build_index(index_type, vectors.shape[1])
+        # Trained on every vector it will hold, so no later vector is clipped
+        train_index(index, vectors, sq_min_train=1)
+        index.add(vectors)
+        size = index_bytes_per_vector(index)
+        start = time.perf_counter()
+        _, indices = index.search(queries, k)
+        ms = (time.perf_counter() - start) * 1000 / len(queries)
+        report.append({"setting": index_type, "recall": recall(indices), "ms_per_query": ms, "bytes_per_vector": size})
+        if index_type not in LOSSY_INDEX_TYPES:
+            continue
+        for factor in rescore_factors:
+            start = time.perf_counter()
+            _, candidates = index.search(queries, k * factor)
+            _, indices = rescore(queries, candidates, lambda ids: vectors[ids], k)
+            ms = (time.perf_counter() - start) * 1000 / len(queries)
+            # The full-precision vectors live in a memory-mapped file, not in the index
+            report.append({"setting": f"{index_type}+rescore x{factor}", "recall": recall(indices),
+                           "ms_per_query": ms, "bytes_per_vector": size})
+    return report
+
+
+def recall_report(index: faiss.Index, vectors: np.ndarray, queries: np.ndarray, k: int = 10,
+                  nprobe_values: Sequence[int] = (1, 4, 16, 64),
+                  ef_search_values: Sequence[int] = (16, 32, 64, 128)) -> List[Dict]:
+    """Measure recall@k and latency of an index against exact flat search.
+
+    ``vectors`` are the vectors stored in ``index`` (in insertion order) and
+    are used to build the ground-truth flat index.
+    """
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    flat = faiss.IndexFlatIP(vectors.shape[1])
+    flat.add(np.ascontiguousarray(vectors, dtype=np.float32))
+
+    def run(target, params=None):
+        start = time.perf_counter()
+        _, indices = target.search(queries, k, params=params)
+        return indices, (time.perf_counter() - start) * 1000 / len(queries)
+
+    truth, flat_ms = run(flat)
+    report = [{"setting": "flat", "recall": 1.0, "ms_per_query": flat_ms}]
+
+    if isinstance(index, faiss.IndexIVF):
+        settings = [(f"nprobe={n}", faiss.SearchParametersIVF(nprobe=n)) for n in nprobe_values]
+    elif isinstance(index, faiss.IndexHNSW):
+        settings = [(f"efSearch={ef}", faiss.SearchParametersHNSW(efSearch=ef)) for ef in ef_search_values]
+    else:
+        settings = [("default", None)]
+
+    for name, params in settings:
+        indices, ms = run(index, params)
+        hits = sum(len(set(found[found >= 0]) & set(expected[expected >= 0])) for found, expected in zip(indices, truth))
+        report.append({"setting": name, "recall": hits / max(int((truth >= 0).sum()), 1), "ms_per_query": ms})
+    return report
+
+
+def format_report(report: List[Dict]) -> str:
+    """Render a recall or compression report as a text table"""
+    sizes = all("bytes_per_vector" in row for row in report)
+    lines = [f"{'setting':<20}{'recall':>8}{'ms/query':>10}" + (f"{'bytes/vec':>11}" if sizes else "")]
+    for row in report:
+        line = f"{row['setting']:<20}{row['recall']:>8.3f}{row['ms_per_query']:>10.3f}"
+        if sizes:
+            line += f"{row['bytes_per_vector']:>11.1f}"
+        lines.append(line)
+    return "\n".join(lines)
@@ -0,0 +1,90 @@
+import hashlib
+import json
+import os
+from typing import Dict, List, Tuple
+
+MANIFEST_FILENAME = "manifest.json"
+
+
+def hash_file(file_path: str, block_size: int = 1 << 20) -> str:
+    """Return the SHA-256 hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IndexManifest:
+    """Per-file content hashes and chunk ids for an indexed document folder.
+
+    Each entry maps a file name to its size, mtime, content hash and the ids
+    of the chunks it contributed to the vector store, so a reload only has
+    to re-embed files that were added or modified.
+    """
+
+    def __init__(self, files: Dict[str, dict] = None):
+        self.files = files or {}
+
+    @staticmethod
+    def chunk_ids(name: str, content_hash: str, count: int) -> List[str]:
+        """Deterministic chunk ids for a file's name and content"""
+        return [f"{name}:{content_hash}:{i}" for i in range(count)]
+
+    def diff(self, folder_path: str, file_names: List[str]) -> Tuple[List[str], List[str], Dict[str, str]]:
+        """Compare files on disk against the manifest.
+
+        Returns (unchanged, removed, changed) where ``changed`` maps each new
+        or modified file name to its current content hash. Files whose size
+        and mtime match the manifest are not re-hashed.
+        """
+        unchanged, changed = [], {}
+        for name in file_names:
+            file_path = os.path.join(folder_path, name)
+            stat = os.stat(file_path)
+            entry = self.files.get(name)
+            if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+                unchanged.append(name)
+                continue
+
+            content_hash = hash_file(file_path)
+            if entry and entry['hash'] == content_hash:
+                # Touched but not modified; refresh the stat fields only
+                entry['size'] = stat.st_size
+                entry['mtime'] = stat.st_mtime
+                unchanged.append(name)
+            else:
+                changed[name] = content_hash
+
+        removed = [name for name in self.files if name not in file_names]
+        return unchanged, removed, changed
+
+    def record(self, folder_path: str, name: str, content_hash: str, chunk_ids: List[str]):
+        """Record the current state of an indexed file"""
+        stat = os.stat(os.path.join(folder_path, name))
+        self.files[name] = {
+            'hash': content_hash,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'chunk_ids': chunk_ids
+        }
+
+    def forget(self, name: str) -> List[str]:
+        """Drop a file from the manifest and return its chunk ids"""
+        entry = self.files.pop(name, None)
+        return entry['chunk_ids'] if entry else []
+
+    def save(self, directory: str):
+        """Save manifest next to the vector store"""
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, MANIFEST_FILENAME), 'w', encoding='utf-8') as f:
+            json.dump({'files': self.files}, f, indent=2)
+
+    @classmethod
+    def load(cls, directory: str) -> "IndexManifest":
+        """Load manifest saved next to a vector store, or None if absent"""
+        path = os.path.join(directory, MANIFEST_FILENAME)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f).get('files', {}))
@@ -1,72 +1,254 @@
-from transformers import pipeline, AutoTokenizer, AutoModelForCausalLM
-import torch
-from typing import List
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterator, List, Tuple
+from quantization import load_quantized
+from tracing import Tracer, get_tracer
+from context_packer import ContextPacker
+
+def _crop_past(past, length: int):
+    """Copy of a KV cache truncated to the first length positions"""
+    if hasattr(past, "crop"):
+        past = copy.deepcopy(past)
+        excess = past.get_seq_length() - length
+        if excess > 0:
+            past.crop(-excess)
+        return past
+    return tuple((key[:, :, :length], value[:, :, :length]) for key, value in past)
+
+def sample_next_token(logits, temperature: float = 0.7, top_k: int = 50):
+    """Sample one token id per row of logits from the top_k most likely tokens (0 keeps the whole vocabulary)"""
+    import torch
+    if top_k and top_k < logits.size(-1):
+        kth = torch.topk(logits, top_k, dim=-1).values[..., -1:]
+        logits = logits.masked_fill(logits < kth, float("-inf"))
+    probs = torch.softmax(logits / temperature, dim=-1)
+    return torch.multinomial(probs, num_samples=1)
 
 class LLMGenerator:
-    def __init__(self, model_name: str = "microsoft/DialoGPT-medium"):
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        
-        # Initialize the model and tokenizer
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.model = AutoModelForCausalLM.from_pretrained(model_name)
+    def __init__(self, model_name: str = "microsoft/DialoGPT-medium", prefix_cache_size: int = 2,
+                 quantize: bool = False, tracer: Tracer = None, max_context_tokens: int = None):
+        # torch/transformers and the model are loaded on first use
+        self.model_name = model_name
+        # int8 dynamic quantization of Linear layers (CPU only), cached on disk
+        self.quantize = quantize
+        self.device = None
+        self._tokenizer = None
+        self._model = None
+        self._lock = threading.Lock()
+        # KV caches of recent prompt prefixes (token ids -> past_key_values)
+        self.prefix_cache_size = prefix_cache_size
+        self._prefix_cache = OrderedDict()
+        self._prefix_lock = threading.Lock()
+        self.tracer = tracer or get_tracer()
+        # Optional cap on context tokens below what the context window allows
+        self.max_context_tokens = max_context_tokens
+        self._packer = None
+    
+    def _load(self):
+        """Load the model and tokenizer if not loaded yet"""
+        with self._lock:
+            if self._model is not None:
+                return
+            import torch
+            from transformers import AutoConfig, AutoTokenizer, AutoModelForCausalLM
+            
+            self.device = "cuda" if torch.cuda.is_available() else "cpu"
+            
+            # Initialize the model and tokenizer
+            tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+            if self.quantize and self.device == "cpu":
+                # A cached int8 copy is loaded into a model built from the config alone
+                model = load_quantized(self.model_name, lambda: AutoModelForCausalLM.from_pretrained(self.model_name),
+                                       skeleton_fn=lambda: AutoModelForCausalLM.from_config(
+                                           AutoConfig.from_pretrained(self.model_name)))
+            else:
+                model = AutoModelForCausalLM.from_pretrained(self.model_name)
+            
+            # Add padding token if not present
+            if tokenizer.pad_token is None:
+                tokenizer.pad_token = tokenizer.eos_token
+            
+            # Move model to device
+            model.to(self.device)
+            self._tokenizer = tokenizer
+            self._model = model
+    
+    @property
+    def tokenizer(self):
+        self._load()
+        return self._tokenizer
+    
+    @property
+    def model(self):
+        self._load()
+        return self._model
+    
+    def warm_up(self):
+        """Load the model now instead of on the first request"""
+        self._load()
+    
+    @property
+    def packer(self) -> ContextPacker:
+        """Context packer with cached per-chunk token ids"""
+        if self._packer is None:
+            self._packer = ContextPacker(self.tokenizer)
+        return self._packer
+    
+    def _prompt_ids(self, query: str, context: List[str], max_new_tokens: int) -> Tuple[List[int], List[int]]:
+        """Tokenize the prompt as (context prefix, question suffix).
         
-        # Add padding token if not present
-        if self.tokenizer.pad_token is None:
-            self.tokenizer.pad_token = self.tokenizer.eos_token
+        The question is tokenized first and always kept whole; contexts (in
+        rank order) are packed into whatever the context window has left
+        after it and the answer, so no chunk is tokenized only to be cut off.
+        """
+        suffix_ids = self.tokenizer.encode(f"\n\nQuestion: {query}\n\nAnswer:")
+        label_ids = self.packer.token_ids("Context:\n")
         
-        # Move model to device
-        self.model.to(self.device)
+        config = self.model.config
+        max_positions = getattr(config, "n_positions", None) or config.max_position_embeddings
+        budget = max_positions - max_new_tokens - len(suffix_ids) - len(label_ids)
+        if self.max_context_tokens is not None:
+            budget = min(budget, self.max_context_tokens)
+        context_ids = self.packer.pack(context, budget)
+        if not context_ids:
+            return [], suffix_ids
+        return list(label_ids) + context_ids, suffix_ids
     
-    def generate_response(self, query: str, context: List[str], max_length: int = 512) -> str:
-        """Generate response based on query and retrieved context"""
-        # Combine context and query
-        context_text = "\n".join(context)
-        prompt = f"Context: {context_text}\n\nQuestion: {query}\n\nAnswer:"
+    def _prefix_past(self, prefix_ids: List[int]):
+        """KV cache for a prompt prefix, reusing the longest cached common prefix"""
+        import torch
         
-        # Tokenize input
-        inputs = self.tokenizer.encode(prompt, return_tensors="pt", truncation=True, max_length=400)
-        inputs = inputs.to(self.device)
+        with self._prefix_lock:
+            best_key, best_length = None, 0
+            for key in self._prefix_cache:
+                length = 0
+                for a, b in zip(key, prefix_ids):
+                    if a != b:
+                        break
+                    length += 1
+                if length > best_length:
+                    best_key, best_length = key, length
+            past = _crop_past(self._prefix_cache[best_key], best_length) if best_key is not None else None
+            if best_key is not None:
+                self._prefix_cache.move_to_end(best_key)
         
-        # Generate response
-        with torch.no_grad():
-            outputs = self.model.generate(
-                inputs,
-                max_length=max_length,
-                num_return_sequences=1,
-                temperature=0.7,
-                do_sample=True,
-                pad_token_id=self.tokenizer.eos_token_id
-            )
+        # Only run the model over the uncached tail of the prefix
+        if best_length < len(prefix_ids):
+            inputs = torch.tensor([prefix_ids[best_length:]], device=self.device)
+            with torch.no_grad():
+                past = self.model(input_ids=inputs, past_key_values=past, use_cache=True).past_key_values
+            with self._prefix_lock:
+                self._prefix_cache[tuple(prefix_ids)] = _crop_past(past, len(prefix_ids))
+                while len(self._prefix_cache) > self.prefix_cache_size:
+                    self._prefix_cache.popitem(last=False)
+        return past
+    
+    def stream_response(self, query: str, context: List[str], max_new_tokens: int = 128,
+                        temperature: float = 0.7, top_k: int = 50) -> Iterator[str]:
+        """Yield the answer incrementally as tokens are sampled.
         
-        # Decode response
-        response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+        Sampling is restricted to the top_k most likely tokens, as
+        transformers' generate(do_sample=True) does by default.
+        """
+        import torch
         
-        # Extract only the answer part
-        if "Answer:" in response:
-            response = response.split("Answer:")[-1].strip()
+        prefix_ids, suffix_ids = self._prompt_ids(query, context, max_new_tokens)
+        eos_token_id = self.tokenizer.eos_token_id
         
-        return response
+        with torch.no_grad():
+            with self.tracer.span("prefill"):
+                past = self._prefix_past(prefix_ids) if prefix_ids else None
+            inputs = torch.tensor([suffix_ids], device=self.device)
+            generated = []
+            text = emitted = ""
+            # Only time spent decoding counts towards "generate", not the consumer's time between tokens
+            decode_seconds = 0.0
+            try:
+                for _ in range(max_new_tokens):
+                    step_start = time.perf_counter()
+                    outputs = self.model(input_ids=inputs, past_key_values=past, use_cache=True)
+                    past = outputs.past_key_values
+                    
+                    # Sample the next token
+                    next_token = sample_next_token(outputs.logits[0, -1], temperature, top_k)
+                    if next_token.item() == eos_token_id:
+                        decode_seconds += time.perf_counter() - step_start
+                        break
+                    generated.append(next_token.item())
+                    inputs = next_token.view(1, 1)
+                    
+                    # Decode everything so far; hold back incomplete multi-byte characters
+                    text = self.tokenizer.decode(generated, skip_special_tokens=True).lstrip()
+                    decode_seconds += time.perf_counter() - step_start
+                    if text.endswith("\ufffd"):
+                        continue
+                    if len(text) > len(emitted):
+                        yield text[len(emitted):]
+                        emitted = text
+                
+                # Flush anything held back when generation stopped
+                if len(text) > len(emitted):
+                    yield text[len(emitted):]
+            finally:
+                self.tracer.record("generate", decode_seconds)
+                self.tracer.count("generated_tokens", len(generated))
+    
+    def generate_response(self, query: str, context: List[str], max_new_tokens: int = 128) -> str:
+        """Generate response based on query and retrieved context"""
+        return "".join(self.stream_response(query, context, max_new_tokens)).strip()
 
 class SimpleLLMGenerator:
     """Alternative simple generator using Hugging Face pipeline"""
-    def __init__(self):
-        self.generator = pipeline(
-            "text-generation",
-            model="microsoft/DialoGPT-small",
-            tokenizer="microsoft/DialoGPT-small"
-        )
+    def __init__(self, context_tokens: int = 80):
+        self._generator = None
+        self._lock = threading.Lock()
+        # Token budget for the context part of the prompt
+        self.context_tokens = context_tokens
+        self._packer = None
+    
+    @property
+    def generator(self):
+        """Text-generation pipeline, constructed on first use"""
+        with self._lock:
+            if self._generator is None:
+                from transformers import pipeline
+                self._generator = pipeline(
+                    "text-generation",
+                    model="microsoft/DialoGPT-small",
+                    tokenizer="microsoft/DialoGPT-small"
+                )
+            return self._generator
+    
+    def warm_up(self):
+        """Load the pipeline now instead of on the first request"""
+        self.generator
+    
+    @property
+    def packer(self) -> ContextPacker:
+        """Context packer over the pipeline's tokenizer"""
+        if self._packer is None:
+            self._packer = ContextPacker(self.generator.tokenizer, separator=" ")
+        return self._packer
     
     def generate_response(self, query: str, context: List[str], max_length: int = 200) -> str:
         """Generate simple response"""
-        context_text = " ".join(context[:2])  # Use top 2 contexts
-        prompt = f"Based on: {context_text[:300]}... Question: {query} Answer:"
+        # max_length covers prompt and answer; the question is kept whole and
+        # at least min_answer tokens are left for the answer
+        min_answer = 32
+        question_tokens = len(self.generator.tokenizer.encode(f"Based on: ... Question: {query} Answer:"))
+        budget = max(min(self.context_tokens, max_length - question_tokens - min_answer), 0)
+        context_text = self.packer.pack_text(context, budget)
+        prompt = f"Based on: {context_text}... Question: {query} Answer:"
         
-        response = self.generator(
-            prompt,
-            max_length=max_length,
-            num_return_sequences=1,
-            temperature=0.7
-        )[0]['generated_text']
+        with get_tracer().span("generate"):
+            response = self.generator(
+                prompt,
+                max_length=max_length,
+                num_return_sequences=1,
+                temperature=0.7
+            )[0]['generated_text']
         
         # Extract answer
         if "Answer:" in response:
@@ -1,32 +1,45 @@
-from rag_chatbot import RAGChatbot
 import os
+import sys
+import threading
+import time
+from startup_timing import PhaseTimer
 
-def main():
+def main(warm_up: bool = True):
+    start = time.perf_counter()
     print("🤖 RAG Q&A Chatbot")
     print("=" * 50)
     
-    # Initialize chatbot
-    chatbot = RAGChatbot(use_simple_llm=True)
+    # Initialize chatbot; langchain and the models are loaded lazily
+    timings = PhaseTimer()
+    with timings.phase("import"):
+        from rag_chatbot import RAGChatbot
+    chatbot = RAGChatbot(use_simple_llm=True, timings=timings)
     
     # Documents folder
     docs_folder = r"c:\Users\kumar\OneDrive\Desktop\week-8\documents"
     
-    # Check if vector store exists
-    if os.path.exists("vector_store.faiss"):
-        print("Loading existing vector store...")
-        chatbot.load_vector_store("vector_store")
-    else:
-        print(f"Loading documents from: {docs_folder}")
-        chatbot.load_documents(docs_folder)
-        if chatbot.is_initialized:
-            chatbot.save_vector_store("vector_store")
+    def prepare():
+        # Load existing vector store, then re-index only added or changed files
+        if os.path.exists("vector_store"):
+            chatbot.load_vector_store("vector_store")
+        if os.path.exists(docs_folder) or not chatbot.is_initialized:
+            with timings.phase("document load"):
+                chatbot.load_documents(docs_folder)
+            if chatbot.is_initialized:
+                chatbot.save_vector_store("vector_store")
     
-    if not chatbot.is_initialized:
-        print("Failed to initialize chatbot. Exiting...")
-        return
+    # Load models and the index in the background so input is accepted right away
+    loader = threading.Thread(target=prepare, name="rag-warm-up", daemon=True)
+    loader.start()
+    if not warm_up:
+        loader.join()
+        if not chatbot.is_initialized:
+            print("Failed to initialize chatbot. Exiting...")
+            return
     
-    print("\nChatbot ready! Type 'quit' to exit.")
+    print(f"\nChatbot ready in {time.perf_counter() - start:.2f}s! Type 'quit' to exit.")
     print("-" * 50)
+    first_answer = True
     
     while True:
         # Get user question
@@ -39,10 +52,27 @@ def main():
         if not question:
             continue
         
-        # Get answer
+        # Wait for the background warm-up on the first question
+        asked = time.perf_counter()
+        if loader.is_alive():
+            print("\nStill loading models and documents...")
+            loader.join()
+        if not chatbot.is_initialized:
+            print("Failed to initialize chatbot. Exiting...")
+            return
+        
+        # Get answer, printing tokens as they are generated
         print("\nThinking...")
-        answer = chatbot.ask_question(question)
-        print(f"\nAnswer: {answer}")
+        print("\nAnswer: ", end="", flush=True)
+        for piece in chatbot.ask_question_stream(question):
+            print(piece, end="", flush=True)
+        print()
+        
+        if first_answer:
+            first_answer = False
+            print(f"\nFirst answer took {time.perf_counter() - asked:.2f}s after the question")
+            print("Startup breakdown:")
+            print(timings.report())
         
         # Show context option
         show_context = input("\nShow retrieved context? (y/n): ").lower() == 'y'
@@ -54,4 +84,4 @@ def main():
                 print(context[:300] + "..." if len(context) > 300 else context)
 
 if __name__ == "__main__":
-    main()
+    main(warm_up="--no-warm-up" not in sys.argv)
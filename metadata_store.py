@@ -0,0 +1,161 @@
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+_MISSING_INT = np.iinfo(np.int64).min
+_OPERATORS = ("$eq", "$ne", "$in", "$nin", "$lt", "$lte", "$gt", "$gte")
+
+
+class MetadataStore:
+    """Columnar per-chunk metadata, aligned with VectorStore ids.
+
+    Each field is one numpy column: strings are dictionary-encoded to int32
+    codes (-1 when missing), ints are int64 and floats float64 (NaN when
+    missing). Column kinds are fixed by the first value seen. Rows appended
+    since the last compaction are kept as dicts and folded in on demand.
+
+    Filters are dicts mapping a field to a value or to operators, e.g.
+    ``{"source": {"$in": ["a.pdf", "b.pdf"]}, "page": {"$gte": 3}}``;
+    all conditions must hold.
+    """
+
+    def __init__(self):
+        self.kinds: Dict[str, str] = {}
+        self.categories: Dict[str, List[str]] = {}
+        self._codes: Dict[str, Dict[str, int]] = {}
+        self._columns: Dict[str, np.ndarray] = {}
+        self._length = 0
+        self._pending: List[Dict[str, Any]] = []
+
+    def __len__(self) -> int:
+        return self._length + len(self._pending)
+
+    def extend(self, records: Iterable[Optional[Dict[str, Any]]]):
+        """Append one metadata dict (or None) per chunk"""
+        for record in records:
+            record = record or {}
+            for field, value in record.items():
+                if value is not None and field not in self.kinds:
+                    self._add_column(field, value)
+            self._pending.append(record)
+
+    def _add_column(self, field: str, value: Any):
+        if isinstance(value, str):
+            kind, empty = 'str', np.full(self._length, -1, dtype=np.int32)
+            self.categories[field] = []
+            self._codes[field] = {}
+        elif isinstance(value, (int, np.integer)) and not isinstance(value, bool):
+            kind, empty = 'int', np.full(self._length, _MISSING_INT, dtype=np.int64)
+        elif isinstance(value, (float, np.floating)):
+            kind, empty = 'float', np.full(self._length, np.nan, dtype=np.float64)
+        else:
+            raise TypeError(f"Unsupported metadata type for {field!r}: {type(value).__name__}")
+        self.kinds[field] = kind
+        self._columns[field] = empty
+
+    def _code(self, field: str, value: str) -> int:
+        codes = self._codes[field]
+        if value not in codes:
+            codes[value] = len(self.categories[field])
+            self.categories[field].append(value)
+        return codes[value]
+
+    def compact(self):
+        """Fold pending rows into the columns"""
+        if not self._pending:
+            return
+        for field, kind in self.kinds.items():
+            values = [record.get(field) for record in self._pending]
+            if kind == 'str':
+                column = np.array([-1 if v is None else self._code(field, str(v)) for v in values], dtype=np.int32)
+            elif kind == 'int':
+                column = np.array([_MISSING_INT if v is None else int(v) for v in values], dtype=np.int64)
+            else:
+                column = np.array([np.nan if v is None else float(v) for v in values], dtype=np.float64)
+            self._columns[field] = np.concatenate([self._columns[field], column])
+        self._length += len(self._pending)
+        self._pending = []
+
+    def get(self, i: int) -> Dict[str, Any]:
+        """Metadata dict for one chunk, without missing fields"""
+        self.compact()
+        record = {}
+        for field, kind in self.kinds.items():
+            value = self._columns[field][i]
+            if kind == 'str':
+                if value >= 0:
+                    record[field] = self.categories[field][value]
+            elif kind == 'int':
+                if value != _MISSING_INT:
+                    record[field] = int(value)
+            elif not np.isnan(value):
+                record[field] = float(value)
+        return record
+
+    def mask(self, where: Dict[str, Any]) -> np.ndarray:
+        """Boolean mask of the chunks matching a filter"""
+        self.compact()
+        mask = np.ones(self._length, dtype=bool)
+        for field, condition in where.items():
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for op, operand in condition.items():
+                if op not in _OPERATORS:
+                    raise ValueError(f"Unknown filter operator {op!r}")
+                mask &= self._compare(field, op, operand)
+        return mask
+
+    def _compare(self, field: str, op: str, operand: Any) -> np.ndarray:
+        if field not in self.kinds:
+            # Nothing has this field, so only negative conditions can match
+            return np.full(self._length, op in ("$ne", "$nin"), dtype=bool)
+        column = self._columns[field]
+        if self.kinds[field] == 'str':
+            codes = self._codes[field]
+            if op in ("$in", "$nin"):
+                present = np.isin(column, [codes[v] for v in operand if v in codes])
+                return present if op == "$in" else ~present
+            if op in ("$eq", "$ne"):
+                equal = column == codes.get(operand, -2)
+                return equal if op == "$eq" else ~equal
+            raise ValueError(f"Operator {op} is not supported on string field {field!r}")
+
+        present = column != _MISSING_INT if self.kinds[field] == 'int' else ~np.isnan(column)
+        if op == "$in":
+            return present & np.isin(column, list(operand))
+        if op == "$nin":
+            return ~(present & np.isin(column, list(operand)))
+        if op == "$ne":
+            return ~(present & (column == operand))
+        compare = {"$eq": np.equal, "$lt": np.less, "$lte": np.less_equal,
+                   "$gt": np.greater, "$gte": np.greater_equal}[op]
+        return present & compare(column, operand)
+
+    @staticmethod
+    def exists(prefix: str) -> bool:
+        return os.path.exists(f"{prefix}.meta.npz") and os.path.exists(f"{prefix}.meta.json")
+
+    def save(self, prefix: str):
+        """Write {prefix}.meta.npz (columns) and {prefix}.meta.json (kinds and string categories)"""
+        self.compact()
+        with open(f"{prefix}.meta.npz.tmp", 'wb') as f:
+            np.savez(f, **{f"col_{i}": self._columns[field] for i, field in enumerate(self.kinds)})
+        with open(f"{prefix}.meta.json.tmp", 'w', encoding='utf-8') as f:
+            json.dump({'length': self._length, 'kinds': self.kinds, 'categories': self.categories}, f)
+        os.replace(f"{prefix}.meta.npz.tmp", f"{prefix}.meta.npz")
+        os.replace(f"{prefix}.meta.json.tmp", f"{prefix}.meta.json")
+
+    @classmethod
+    def load(cls, prefix: str) -> "MetadataStore":
+        with open(f"{prefix}.meta.json", 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        store = cls()
+        store._length = data['length']
+        store.kinds = data['kinds']
+        store.categories = data['categories']
+        store._codes = {field: {v: i for i, v in enumerate(values)} for field, values in store.categories.items()}
+        with np.load(f"{prefix}.meta.npz") as arrays:
+            store._columns = {field: arrays[f"col_{i}"] for i, field in enumerate(store.kinds)}
+        return store
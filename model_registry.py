@@ -0,0 +1,101 @@
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class _Entry:
+    def __init__(self):
+        self.value = None
+        self.refs = 0
+        self.last_used = time.monotonic()
+        self.ready = threading.Event()
+        self.error: Optional[BaseException] = None
+
+
+class ResourceRegistry:
+    """Process-wide cache of read-only models and indexes shared by reference count.
+
+    ``acquire`` loads a resource once per key (concurrent callers wait for
+    the first load) and increments its count; ``release`` decrements it.
+    Entries nobody holds are dropped once idle for ``idle_seconds``.
+    """
+
+    def __init__(self, idle_seconds: float = 600.0):
+        self.idle_seconds = idle_seconds
+        self.loads = 0
+        self.evictions = 0
+        self._entries: Dict[Hashable, _Entry] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Return the shared resource for key, calling loader() if it is not loaded"""
+        with self._lock:
+            self._evict_idle(time.monotonic())
+            entry = self._entries.get(key)
+            owner = entry is None
+            if owner:
+                entry = self._entries[key] = _Entry()
+            entry.refs += 1
+
+        if owner:
+            try:
+                entry.value = loader()
+                self.loads += 1
+            except BaseException as e:
+                entry.error = e
+                with self._lock:
+                    self._entries.pop(key, None)
+            entry.ready.set()
+        else:
+            entry.ready.wait()
+        if entry.error is not None:
+            raise entry.error
+        return entry.value
+
+    def release(self, key: Hashable):
+        """Drop one reference to key"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.refs > 0:
+                entry.refs -= 1
+                entry.last_used = time.monotonic()
+            self._evict_idle(time.monotonic())
+
+    def evict_idle(self):
+        """Drop unreferenced entries that have been idle for idle_seconds"""
+        with self._lock:
+            self._evict_idle(time.monotonic())
+
+    def _evict_idle(self, now: float):
+        for key in [key for key, entry in self._entries.items()
+                    if entry.refs == 0 and entry.ready.is_set() and now - entry.last_used >= self.idle_seconds]:
+            del self._entries[key]
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """Loaded keys with their reference counts"""
+        with self._lock:
+            return {
+                'entries': {repr(key): entry.refs for key, entry in self._entries.items()},
+                'loads': self.loads,
+                'evictions': self.evictions
+            }
+
+
+def store_stamp(path: str) -> int:
+    """Latest modification time of the files in a saved vector store, for cache keys"""
+    return max((entry.stat().st_mtime_ns for entry in os.scandir(path) if entry.is_file()), default=0)
+
+
+_registry: Optional[ResourceRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ResourceRegistry:
+    """The registry shared by every chatbot in this process"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ResourceRegistry()
+        return _registry
@@ -0,0 +1,86 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import PyPDF2
+
+
+def count_pdf_pages(pdf_path: str) -> int:
+    """Return the number of pages in a PDF"""
+    with open(pdf_path, 'rb') as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+
+def extract_pdf_pages(pdf_path: str, start: int, stop: int) -> List[str]:
+    """Extract the text of pages [start, stop) of a PDF"""
+    with open(pdf_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        return [pdf_reader.pages[i].extract_text() for i in range(start, stop)]
+
+
+def extract_text_file(txt_path: str) -> List[str]:
+    """Read a text file as a single page"""
+    with open(txt_path, 'r', encoding='utf-8') as file:
+        return [file.read()]
+
+
+def _plan_tasks(file_path: str, pages_per_task: int, allow_any_text: bool) -> list:
+    """Split a file into extraction tasks, one per page range for PDFs"""
+    if file_path.endswith('.pdf'):
+        page_count = count_pdf_pages(file_path)
+        return [
+            (extract_pdf_pages, (file_path, start, min(start + pages_per_task, page_count)))
+            for start in range(0, page_count, pages_per_task)
+        ]
+    if file_path.endswith('.txt') or allow_any_text:
+        return [(extract_text_file, (file_path,))]
+    raise ValueError("Unsupported file format. Use PDF or TXT files.")
+
+
+def _collect(file_path: str, futures) -> Tuple[str, Optional[List[str]], Optional[Exception]]:
+    """Wait for a file's tasks and join their pages in order"""
+    if isinstance(futures, Exception):
+        return file_path, None, futures
+    try:
+        pages = []
+        for future in futures:
+            pages.extend(future.result())
+        return file_path, pages, None
+    except Exception as e:
+        return file_path, None, e
+
+
+def iter_extracted_pages(file_paths: Iterable[str], max_workers: int = None, pages_per_task: int = 20,
+                         allow_any_text: bool = True) -> Iterator[Tuple[str, Optional[List[str]], Optional[Exception]]]:
+    """Extract files on a process pool, yielding (file_path, pages, error) in input order.
+
+    Large PDFs are split into page ranges of ``pages_per_task`` pages so a
+    single file is spread across workers. Results stream back as soon as
+    every earlier file is done, and at most a few tasks per worker are kept
+    in flight so the consumer can embed while extraction continues.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    max_pending = max_workers * 4
+    executor = ProcessPoolExecutor(max_workers=max_workers)
+    try:
+        pending = deque()
+        outstanding = 0
+        for file_path in file_paths:
+            try:
+                futures = [executor.submit(fn, *args) for fn, args in _plan_tasks(file_path, pages_per_task, allow_any_text)]
+                outstanding += len(futures)
+            except Exception as e:
+                futures = e
+            pending.append((file_path, futures))
+
+            while outstanding > max_pending:
+                head_path, head_futures = pending.popleft()
+                if isinstance(head_futures, list):
+                    outstanding -= len(head_futures)
+                yield _collect(head_path, head_futures)
+
+        while pending:
+            yield _collect(*pending.popleft())
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,82 @@
+import io
+import os
+import re
+from importlib.metadata import PackageNotFoundError, version
+from typing import Callable
+
+QUANTIZED_CACHE_DIR = ".quantized_models"
+
+
+def _conv1d_to_linear(model):
+    """Replace transformers' GPT-2 style Conv1D layers with equivalent nn.Linear layers.
+
+    Dynamic quantization only targets nn.Linear, and DialoGPT (GPT-2) keeps
+    almost all of its weights in Conv1D modules.
+    """
+    import torch
+    try:
+        from transformers.pytorch_utils import Conv1D
+    except ImportError:
+        return model
+
+    for name, module in list(model.named_modules()):
+        for child_name, child in list(module.named_children()):
+            if isinstance(child, Conv1D):
+                in_features, out_features = child.weight.shape
+                linear = torch.nn.Linear(in_features, out_features)
+                linear.weight.data = child.weight.data.t().contiguous()
+                linear.bias.data = child.bias.data
+                setattr(module, child_name, linear)
+    return model
+
+
+def quantize_int8(model):
+    """Dynamically quantize a model's Linear layers to int8 for CPU inference"""
+    import torch
+    model = _conv1d_to_linear(model)
+    model.eval()
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _library_versions() -> str:
+    """Versions of the libraries that define the module layout a cached state dict maps onto"""
+    versions = []
+    for package in ("torch", "transformers", "sentence-transformers"):
+        try:
+            versions.append(f"{package}-{version(package)}")
+        except PackageNotFoundError:
+            versions.append(f"{package}-none")
+    return ".".join(versions)
+
+
+def load_quantized(model_name: str, build_fn: Callable, cache_dir: str = QUANTIZED_CACHE_DIR,
+                   skeleton_fn: Callable = None):
+    """Return an int8 model, quantizing build_fn() once and caching its weights on disk.
+
+    Only the state dict is cached and it is read with weights_only=True, so
+    a file planted in the cache directory cannot run code. On a cache hit
+    the int8 module is rebuilt by quantizing skeleton_fn(), which should
+    construct the architecture without reading pretrained weights (build_fn
+    is used when it is not given), and the cached weights are loaded into it.
+    """
+    import torch
+    slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name)
+    path = os.path.join(cache_dir, f"{slug}.{_library_versions()}.int8-state.pt")
+    if os.path.exists(path):
+        model = quantize_int8((skeleton_fn or build_fn)())
+        model.load_state_dict(torch.load(path, weights_only=True))
+        return model
+
+    model = quantize_int8(build_fn())
+    os.makedirs(cache_dir, exist_ok=True)
+    torch.save(model.state_dict(), f"{path}.tmp")
+    os.replace(f"{path}.tmp", path)
+    return model
+
+
+def model_size_bytes(model) -> int:
+    """Serialized size of a model's weights, including packed int8 weights"""
+    import torch
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
@@ -0,0 +1,103 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Sequence
+
+import numpy as np
+
+
+class QueryCache:
+    """Bounded LRU/TTL cache of retrieval results.
+
+    Entries are keyed by normalized question text plus a caller-supplied
+    scope (index version, k). With ``semantic_threshold`` set, a miss on
+    the exact key falls back to the cached query whose embedding has the
+    highest cosine similarity, if it is at least the threshold.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: Optional[float] = 600.0,
+                 semantic_threshold: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.semantic_threshold = semantic_threshold
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # (scope, text) -> (timestamp, results, unit embedding)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        """Case- and whitespace-insensitive form of a question"""
+        return re.sub(r'\s+', ' ', question).strip().lower()
+
+    def _expired(self, timestamp: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - timestamp > self.ttl_seconds
+
+    def get(self, question: str, scope: Hashable) -> Any:
+        """Return cached results for an exact (normalized) question, or None"""
+        key = (scope, self.normalize(question))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry[0], now):
+                self._entries.pop(key, None)
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def get_similar(self, embedding: Sequence[float], scope: Hashable) -> Any:
+        """Return results of the most similar cached query above the threshold, or None"""
+        if self.semantic_threshold is None:
+            return None
+        query = self._unit(embedding)
+        now = time.monotonic()
+        with self._lock:
+            candidates = [
+                (key, entry) for key, entry in self._entries.items()
+                if key[0] == scope and entry[2] is not None and not self._expired(entry[0], now)
+            ]
+            if not candidates:
+                return None
+            similarities = np.stack([entry[2] for _, entry in candidates]) @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.semantic_threshold:
+                return None
+            key, entry = candidates[best]
+            self._entries.move_to_end(key)
+            self.semantic_hits += 1
+            return entry[1]
+
+    def put(self, question: str, scope: Hashable, results: Any, embedding: Sequence[float] = None):
+        """Cache results, evicting the least recently used entry when full"""
+        key = (scope, self.normalize(question))
+        unit = self._unit(embedding) if embedding is not None else None
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = (time.monotonic(), results, unit)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every entry, e.g. when the index changes"""
+        with self._lock:
+            self._entries.clear()
+
+    @staticmethod
+    def _unit(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def stats(self) -> dict:
+        """Hit/miss counters and occupancy"""
+        return {
+            'hits': self.hits,
+            'semantic_hits': self.semantic_hits,
+            'misses': self.misses,
+            'entries': len(self._entries),
+            'max_entries': self.max_entries
+        }
@@ -1,98 +1,519 @@
 import os
+import copy
+import json
+import time
+import pickle
 import logging
-from typing import List, Tuple
+import threading
+import weakref
+import numpy as np
+from typing import Iterator, List, Optional, Tuple
 import streamlit as st
+from index_manifest import IndexManifest
+from embedding_cache import EmbeddingCache, CachedEmbeddings, DEFAULT_CACHE_DIR
+from parallel_ingest import iter_extracted_pages
+from startup_timing import PhaseTimer, rss_bytes
+from query_cache import QueryCache
+from llm_generator import LLMGenerator
+from quantization import load_quantized
+from model_registry import ResourceRegistry, store_stamp
+from bm25_index import BM25Index, reciprocal_rank_fusion
+from tracing import Tracer, get_tracer
+from reranker import CrossEncoderReranker
+from dedup_index import NearDuplicateIndex
 
-try:
-    from langchain.document_loaders import DirectoryLoader, TextLoader, PyPDFLoader
-    from langchain.text_splitter import RecursiveCharacterTextSplitter
-    from langchain.embeddings import HuggingFaceEmbeddings
-    from langchain_community.document_loaders import DirectoryLoader, TextLoader, PyPDFLoader
-    from langchain_community.embeddings import HuggingFaceEmbeddings
-    from langchain_community.vectorstores import FAISS
-    from langchain_community.llms import HuggingFacePipeline
+_langchain_lock = threading.Lock()
+_langchain_loaded = False
 
-    from langchain.vectorstores import FAISS
-    from langchain.llms import HuggingFacePipeline
-    from langchain.chains import RetrievalQA
-    from langchain.schema import Document
-except ImportError as e:
-    st.error(f"Required packages not installed: {e}")
+def _import_langchain():
+    """Import the langchain stack on first use; it dominates startup time"""
+    global _langchain_loaded, DirectoryLoader, TextLoader, PyPDFLoader, RecursiveCharacterTextSplitter
+    global HuggingFaceEmbeddings, FAISS, HuggingFacePipeline, RetrievalQA, Document
+    with _langchain_lock:
+        if _langchain_loaded:
+            return
+        try:
+            from langchain.document_loaders import DirectoryLoader, TextLoader, PyPDFLoader
+            from langchain.text_splitter import RecursiveCharacterTextSplitter
+            from langchain.embeddings import HuggingFaceEmbeddings
+            from langchain_community.document_loaders import DirectoryLoader, TextLoader, PyPDFLoader
+            from langchain_community.embeddings import HuggingFaceEmbeddings
+            from langchain_community.vectorstores import FAISS
+            from langchain_community.llms import HuggingFacePipeline
+
+            from langchain.vectorstores import FAISS
+            from langchain.llms import HuggingFacePipeline
+            from langchain.chains import RetrievalQA
+            from langchain.schema import Document
+            from langchain.embeddings.base import Embeddings
+            Embeddings.register(CachedEmbeddings)
+            _langchain_loaded = True
+        except ImportError as e:
+            st.error(f"Required packages not installed: {e}")
+
+def _release_leases(registry: ResourceRegistry, leases: dict):
+    """Return every shared resource a chatbot holds to the registry"""
+    for key in leases.values():
+        registry.release(key)
+    leases.clear()
 
 class RAGChatbot:
-    def __init__(self, use_simple_llm=True):
+    def __init__(self, use_simple_llm=True, cache_dir: str = DEFAULT_CACHE_DIR,
+                 ingest_workers: int = 0, embed_batch_size: int = 256, timings: PhaseTimer = None,
+                 query_cache_size: int = 256, query_cache_ttl: float = 600.0,
+                 semantic_cache_threshold: float = None, generation_scheduler=None, quantize: bool = False,
+                 registry: ResourceRegistry = None, retrieval_mode: str = "dense", tracer: Tracer = None,
+                 rerank: bool = False, rerank_candidates: int = 20, rerank_budget_ms: float = 200.0,
+                 context_k: int = 3, dedup_threshold: float = None):
         self.vector_store = None
         self.qa_chain = None
         self.is_initialized = False
         self.use_simple_llm = use_simple_llm
-        self.embeddings = None
+        self.manifest = None
+        self.cache_dir = cache_dir
+        # int8 dynamic quantization of the embedding and generation models
+        self.quantize = quantize
+        # 0 extracts files in-process with LangChain loaders; >0 uses a process pool
+        self.ingest_workers = ingest_workers
+        self.embed_batch_size = embed_batch_size
+        # Embeddings (and langchain itself) are loaded on first use
+        self.timings = timings or PhaseTimer()
+        # Per-stage spans and counters; the process tracer is a no-op unless enabled
+        self.tracer = tracer or get_tracer()
+        self._embeddings = None
+        self._embeddings_lock = threading.Lock()
+        self._warm_up_thread = None
+        self._generator = None
+        # Optional BatchingScheduler shared by several chatbots (e.g. Streamlit sessions)
+        self.generation_scheduler = generation_scheduler
+        # Retrieval results keyed by question and index version; a threshold
+        # such as 0.95 also reuses results for near-duplicate questions
+        self.index_version = 0
+        self.query_cache = QueryCache(query_cache_size, query_cache_ttl, semantic_cache_threshold)
+        # "dense", "bm25" (keyword only, no query embedding) or "hybrid" (rank fusion of both)
+        self.retrieval_mode = retrieval_mode
+        # Two-stage retrieval: fetch rerank_candidates chunks, keep the context_k
+        # the cross-encoder scores highest within the per-query budget
+        self.rerank = rerank
+        self.rerank_candidates = rerank_candidates
+        self.rerank_budget_ms = rerank_budget_ms
+        self._reranker = None
+        # Chunks passed to generation and shown as sources
+        self.context_k = context_k
+        # With a threshold (e.g. 0.9), chunks whose estimated Jaccard similarity
+        # to an indexed chunk reaches it are not embedded; the indexed chunk
+        # lists them under metadata["duplicates"]
+        self.dedup_threshold = dedup_threshold
+        self._dedup = None
+        # Chunks and bytes skipped as near-duplicates by the last load_documents
+        self.dedup_stats = {}
+        # BM25 index over the docstore chunks, kept current as chunks are added and
+        # deleted (deleted ids become None) and rebuilt lazily after other changes
+        self._bm25 = None
+        self._bm25_ids = []
+        self._bm25_version = None
+        self._bm25_deleted = 0
+        # Set when the FAISS index is memory-mapped from disk; it is copied before any write
+        self._index_mmapped = False
+        # Mode, seconds and RSS of the last load_vector_store
+        self.load_stats = {}
+        # With a registry, models and saved vector stores are shared read-only
+        # with other chatbots in the process; leases maps role -> registry key
+        self.registry = registry
+        self._leases = {}
+        if registry is not None:
+            weakref.finalize(self, _release_leases, registry, self._leases)
+    
+    def _lease(self, role: str, key, loader):
+        """Acquire a shared resource from the registry, replacing any held for the same role"""
+        value = self.registry.acquire(key, loader)
+        self._release(role)
+        self._leases[role] = key
+        return value
+    
+    def _release(self, role: str):
+        if role in self._leases:
+            self.registry.release(self._leases.pop(role))
+    
+    def close(self):
+        """Release shared models and indexes held through the registry"""
+        if self.registry is not None:
+            _release_leases(self.registry, self._leases)
+    
+    @property
+    def embeddings(self):
+        """Embedding model, constructed on first access"""
+        with self._embeddings_lock:
+            if self._embeddings is None:
+                with self.timings.phase("import"):
+                    _import_langchain()
+                
+                # Initialize embeddings
+                try:
+                    with self.timings.phase("model load"):
+                        model_name = "sentence-transformers/all-MiniLM-L6-v2"
+                        cache_name = f"{model_name}-int8" if self.quantize else model_name
+                        
+                        def load():
+                            if self.quantize:
+                                # SentenceTransformer has no weight-free constructor, so the fp32 model is also
+                                # the skeleton a cached int8 state dict is loaded into
+                                from sentence_transformers import SentenceTransformer
+                                client = load_quantized(model_name, lambda: SentenceTransformer(model_name, device="cpu"))
+                                # Skips __init__, which would load a second fp32 model
+                                construct = getattr(HuggingFaceEmbeddings, "model_construct", None) or HuggingFaceEmbeddings.construct
+                                embeddings = construct(model_name=model_name, client=client)
+                            else:
+                                embeddings = HuggingFaceEmbeddings(model_name=model_name)
+                            if self.cache_dir:
+                                embeddings = CachedEmbeddings(embeddings, EmbeddingCache(cache_name, self.cache_dir))
+                            return embeddings
+                        
+                        if self.registry is not None:
+                            self._embeddings = self._lease("embeddings", ("embeddings", cache_name, self.cache_dir), load)
+                        else:
+                            self._embeddings = load()
+                except Exception as e:
+                    st.error(f"Failed to initialize embeddings: {e}")
+            return self._embeddings
+    
+    @property
+    def generator(self) -> LLMGenerator:
+        """Generative model used when use_simple_llm is False, loaded on first use"""
+        if self._generator is None:
+            if self.registry is not None:
+                self._generator = self._lease("generator", ("generator", self.quantize),
+                                              lambda: LLMGenerator(quantize=self.quantize))
+            else:
+                self._generator = LLMGenerator(quantize=self.quantize)
+        return self._generator
+    
+    @property
+    def reranker(self) -> CrossEncoderReranker:
+        """Cross-encoder used when rerank is set, loaded on first use"""
+        if self._reranker is None:
+            if self.registry is not None:
+                self._reranker = self._lease("reranker", ("reranker",), CrossEncoderReranker)
+            else:
+                self._reranker = CrossEncoderReranker()
+        return self._reranker
+    
+    def start_warm_up(self, vector_store_path: str = None) -> threading.Thread:
+        """Load the embedding model, and optionally a saved index, on a background thread"""
+        def warm_up():
+            if self.embeddings and vector_store_path and os.path.exists(vector_store_path):
+                self.load_vector_store(vector_store_path)
+            if not self.use_simple_llm:
+                with self.timings.phase("generator load"):
+                    self.generator.warm_up()
         
-        # Initialize embeddings
-        try:
-            self.embeddings = HuggingFaceEmbeddings(
-                model_name="sentence-transformers/all-MiniLM-L6-v2"
-            )
-        except Exception as e:
-            st.error(f"Failed to initialize embeddings: {e}")
+        self._warm_up_thread = threading.Thread(target=warm_up, name="rag-warm-up", daemon=True)
+        self._warm_up_thread.start()
+        return self._warm_up_thread
+    
+    def wait_until_ready(self):
+        """Block until a background warm-up, if any, has finished"""
+        if self._warm_up_thread is not None:
+            self._warm_up_thread.join()
+    
+    def _load_file(self, file_path: str) -> List["Document"]:
+        """Load a single file into LangChain documents"""
+        if file_path.endswith('.txt'):
+            loader = TextLoader(file_path, encoding='utf-8')
+            return loader.load()
+        elif file_path.endswith('.pdf'):
+            loader = PyPDFLoader(file_path)
+            return loader.load()
+        else:
+            # Try to read as text file
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+                return [Document(page_content=content, metadata={"source": file_path})]
+    
+    def _iter_loaded_files(self, folder_path: str, files: List[str]) -> Iterator[Tuple[str, Optional[List["Document"]], Optional[Exception]]]:
+        """Yield (file, documents, error) for each file in order"""
+        if self.ingest_workers <= 0:
+            for file in files:
+                try:
+                    with self.tracer.span("extract"):
+                        docs = self._load_file(os.path.join(folder_path, file))
+                    yield file, docs, None
+                except Exception as e:
+                    yield file, None, e
+            return
+        
+        # Fan out across files and PDF page ranges; results stream back in order.
+        # Extraction runs in the worker processes, so it is not traced here
+        file_paths = [os.path.join(folder_path, file) for file in files]
+        for file, (file_path, pages, error) in zip(files, iter_extracted_pages(file_paths, self.ingest_workers)):
+            if error is not None:
+                yield file, None, error
+            elif file_path.endswith('.pdf'):
+                yield file, [Document(page_content=text, metadata={"source": file_path, "page": i})
+                             for i, text in enumerate(pages)], None
+            else:
+                yield file, [Document(page_content=pages[0], metadata={"source": file_path})], None
+    
+    def _add_splits(self, splits: List["Document"], ids: List[str]):
+        """Embed a batch of chunks into the vector store"""
+        texts = [doc.page_content for doc in splits]
+        metadatas = [doc.metadata for doc in splits]
+        # Embedding and index insertion are timed separately
+        with self.tracer.span("embed"):
+            text_embeddings = list(zip(texts, self.embeddings.embed_documents(texts)))
+        with self.tracer.span("index_add"):
+            if self.vector_store:
+                self.vector_store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+            else:
+                self.vector_store = FAISS.from_embeddings(text_embeddings, self.embeddings, metadatas=metadatas, ids=ids)
+        self.tracer.count("chunks_indexed", len(splits))
+        self._index_changed(added=list(zip(ids, texts)))
+    
+    def _near_duplicates(self) -> NearDuplicateIndex:
+        """MinHash index of the indexed chunks, brought in sync with the docstore"""
+        if self._dedup is None or self._dedup.threshold != self.dedup_threshold:
+            self._dedup = NearDuplicateIndex(self.dedup_threshold)
+        indexed = set(self.vector_store.index_to_docstore_id.values()) if self.vector_store else set()
+        for doc_id in [doc_id for doc_id in self._dedup.signatures if doc_id not in indexed]:
+            self._dedup.remove(doc_id)
+        for doc_id in indexed:
+            if doc_id not in self._dedup:
+                self._dedup.add(doc_id, self._dedup.signature(self.vector_store.docstore.search(doc_id).page_content))
+        return self._dedup
+    
+    def _drop_near_duplicates(self, splits: List["Document"], ids: List[str],
+                              references: dict) -> Tuple[List["Document"], List[str]]:
+        """Keep chunks unlike anything indexed or kept so far; record the others under their match's id.
+        
+        Expects _near_duplicates() to have synced the index for this load.
+        """
+        dedup = self._dedup
+        kept, kept_ids = [], []
+        for doc, doc_id in zip(splits, ids):
+            signature = dedup.signature(doc.page_content)
+            match = dedup.query(signature)
+            if match is None:
+                dedup.add(doc_id, signature)
+                kept.append(doc)
+                kept_ids.append(doc_id)
+            else:
+                references.setdefault(match, []).append({"id": doc_id, **doc.metadata})
+                self.dedup_stats['chunks'] += 1
+                self.dedup_stats['bytes'] += len(doc.page_content.encode('utf-8'))
+        return kept, kept_ids
+    
+    def _attach_duplicates(self, references: dict):
+        """Add skipped duplicates' source references to the chunks that stand in for them"""
+        docstore = self.vector_store.docstore
+        for doc_id, refs in references.items():
+            doc = docstore.search(doc_id)
+            # Replaced rather than mutated; the Document may be shared with other sessions
+            docstore._dict[doc_id] = Document(page_content=doc.page_content,
+                                              metadata={**doc.metadata, "duplicates": doc.metadata.get("duplicates", []) + refs})
+        # Cached results hold the old Documents; chunk texts are unchanged, so BM25 stays current
+        self._index_changed(added=[])
+    
+    def _delete_chunks(self, ids: List[str]):
+        """Delete chunks by id, keeping content that other files' duplicates still point to.
+        
+        A deleted chunk with surviving duplicates is re-added under the first
+        survivor's id and metadata (reusing its vector); references to deleted
+        duplicates are dropped from the chunks that remain.
+        """
+        store = self.vector_store
+        stale = set(ids)
+        present = [doc_id for doc_id in ids if doc_id in store.docstore._dict]
+        positions = {doc_id: i for i, doc_id in store.index_to_docstore_id.items()}
+        promoted, promoted_ids, promoted_metadata = [], [], []
+        for doc_id in present:
+            doc = store.docstore.search(doc_id)
+            survivors = [ref for ref in doc.metadata.get("duplicates", []) if ref["id"] not in stale]
+            if survivors:
+                first, rest = survivors[0], survivors[1:]
+                metadata = {key: value for key, value in first.items() if key != "id"}
+                if rest:
+                    metadata["duplicates"] = rest
+                promoted.append((doc.page_content, store.index.reconstruct(positions[doc_id]).tolist()))
+                promoted_ids.append(first["id"])
+                promoted_metadata.append(metadata)
+        if present:
+            store.delete(present)
+        if promoted:
+            store.add_embeddings(promoted, metadatas=promoted_metadata, ids=promoted_ids)
+        
+        for doc_id, doc in list(store.docstore._dict.items()):
+            refs = doc.metadata.get("duplicates")
+            if refs and any(ref["id"] in stale for ref in refs):
+                metadata = dict(doc.metadata)
+                metadata["duplicates"] = [ref for ref in refs if ref["id"] not in stale]
+                if not metadata["duplicates"]:
+                    del metadata["duplicates"]
+                store.docstore._dict[doc_id] = Document(page_content=doc.page_content, metadata=metadata)
+        self._index_changed(added=[(doc_id, text) for doc_id, (text, _) in zip(promoted_ids, promoted)],
+                            deleted=present)
+    
+    def _detach_store(self):
+        """Replace a shared or memory-mapped vector store with a private in-memory copy before modifying it"""
+        import faiss
+        shared = self.vector_store
+        store = copy.copy(shared)
+        # clone_index would keep viewing a memory-mapped index's data
+        store.index = faiss.deserialize_index(faiss.serialize_index(shared.index))
+        store.docstore = copy.copy(shared.docstore)
+        store.docstore._dict = dict(shared.docstore._dict)
+        store.index_to_docstore_id = dict(shared.index_to_docstore_id)
+        self.vector_store = store
+        self.manifest = copy.deepcopy(self.manifest)
+        if self._bm25 is not None:
+            # The keyword index is updated in place, so it may not stay shared either
+            self._bm25 = copy.deepcopy(self._bm25)
+            self._bm25_ids = list(self._bm25_ids)
+        self._index_mmapped = False
+        self._release("vector_store")
     
-    def load_documents(self, folder_path: str) -> bool:
-        """Load documents from folder"""
+    def _index_changed(self, added: List[Tuple[str, str]] = None, deleted: List[str] = None):
+        """Invalidate cached retrieval results after the index is modified.
+        
+        When the change is described by added (id, text) pairs and deleted
+        ids (empty lists for metadata-only changes), a current BM25 index
+        is updated in place; otherwise it is rebuilt on next use.
+        """
+        in_sync = self._bm25 is not None and self._bm25_version == self.index_version
+        self.index_version += 1
+        self.query_cache.clear()
+        if in_sync and (added is not None or deleted is not None):
+            if deleted:
+                positions = {doc_id: i for i, doc_id in enumerate(self._bm25_ids)}
+                for doc_id in deleted:
+                    if positions.get(doc_id) is not None:
+                        self._bm25_ids[positions[doc_id]] = None
+                        self._bm25_deleted += 1
+            if added:
+                self._bm25.add(text for _, text in added)
+                self._bm25_ids.extend(doc_id for doc_id, _ in added)
+            self._bm25_version = self.index_version
+    
+    def _reset_keyword_index(self):
+        """Start an empty BM25 index for a store being built from scratch"""
+        self._bm25, self._bm25_ids, self._bm25_deleted = BM25Index(), [], 0
+        self._bm25_version = self.index_version
+    
+    def _keyword_index(self) -> BM25Index:
+        """BM25 index over the vector store's chunks, rebuilt when stale or a quarter deleted"""
+        if self._bm25_version != self.index_version or self._bm25_deleted * 4 > len(self._bm25_ids):
+            store = self.vector_store
+            ids = list(store.index_to_docstore_id.values())
+            bm25 = BM25Index()
+            bm25.add(store.docstore.search(doc_id).page_content for doc_id in ids)
+            bm25.compact()
+            self._bm25, self._bm25_ids, self._bm25_version = bm25, ids, self.index_version
+            self._bm25_deleted = 0
+        return self._bm25
+    
+    @staticmethod
+    def _read_keyword_index(path: str) -> Optional[Tuple[BM25Index, List[str]]]:
+        """Saved BM25 index and its docstore ids, or None for stores saved without one"""
+        prefix = os.path.join(path, "bm25")
+        if not BM25Index.exists(prefix):
+            return None
+        with open(f"{prefix}.ids.json", 'r', encoding='utf-8') as f:
+            return BM25Index.load(prefix), json.load(f)
+    
+    def load_documents(self, folder_path: str, incremental: bool = True) -> bool:
+        """Load documents from folder.
+        
+        When a vector store with a manifest is already loaded, only new or
+        modified files are parsed and embedded, and chunks belonging to
+        modified or deleted files are removed from the index.
+        """
         try:
             if not os.path.exists(folder_path):
                 st.error(f"Folder path does not exist: {folder_path}")
                 return False
             
             # Check if folder has any files
-            files = os.listdir(folder_path)
+            files = sorted(f for f in os.listdir(folder_path) if os.path.isfile(os.path.join(folder_path, f)))
             if not files:
                 st.error(f"No files found in folder: {folder_path}")
                 return False
             
-            documents = []
+            if not self.embeddings:
+                st.error("Embeddings not initialized")
+                return False
             
-            # Load different file types
-            for file in files:
-                file_path = os.path.join(folder_path, file)
-                try:
-                    if file.endswith('.txt'):
-                        loader = TextLoader(file_path, encoding='utf-8')
-                        docs = loader.load()
-                        documents.extend(docs)
-                    elif file.endswith('.pdf'):
-                        loader = PyPDFLoader(file_path)
-                        docs = loader.load()
-                        documents.extend(docs)
-                    else:
-                        # Try to read as text file
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            content = f.read()
-                            doc = Document(page_content=content, metadata={"source": file_path})
-                            documents.append(doc)
-                except Exception as e:
-                    st.warning(f"Could not load file {file}: {e}")
-                    continue
+            if not (incremental and self.vector_store and self.manifest):
+                # Nothing to diff against; rebuild from scratch
+                self.vector_store = None
+                self.manifest = IndexManifest()
+                self._release("vector_store")
+                self._index_changed()
+                self._reset_keyword_index()
+            elif "vector_store" in self._leases or self._index_mmapped:
+                # Other sessions keep searching the shared copy
+                self._detach_store()
             
-            if not documents:
-                st.error("No documents could be loaded. Check file formats.")
-                return False
+            unchanged, removed, changed = self.manifest.diff(folder_path, files)
+            
+            # Drop chunks of deleted and modified files
+            stale_ids = []
+            for file in removed + [f for f in changed if f in self.manifest.files]:
+                stale_ids.extend(self.manifest.forget(file))
+            if stale_ids and self.vector_store:
+                self._delete_chunks(stale_ids)
+            
+            # Near-duplicates of indexed or earlier chunks are skipped before embedding
+            references = {}
+            self.dedup_stats = {'chunks': 0, 'bytes': 0}
+            if self.dedup_threshold is not None:
+                self._near_duplicates()
             
-            # Split documents
             text_splitter = RecursiveCharacterTextSplitter(
                 chunk_size=1000,
                 chunk_overlap=200
             )
-            splits = text_splitter.split_documents(documents)
             
-            # Create vector store
-            if self.embeddings:
-                self.vector_store = FAISS.from_documents(splits, self.embeddings)
-                self._initialize_qa_chain()
-                self.is_initialized = True
-                st.success(f"Loaded {len(documents)} documents with {len(splits)} chunks")
-                return True
-            else:
-                st.error("Embeddings not initialized")
+            # Load and split only new or modified files, embedding in batches
+            # while later files are still being extracted
+            splits, split_ids = [], []
+            loaded = total_splits = 0
+            for file, docs, error in self._iter_loaded_files(folder_path, list(changed)):
+                if error is not None:
+                    st.warning(f"Could not load file {file}: {error}")
+                    continue
+                loaded += 1
+                content_hash = changed[file]
+                with self.tracer.span("chunk"):
+                    file_splits = text_splitter.split_documents(docs)
+                ids = IndexManifest.chunk_ids(file, content_hash, len(file_splits))
+                self.manifest.record(folder_path, file, content_hash, ids)
+                if self.dedup_threshold is not None:
+                    file_splits, ids = self._drop_near_duplicates(file_splits, ids, references)
+                splits.extend(file_splits)
+                split_ids.extend(ids)
+                total_splits += len(file_splits)
+                if len(splits) >= self.embed_batch_size:
+                    self._add_splits(splits, split_ids)
+                    splits, split_ids = [], []
+            
+            if splits:
+                self._add_splits(splits, split_ids)
+            if references:
+                self._attach_duplicates(references)
+                self.tracer.count("duplicates_skipped", self.dedup_stats['chunks'])
+            
+            if not self.manifest.files or not self.vector_store:
+                st.error("No documents could be loaded. Check file formats.")
                 return False
+            
+            self._initialize_qa_chain()
+            self.is_initialized = True
+            st.success(
+                f"Loaded {loaded} documents with {total_splits} chunks "
+                f"({len(unchanged)} unchanged, {len(removed)} removed)"
+                + (f"; skipped {self.dedup_stats['chunks']} near-duplicate chunks "
+                   f"({self.dedup_stats['bytes'] / 1e3:.1f} KB)" if self.dedup_stats['chunks'] else "")
+            )
+            return True
                 
         except Exception as e:
             st.error(f"Error loading documents: {e}")
@@ -102,16 +523,76 @@ class RAGChatbot:
         """Save vector store to disk"""
         try:
             if self.vector_store:
+                if self._index_mmapped:
+                    # Rewriting a file the index is mapped from would invalidate the mapping
+                    self._detach_store()
                 self.vector_store.save_local(path)
+                if self.manifest:
+                    self.manifest.save(path)
+                # Persist a current keyword index so loading does not re-tokenize every chunk;
+                # a stale one is only rebuilt here when the retrieval mode uses it
+                prefix = os.path.join(path, "bm25")
+                if (self._bm25 is not None and self._bm25_version == self.index_version) or self.retrieval_mode != "dense":
+                    self._keyword_index().save(prefix)
+                    with open(f"{prefix}.ids.json", 'w', encoding='utf-8') as f:
+                        json.dump(self._bm25_ids, f)
+                else:
+                    for stale in (f"{prefix}.bm25.npz", f"{prefix}.bm25.json", f"{prefix}.ids.json"):
+                        if os.path.exists(stale):
+                            os.remove(stale)
                 st.success("Vector store saved successfully!")
         except Exception as e:
             st.error(f"Error saving vector store: {e}")
     
-    def load_vector_store(self, path: str):
-        """Load vector store from disk"""
+    @staticmethod
+    def _read_faiss_store(path: str, embeddings, mmap: bool) -> "FAISS":
+        """Load a LangChain FAISS store, optionally memory-mapping the index data"""
+        if not mmap:
+            return FAISS.load_local(path, embeddings)
+        import faiss
+        index = faiss.read_index(os.path.join(path, "index.faiss"),
+                                 getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP))
+        # Same layout FAISS.save_local writes; the docstore is still read into memory
+        with open(os.path.join(path, "index.pkl"), 'rb') as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        return FAISS(embeddings, index, docstore, index_to_docstore_id)
+    
+    def load_vector_store(self, path: str, mmap: bool = False):
+        """Load vector store from disk.
+        
+        By default the FAISS index is read into memory. With mmap=True (opt-in,
+        like VectorStore.load and --mmap) it is memory-mapped, so processes
+        loading the same store share the page cache; it is copied into memory
+        before documents are added or the store is saved.
+        """
         try:
             if os.path.exists(path) and self.embeddings:
-                self.vector_store = FAISS.load_local(path, self.embeddings)
+                embeddings = self.embeddings
+                start = time.perf_counter()
+                with self.timings.phase("index load"):
+                    if self.registry is not None:
+                        # Keyed by file times so a re-saved store is loaded afresh
+                        key = ("vector_store", os.path.abspath(path), store_stamp(path), id(embeddings), mmap)
+                        self.vector_store, self.manifest, keyword = self._lease(
+                            "vector_store", key,
+                            lambda: (self._read_faiss_store(path, embeddings, mmap), IndexManifest.load(path),
+                                     self._read_keyword_index(path))
+                        )
+                    else:
+                        self.vector_store = self._read_faiss_store(path, embeddings, mmap)
+                        self.manifest = IndexManifest.load(path)
+                        keyword = self._read_keyword_index(path)
+                self._index_mmapped = mmap
+                self.load_stats = {
+                    'mode': 'mmap' if mmap else 'read',
+                    'seconds': time.perf_counter() - start,
+                    'rss_bytes': rss_bytes()
+                }
+                self._index_changed()
+                if keyword is not None:
+                    self._bm25, self._bm25_ids = keyword
+                    self._bm25_version = self.index_version
+                    self._bm25_deleted = self._bm25_ids.count(None)
                 self._initialize_qa_chain()
                 self.is_initialized = True
                 return True
@@ -127,25 +608,46 @@ class RAGChatbot:
         try:
             if self.vector_store:
                 # Simple retriever
-                self.retriever = self.vector_store.as_retriever(search_kwargs={"k": 3})
+                self.retriever = self.vector_store.as_retriever(search_kwargs={"k": self.context_k})
                 st.success("QA chain initialized successfully!")
         except Exception as e:
             st.error(f"Error initializing QA chain: {e}")
     
     def ask_question(self, question: str) -> str:
         """Ask a question and get answer"""
+        return "".join(self.ask_question_stream(question))
+    
+    def ask_question_stream(self, question: str, max_new_tokens: int = 128) -> Iterator[str]:
+        """Ask a question and yield the answer incrementally"""
         try:
             if not self.is_initialized:
-                return "Please load documents first."
+                yield "Please load documents first."
+                return
+            self.tracer.count("questions")
             
             # Get relevant documents
-            relevant_docs = self.retriever.get_relevant_documents(question)
+            relevant_docs = [doc for doc, _ in self._retrieve(question)]
             
             if not relevant_docs:
-                return "No relevant information found in the documents."
+                yield "No relevant information found in the documents."
+                return
+            
+            if not self.use_simple_llm:
+                with self.tracer.span("context"):
+                    contexts = [doc.page_content for doc in relevant_docs]
+                if self.generation_scheduler is not None:
+                    # Batched with other callers' prompts; the answer arrives whole
+                    with self.tracer.span("generate"):
+                        answer = self.generation_scheduler.submit(question, contexts, max_new_tokens).result()
+                    yield answer
+                else:
+                    # LLMGenerator traces its own prefill and generate stages
+                    yield from self.generator.stream_response(question, contexts, max_new_tokens)
+                return
             
             # Simple response generation (without LLM)
-            context = "\n".join([doc.page_content[:500] for doc in relevant_docs[:2]])
+            with self.tracer.span("context"):
+                context = "\n".join([doc.page_content[:500] for doc in relevant_docs[:2]])
             
             response = f"""Based on the documents, here's what I found:
 
@@ -153,10 +655,11 @@ class RAGChatbot:
 
 This information is extracted from your documents and may help answer your question: "{question}"
 """
-            return response
+            yield response
             
         except Exception as e:
-            return f"Error processing question: {e}"
+            self.tracer.count("question_errors")
+            yield f"Error processing question: {e}"
     
     def get_relevant_contexts(self, question: str) -> List[Tuple[str, float]]:
         """Get relevant contexts with scores"""
@@ -165,9 +668,177 @@ This information is extracted from your documents and may help answer your quest
                 return []
             
             # Get documents with scores
-            docs_with_scores = self.vector_store.similarity_search_with_score(question, k=3)
+            docs_with_scores = self._retrieve(question)
             return [(doc.page_content, score) for doc, score in docs_with_scores]
             
         except Exception as e:
             st.error(f"Error getting contexts: {e}")
             return []
+    
+    def retrieve(self, question: str, k: int = None) -> List[Tuple[str, float]]:
+        """Relevant contexts with scores for API callers; unlike get_relevant_contexts, errors are raised.
+        
+        k defaults to context_k. Raises RuntimeError before a vector store is loaded.
+        """
+        if not self.is_initialized:
+            raise RuntimeError("Chatbot is not initialized")
+        return [(doc.page_content, score) for doc, score in self._retrieve(question, k)]
+    
+    def _retrieve(self, question: str, k: int = None) -> List[Tuple["Document", float]]:
+        """Search shared by ask_question and get_relevant_contexts, served from the query cache when possible.
+        
+        k defaults to context_k. Scores are L2 distances in dense mode, BM25
+        scores in bm25 mode, fused reciprocal-rank scores in hybrid mode and
+        cross-encoder scores (higher is better) when reranking.
+        """
+        k = k or self.context_k
+        scope = (self.index_version, k, self.retrieval_mode, self.rerank)
+        cached = self.query_cache.get(question, scope)
+        if cached is not None:
+            self.tracer.count("query_cache_hits")
+            return cached
+        
+        # Embedded here rather than inside similarity_search_with_score so the stages are timed separately
+        embedding = embedding_to_cache = None
+        if self.retrieval_mode != "bm25":
+            with self.tracer.span("embed_query"):
+                embedding = self.embeddings.embed_query(question)
+            if self.query_cache.semantic_threshold is not None:
+                # Semantic tier: the query embedding is needed for the lookup and reused for the search
+                embedding_to_cache = embedding
+                cached = self.query_cache.get_similar(embedding, scope)
+                if cached is not None:
+                    self.tracer.count("query_cache_hits")
+                    return cached
+        
+        if not self.rerank:
+            results = self._first_stage(question, embedding, k)
+        else:
+            # A wider, cheap candidate set narrowed down by the cross-encoder
+            candidates = self._first_stage(question, embedding, max(self.rerank_candidates, k))
+            results = self._rerank(question, candidates, k)
+        self.query_cache.put(question, scope, results, embedding_to_cache)
+        return results
+    
+    def _rerank(self, question: str, candidates: List[Tuple["Document", float]], k: int) -> List[Tuple["Document", float]]:
+        """Top k candidates by cross-encoder score"""
+        ranked = self.reranker.rerank(question, [doc.page_content for doc, _ in candidates], k,
+                                      self.rerank_budget_ms)
+        return [(candidates[i][0], score) for i, score in ranked]
+    
+    def _first_stage(self, question: str, embedding: Optional[List[float]], k: int) -> List[Tuple["Document", float]]:
+        """Top k chunks from the configured retrieval mode"""
+        if self.retrieval_mode == "bm25":
+            return self._keyword_search(question, k)
+        
+        # Hybrid mode fuses a deeper candidate list from each retriever
+        fetch_k = 4 * k if self.retrieval_mode == "hybrid" else k
+        with self.tracer.span("search"):
+            results = self.vector_store.similarity_search_with_score_by_vector(embedding, k=fetch_k)
+        return self._fuse_keyword(question, results, k)
+    
+    def _first_stage_batch(self, questions: List[str], k: int) -> List[List[Tuple["Document", float]]]:
+        """_first_stage for several questions, embedded in one call and searched with one FAISS query matrix"""
+        if self.retrieval_mode == "bm25":
+            return [self._keyword_search(question, k) for question in questions]
+        
+        store = self.vector_store
+        fetch_k = 4 * k if self.retrieval_mode == "hybrid" else k
+        with self.tracer.span("embed_query"):
+            if isinstance(self.embeddings, CachedEmbeddings):
+                vectors = self.embeddings.embed_queries(questions)
+            else:
+                vectors = self.embeddings.embed_documents(questions)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if getattr(store, "_normalize_L2", False):
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        
+        with self.tracer.span("search"):
+            scores, indices = store.index.search(vectors, fetch_k)
+        results = []
+        for question, row_scores, row_indices in zip(questions, scores, indices):
+            hits = [(store.docstore.search(store.index_to_docstore_id[idx]), score)
+                    for score, idx in zip(row_scores, row_indices) if idx != -1]
+            results.append(self._fuse_keyword(question, hits, k))
+        return results
+    
+    def _fuse_keyword(self, question: str, results: List[Tuple["Document", float]], k: int) -> List[Tuple["Document", float]]:
+        """In hybrid mode, fuse dense results with BM25 hits by reciprocal rank; otherwise return them as-is"""
+        if self.retrieval_mode != "hybrid":
+            return results
+        keyword = self._keyword_search(question, 4 * k)
+        docs = {}
+        for doc, _ in results + keyword:
+            docs.setdefault(doc.page_content, doc)
+        fused = reciprocal_rank_fusion([
+            [doc.page_content for doc, _ in results],
+            [doc.page_content for doc, _ in keyword]
+        ])
+        return [(docs[text], score) for text, score in fused[:k]]
+    
+    def _keyword_search(self, question: str, k: int) -> List[Tuple["Document", float]]:
+        """BM25 search over the docstore; no query embedding is computed"""
+        bm25 = self._keyword_index()
+        docstore = self.vector_store.docstore
+        with self.tracer.span("keyword_search"):
+            # Deleted chunks keep their BM25 ids until the next rebuild
+            hits = bm25.search(question, k + self._bm25_deleted)
+        return [(docstore.search(self._bm25_ids[idx]), score) for idx, score in hits
+                if self._bm25_ids[idx] is not None][:k]
+    
+    def search_batch(self, questions: List[str], k: int = None, batch_size: int = 64) -> List[List[Tuple[str, float]]]:
+        """Get relevant contexts with scores for many questions at once.
+        
+        Each micro-batch is embedded in one call and searched with a single
+        FAISS query matrix; bm25 and hybrid modes add per-question keyword
+        search and reranking scores each question's widened candidate set.
+        k defaults to context_k and results have the same shape, ranking
+        and scores as get_relevant_contexts.
+        """
+        try:
+            if not self.is_initialized:
+                return [[] for _ in questions]
+            
+            k = k or self.context_k
+            fetch_k = max(self.rerank_candidates, k) if self.rerank else k
+            results = []
+            for start in range(0, len(questions), batch_size):
+                batch = questions[start:start + batch_size]
+                for question, hits in zip(batch, self._first_stage_batch(batch, fetch_k)):
+                    if self.rerank:
+                        hits = self._rerank(question, hits, k)
+                    results.append([(doc.page_content, score) for doc, score in hits])
+            return results
+            
+        except Exception as e:
+            st.error(f"Error getting contexts: {e}")
+            return [[] for _ in questions]
+            
+            store = self.vector_store
+            results = []
+            for start in range(0, len(questions), batch_size):
+                batch = questions[start:start + batch_size]
+                with self.tracer.span("embed_query"):
+                    if isinstance(self.embeddings, CachedEmbeddings):
+                        vectors = self.embeddings.embed_queries(batch)
+                    else:
+                        vectors = self.embeddings.embed_documents(batch)
+                vectors = np.asarray(vectors, dtype=np.float32)
+                if getattr(store, "_normalize_L2", False):
+                    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+                
+                with self.tracer.span("search"):
+                    scores, indices = store.index.search(vectors, k)
+                for row_scores, row_indices in zip(scores, indices):
+                    contexts = []
+                    for score, idx in zip(row_scores, row_indices):
+                        if idx == -1:
+                            continue
+                        doc = store.docstore.search(store.index_to_docstore_id[idx])
+                        contexts.append((doc.page_content, score))
+                    results.append(contexts)
+            return results
+            
+        except Exception as e:
+            st.error(f"Error getting contexts: {e}")
+            return [[] for _ in questions]
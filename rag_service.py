@@ -0,0 +1,323 @@
+"""Asyncio service layer and minimal HTTP front end for RAGChatbot.
+
+    python rag_service.py serve --vector-store vector_store --port 8000
+    python rag_service.py load-test --url http://127.0.0.1:8000 --concurrency 16 --requests 200
+
+Endpoints: POST /ask {"question"}, POST /retrieve {"question", "k"}, GET /health,
+and GET /metrics (Prometheus text) when started with --trace.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple, Union
+from urllib.parse import urlparse
+
+from tracing import enable_tracing, get_tracer
+
+
+class ServiceOverloaded(Exception):
+    """Raised when too many requests are already waiting"""
+
+
+class ServiceNotReady(Exception):
+    """Raised when the chatbot has no vector store loaded yet"""
+
+
+class RAGService:
+    """Async API over a RAGChatbot with bounded concurrency.
+
+    Retrieval (query embedding + FAISS search) and generation run on
+    separate sized thread pools so slow generations cannot starve
+    retrieval. At most ``max_in_flight`` requests execute at once; up to
+    ``max_waiting`` more wait for a slot and anything beyond that is
+    rejected with ServiceOverloaded. Each request has a timeout covering
+    both the wait and the work; cancelling the awaiting task releases its
+    slot immediately.
+    """
+
+    def __init__(self, chatbot, max_in_flight: int = 16, max_waiting: int = 64,
+                 retrieval_workers: int = 4, generation_workers: int = 2, timeout: float = 30.0):
+        self.chatbot = chatbot
+        self.max_in_flight = max_in_flight
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._retrieval_pool = ThreadPoolExecutor(retrieval_workers, thread_name_prefix="rag-retrieve")
+        self._generation_pool = ThreadPoolExecutor(generation_workers, thread_name_prefix="rag-generate")
+        # Metrics
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.timeouts = 0
+        self.rejected = 0
+
+    async def _call(self, pool: ThreadPoolExecutor, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(pool, fn, *args)
+
+    async def _admit(self, coro, timeout: float):
+        """Run coro under the in-flight limit and timeout"""
+        if self.waiting >= self.max_waiting:
+            self.rejected += 1
+            coro.close()
+            raise ServiceOverloaded(f"{self.waiting} requests already waiting")
+
+        async def run():
+            self.waiting += 1
+            try:
+                await self._slots.acquire()
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+            try:
+                return await coro
+            finally:
+                self.in_flight -= 1
+                self._slots.release()
+
+        try:
+            result = await asyncio.wait_for(run(), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        self.completed += 1
+        return result
+
+    def _check_ready(self):
+        if not self.chatbot.is_initialized:
+            raise ServiceNotReady("Chatbot is not initialized")
+
+    async def retrieve(self, question: str, k: int = None, timeout: float = None) -> List[Tuple[str, float]]:
+        """Relevant contexts with scores for a question"""
+        self._check_ready()
+
+        async def work():
+            contexts = await self._call(self._retrieval_pool, self.chatbot.retrieve, question, k)
+            return [(text, float(score)) for text, score in contexts]
+        return await self._admit(work(), timeout)
+
+    async def ask(self, question: str, timeout: float = None) -> str:
+        """Answer a question"""
+        self._check_ready()
+
+        async def work():
+            # Retrieval warms the chatbot's query cache, so generation reuses it
+            await self._call(self._retrieval_pool, self.chatbot.retrieve, question)
+            return await self._call(self._generation_pool, self.chatbot.ask_question, question)
+        return await self._admit(work(), timeout)
+
+    def metrics(self) -> dict:
+        return {
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            'completed': self.completed,
+            'timeouts': self.timeouts,
+            'rejected': self.rejected,
+            'max_in_flight': self.max_in_flight
+        }
+
+    def close(self):
+        self._retrieval_pool.shutdown(wait=False, cancel_futures=True)
+        self._generation_pool.shutdown(wait=False, cancel_futures=True)
+
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error",
+            503: "Service Unavailable", 504: "Gateway Timeout"}
+
+
+async def _respond(writer: asyncio.StreamWriter, status: int, payload: Union[dict, str], keep_alive: bool):
+    # Text payloads (the Prometheus exposition) go out as-is, everything else as JSON
+    if isinstance(payload, str):
+        body, content_type = payload.encode('utf-8'), "text/plain; version=0.0.4"
+    else:
+        body, content_type = json.dumps(payload).encode('utf-8'), "application/json"
+    head = (f"HTTP/1.1 {status} {_REASONS[status]}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    writer.write(head.encode('ascii') + body)
+    await writer.drain()
+
+
+async def _handle(service: RAGService, method: str, path: str, body: bytes) -> Tuple[int, Union[dict, str]]:
+    if method == "GET" and path == "/health":
+        return 200, {'initialized': service.chatbot.is_initialized, **service.metrics()}
+    if method == "GET" and path == "/metrics" and get_tracer().enabled:
+        return 200, enable_tracing().prometheus_text()
+    if method != "POST" or path not in ("/ask", "/retrieve"):
+        return 404, {'error': f"No route for {method} {path}"}
+    try:
+        request = json.loads(body or b"{}")
+        if not isinstance(request, dict) or not isinstance(request.get("question"), str):
+            raise ValueError("question")
+        question = request["question"]
+        k = request.get("k")
+        k = None if k is None else int(k)
+        # k=0 would silently mean context_k and a negative k fails inside FAISS
+        if k is not None and k < 1:
+            raise ValueError("k")
+        timeout = request.get("timeout")
+        timeout = None if timeout is None else float(timeout)
+    except (ValueError, TypeError):
+        return 400, {'error': 'Expected a JSON object with a string "question" field and numeric "k" (at least 1) and "timeout"'}
+
+    try:
+        if path == "/ask":
+            return 200, {'answer': await service.ask(question, timeout)}
+        contexts = await service.retrieve(question, k, timeout)
+        return 200, {'contexts': contexts}
+    except (ServiceOverloaded, ServiceNotReady) as e:
+        return 503, {'error': str(e)}
+    except asyncio.TimeoutError:
+        return 504, {'error': 'Request timed out'}
+    except Exception as e:
+        return 500, {'error': str(e)}
+
+
+async def serve(service: RAGService, host: str = "127.0.0.1", port: int = 8000):
+    """Serve the JSON API over HTTP/1.1 with keep-alive"""
+    async def connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode('latin-1').partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                keep_alive = headers.get("connection", "").lower() != "close"
+                status, payload = await _handle(service, method, path, body)
+                await _respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(connection, host, port)
+    print(f"Serving on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+async def load_test(url: str, question: str, concurrency: int, requests: int, path: str = "/ask") -> dict:
+    """Drive the HTTP API with keep-alive clients and report latency percentiles and QPS"""
+    target = urlparse(url)
+    body = json.dumps({'question': question}).encode('utf-8')
+    request = (f"POST {path} HTTP/1.1\r\nHost: {target.netloc}\r\nContent-Type: application/json\r\n"
+               f"Content-Length: {len(body)}\r\n\r\n").encode('ascii') + body
+    latencies, statuses = [], {}
+    remaining = iter(range(requests))
+
+    async def client():
+        reader, writer = await asyncio.open_connection(target.hostname, target.port or 80)
+        try:
+            for _ in remaining:
+                start = time.perf_counter()
+                writer.write(request)
+                await writer.drain()
+                status = int((await reader.readline()).split()[1])
+                length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b""):
+                        break
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":")[1])
+                await reader.readexactly(length)
+                latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    def percentile(p):
+        return latencies[min(int(p / 100 * len(latencies)), len(latencies) - 1)] * 1000 if latencies else 0.0
+
+    return {
+        'requests': len(latencies),
+        'qps': len(latencies) / elapsed,
+        'p50_ms': percentile(50),
+        'p95_ms': percentile(95),
+        'p99_ms': percentile(99),
+        'statuses': statuses
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Async RAG service")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="Run the HTTP front end")
+    serve_parser.add_argument("--vector-store", default="vector_store")
+    serve_parser.add_argument("--docs", help="Index this folder instead of loading a saved store")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8000)
+    serve_parser.add_argument("--max-in-flight", type=int, default=16)
+    serve_parser.add_argument("--max-waiting", type=int, default=64)
+    serve_parser.add_argument("--retrieval-workers", type=int, default=4)
+    serve_parser.add_argument("--generation-workers", type=int, default=2)
+    serve_parser.add_argument("--timeout", type=float, default=30.0)
+    serve_parser.add_argument("--mmap", action="store_true", help="Memory-map the saved index")
+    serve_parser.add_argument("--rerank", action="store_true", help="Rerank candidates with a cross-encoder")
+    serve_parser.add_argument("--rerank-candidates", type=int, default=20)
+    serve_parser.add_argument("--rerank-budget-ms", type=float, default=200.0)
+    serve_parser.add_argument("--context-k", type=int, default=3, help="Chunks passed to generation")
+    serve_parser.add_argument("--dedup-threshold", type=float,
+                              help="Skip chunks at least this similar to indexed ones when indexing --docs")
+    serve_parser.add_argument("--trace", action="store_true", help="Record per-stage latencies and serve GET /metrics")
+    serve_parser.add_argument("--trace-log", action="store_true", help="Also log one line per span")
+
+    load_parser = commands.add_parser("load-test", help="Load-test a running service")
+    load_parser.add_argument("--url", default="http://127.0.0.1:8000")
+    load_parser.add_argument("--path", default="/ask", choices=["/ask", "/retrieve"])
+    load_parser.add_argument("--question", default="What is RAG?")
+    load_parser.add_argument("--concurrency", type=int, default=16)
+    load_parser.add_argument("--requests", type=int, default=200)
+
+    args = parser.parse_args()
+    if args.command == "load-test":
+        print(json.dumps(asyncio.run(load_test(args.url, args.question, args.concurrency, args.requests, args.path)), indent=2))
+        return
+
+    if args.trace or args.trace_log:
+        enable_tracing(log=args.trace_log)
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+
+    from rag_chatbot import RAGChatbot
+    chatbot = RAGChatbot(use_simple_llm=True, rerank=args.rerank, rerank_candidates=args.rerank_candidates,
+                         rerank_budget_ms=args.rerank_budget_ms, context_k=args.context_k,
+                         dedup_threshold=args.dedup_threshold)
+    if args.docs:
+        chatbot.load_documents(args.docs)
+    else:
+        chatbot.load_vector_store(args.vector_store, mmap=args.mmap)
+    if not chatbot.is_initialized:
+        parser.error("Failed to initialize chatbot")
+
+    async def run():
+        # The semaphore must be created inside the running loop on older Pythons
+        service = RAGService(chatbot, args.max_in_flight, args.max_waiting, args.retrieval_workers,
+                             args.generation_workers, args.timeout)
+        try:
+            await serve(service, args.host, args.port)
+        finally:
+            service.close()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
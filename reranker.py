@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Sequence, Tuple
+
+from tracing import Tracer, get_tracer
+
+
+class CrossEncoderReranker:
+    """Second-stage reranking of retrieved chunks with a small cross-encoder.
+
+    Candidates are scored in batches in retrieval order. Once the per-query
+    budget is spent, or the next batch is not expected to fit in what is
+    left, the remaining candidates keep their retrieval order after the
+    scored ones; the first batch always runs. Scores are cached per
+    (query, chunk) pair, so repeated and overlapping queries skip the model.
+    """
+
+    def __init__(self, model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2", batch_size: int = 16,
+                 budget_ms: float = 200.0, cache_size: int = 4096, tracer: Tracer = None):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.budget_ms = budget_ms
+        self.cache_size = cache_size
+        self.tracer = tracer or get_tracer()
+        self._model = None
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # Metrics
+        self.cache_hits = 0
+        self.scored = 0
+        self.cutoffs = 0
+
+    @property
+    def model(self):
+        """CrossEncoder on CPU, loaded on first use"""
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+                self._model = CrossEncoder(self.model_name, device="cpu")
+            return self._model
+
+    def warm_up(self):
+        """Load the model now instead of on the first request"""
+        self.model
+
+    def _cached(self, query: str, text: str):
+        with self._cache_lock:
+            score = self._cache.get((query, text))
+            if score is not None:
+                self._cache.move_to_end((query, text))
+            return score
+
+    def _store(self, query: str, texts: Sequence[str], scores: Sequence[float]):
+        with self._cache_lock:
+            for text, score in zip(texts, scores):
+                self._cache[(query, text)] = score
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def rerank(self, query: str, texts: Sequence[str], top_k: int, budget_ms: float = None) -> List[Tuple[int, float]]:
+        """Return (index into texts, score) for the best top_k candidates.
+
+        Candidates cut off by the budget share the lowest model score so
+        scores stay monotone in rank.
+        """
+        budget = (self.budget_ms if budget_ms is None else budget_ms) / 1000
+        start = time.perf_counter()
+        scores = [self._cached(query, text) for text in texts]
+        self.cache_hits += sum(score is not None for score in scores)
+        pending = [i for i, score in enumerate(scores) if score is None]
+
+        with self.tracer.span("rerank"):
+            batch_seconds = 0.0
+            for offset in range(0, len(pending), self.batch_size):
+                elapsed = time.perf_counter() - start
+                if offset and elapsed + batch_seconds > budget:
+                    self.cutoffs += 1
+                    self.tracer.count("rerank_cutoffs")
+                    break
+                batch = pending[offset:offset + self.batch_size]
+                batch_start = time.perf_counter()
+                batch_scores = self.model.predict([(query, texts[i]) for i in batch],
+                                                  batch_size=self.batch_size, show_progress_bar=False)
+                batch_seconds = time.perf_counter() - batch_start
+                batch_scores = [float(score) for score in batch_scores]
+                for i, score in zip(batch, batch_scores):
+                    scores[i] = score
+                self._store(query, [texts[i] for i in batch], batch_scores)
+                self.scored += len(batch)
+
+        scored = sorted((i for i, score in enumerate(scores) if score is not None), key=lambda i: -scores[i])
+        floor = scores[scored[-1]] if scored else 0.0
+        unscored = [i for i, score in enumerate(scores) if score is None]
+        return [(i, scores[i]) for i in scored[:top_k]] + [(i, floor) for i in unscored[:max(top_k - len(scored), 0)]]
+
+    def metrics(self) -> dict:
+        return {'cache_hits': self.cache_hits, 'scored': self.scored, 'cutoffs': self.cutoffs,
+                'cache_entries': len(self._cache)}
@@ -0,0 +1,219 @@
+import heapq
+import json
+import os
+import re
+import shutil
+import threading
+import zlib
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from embedding_cache import DEFAULT_CACHE_DIR
+from vector_store import VectorStore
+
+# Shards opened by process-pool workers, keyed by path: (index mtime, store)
+_worker_shards: Dict[str, Tuple[int, VectorStore]] = {}
+
+
+def _search_saved_shard(path: str, query_embeddings: np.ndarray, k: int, nprobe: Optional[int],
+                        ef_search: Optional[int], where: Optional[Dict]) -> List[List[Tuple[str, float]]]:
+    """Search a shard from disk inside a worker process, reopening it if it was re-saved"""
+    stamp = os.stat(f"{path}.faiss").st_mtime_ns
+    cached = _worker_shards.get(path)
+    if cached is None or cached[0] != stamp:
+        store = VectorStore(cache_dir=None)
+        store.load(path, mmap=True)
+        _worker_shards[path] = cached = (stamp, store)
+    return cached[1].search_vectors(query_embeddings, k, nprobe, ef_search, where)
+
+
+def _merge_top_k(shard_results: List[List[Tuple[str, float]]], k: int) -> List[Tuple[str, float]]:
+    """k-way heap merge of per-shard result lists, each already sorted best first"""
+    return list(islice(heapq.merge(*shard_results, key=lambda hit: -hit[1]), k))
+
+
+class ShardedVectorStore:
+    """VectorStore partitioned across independent on-disk shards.
+
+    Chunks go to a shard named after their source path (``partition="source"``)
+    or to one of ``num_shards`` buckets by a hash of the text
+    (``partition="hash"``). Each shard is a VectorStore saved under
+    ``{root}/{shard}/store``, so shards can be added or removed without
+    touching the others. Queries are embedded once, searched on every shard
+    in parallel and the per-shard top-k lists are merged with a heap.
+
+    With ``use_processes`` saved shards are searched in worker processes
+    that open them from disk, standing in for remote nodes; otherwise a
+    thread pool is used (FAISS releases the GIL while searching).
+    """
+
+    def __init__(self, root: str, partition: str = "source", num_shards: int = 8,
+                 model_name: str = "all-MiniLM-L6-v2", cache_dir: str = DEFAULT_CACHE_DIR,
+                 index_type: str = "flat", index_params: Dict = None, max_workers: int = None,
+                 use_processes: bool = False):
+        if partition not in ("source", "hash"):
+            raise ValueError(f"Unknown partition {partition!r}; expected 'source' or 'hash'")
+        self.root = root
+        self.partition = partition
+        self.num_shards = num_shards
+        self.model_name = model_name
+        self.cache_dir = cache_dir
+        self.index_type = index_type
+        self.index_params = index_params or {}
+        self.max_workers = max_workers
+        self.use_processes = use_processes
+        self.shard_names: List[str] = []
+        self._shards: Dict[str, VectorStore] = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._executor: Optional[Executor] = None
+        # Encodes documents and queries for every shard, so the model is loaded once
+        self._encoder = VectorStore(model_name, cache_dir, index_type, index_params)
+
+    def _shard_path(self, name: str) -> str:
+        return os.path.join(self.root, name, "store")
+
+    def shard_for(self, text: str, source: str = None) -> str:
+        """Name of the shard a chunk belongs to"""
+        if self.partition == "source":
+            if source is None:
+                raise ValueError("source is required with partition='source'")
+            # Readable file name plus a hash of the full path, so equal or equally
+            # sanitized names from different paths get different shards
+            path = os.path.normcase(os.path.normpath(source))
+            name = re.sub(r'[^A-Za-z0-9_.-]+', '_', os.path.basename(path)) or "_"
+            return f"{name}-{zlib.crc32(path.encode('utf-8')):08x}"
+        return f"shard-{zlib.crc32(text.encode('utf-8')) % self.num_shards:03d}"
+
+    def _new_shard(self) -> VectorStore:
+        # Shards receive precomputed vectors, so they need no embedding cache of their own
+        store = VectorStore(self.model_name, None, self.index_type, self.index_params)
+        store._embedding_model = self._encoder.embedding_model
+        return store
+
+    def shard(self, name: str) -> VectorStore:
+        """The shard's VectorStore, opened from disk (memory-mapped) on first use"""
+        with self._lock:
+            store = self._shards.get(name)
+            if store is None:
+                store = self._new_shard()
+                if name in self.shard_names:
+                    store.load(self._shard_path(name), mmap=True)
+                self._shards[name] = store
+            return store
+
+    def add_documents(self, documents: List[str], source: str = None, metadatas: List[Dict] = None):
+        """Embed documents once and add each to its shard"""
+        if not documents:
+            return
+        embeddings = self._encoder._encode_documents(documents)
+        metadatas = metadatas or [None] * len(documents)
+        groups: Dict[str, List[int]] = {}
+        for i, text in enumerate(documents):
+            groups.setdefault(self.shard_for(text, source), []).append(i)
+        for name, rows in groups.items():
+            self.shard(name).add_vectors([documents[i] for i in rows], embeddings[rows],
+                                         [metadatas[i] for i in rows])
+            with self._lock:
+                if name not in self.shard_names:
+                    self.shard_names.append(name)
+                self._dirty.add(name)
+
+    def remove_shard(self, name: str):
+        """Drop a shard and its files; other shards are untouched"""
+        with self._lock:
+            if name not in self.shard_names:
+                raise KeyError(f"No shard named {name!r}")
+            self.shard_names.remove(name)
+            self._shards.pop(name, None)
+            self._dirty.discard(name)
+        shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+        self._save_manifest()
+
+    def remove_source(self, source: str):
+        """Drop every chunk of a source file (source partitioning only)"""
+        if self.partition != "source":
+            raise ValueError("remove_source needs partition='source'; hash shards mix chunks of many sources")
+        self.remove_shard(self.shard_for("", source))
+
+    def __len__(self) -> int:
+        return sum(len(self.shard(name).documents) for name in list(self.shard_names))
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            # Sized for the shards the store can grow to, not the ones it has when first searched;
+            # pool threads and processes are only started as searches need them
+            cpus = os.cpu_count() or 1
+            workers = self.max_workers or (min(self.num_shards, cpus) if self.partition == "hash" else cpus)
+            pool = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+            self._executor = pool(max_workers=workers)
+        return self._executor
+
+    def search(self, query: str, k: int = 5, nprobe: int = None, ef_search: int = None,
+               where: Dict = None) -> List[Tuple[str, float]]:
+        """Search every shard and return the merged top-k"""
+        return self.search_batch([query], k, nprobe=nprobe, ef_search=ef_search, where=where)[0]
+
+    def search_batch(self, queries: List[str], k: int = 5, nprobe: int = None,
+                     ef_search: int = None, where: Dict = None) -> List[List[Tuple[str, float]]]:
+        """Fan a batch of queries out to all shards in parallel and merge per query"""
+        query_embeddings = self._encoder.embedding_model.encode(queries, normalize_embeddings=True)
+        query_embeddings = np.asarray(query_embeddings, dtype=np.float32)
+        with self._lock:
+            names, dirty = list(self.shard_names), set(self._dirty)
+
+        futures = []
+        for name in names:
+            if self.use_processes and name not in dirty:
+                futures.append(self.executor.submit(_search_saved_shard, self._shard_path(name),
+                                                    query_embeddings, k, nprobe, ef_search, where))
+            elif self.use_processes:
+                # Unsaved changes only exist in this process
+                futures.append(self.shard(name).search_vectors(query_embeddings, k, nprobe, ef_search, where))
+            else:
+                futures.append(self.executor.submit(self.shard(name).search_vectors,
+                                                    query_embeddings, k, nprobe, ef_search, where))
+        per_shard = [future if isinstance(future, list) else future.result() for future in futures]
+        return [_merge_top_k([results[row] for results in per_shard], k) for row in range(len(queries))]
+
+    def _save_manifest(self):
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, "shards.json.tmp"), 'w', encoding='utf-8') as f:
+            json.dump({
+                'partition': self.partition,
+                'num_shards': self.num_shards,
+                'model_name': self.model_name,
+                'index_type': self.index_type,
+                'index_params': self.index_params,
+                'shards': self.shard_names
+            }, f, indent=2)
+        os.replace(os.path.join(self.root, "shards.json.tmp"), os.path.join(self.root, "shards.json"))
+
+    def save(self):
+        """Write shards changed since the last save, then the shard list"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        for name in dirty:
+            os.makedirs(os.path.join(self.root, name), exist_ok=True)
+            self.shard(name).save(self._shard_path(name))
+        self._save_manifest()
+
+    @classmethod
+    def load(cls, root: str, cache_dir: str = DEFAULT_CACHE_DIR, max_workers: int = None,
+             use_processes: bool = False) -> "ShardedVectorStore":
+        """Open a saved sharded store; shards are loaded on first search"""
+        with open(os.path.join(root, "shards.json"), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        store = cls(root, data['partition'], data['num_shards'], data['model_name'], cache_dir,
+                    data['index_type'], data['index_params'], max_workers, use_processes)
+        store.shard_names = list(data['shards'])
+        return store
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
@@ -0,0 +1,51 @@
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+
+def rss_bytes() -> int:
+    """Resident set size of this process (peak RSS where /proc is unavailable)"""
+    try:
+        with open("/proc/self/status", 'r') as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        # Windows; not reported
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class PhaseTimer:
+    """Accumulates wall-clock time spent in named startup phases"""
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time the enclosed block under the given phase name"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+    def report(self) -> str:
+        """Render the breakdown as one line per phase"""
+        with self._lock:
+            phases = dict(self.phases)
+        lines = [f"{name:<16}{seconds * 1000:>10.1f} ms" for name, seconds in phases.items()]
+        lines.append(f"{'total':<16}{sum(phases.values()) * 1000:>10.1f} ms")
+        return "\n".join(lines)
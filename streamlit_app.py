@@ -2,6 +2,8 @@ import streamlit as st
 import os
 try:
     from rag_chatbot import RAGChatbot
+    from model_registry import get_registry
+    from tracing import enable_tracing
 except ImportError as e:
     st.error(f"Error importing RAGChatbot: {e}")
     st.stop()
@@ -13,13 +15,23 @@ st.set_page_config(
     layout="wide"
 )
 
-# Initialize session state
+# Initialize session state. Models and saved vector stores come from a
+# process-wide registry, so each session only adds its chat history and
+# references to the shared objects (released when the session is dropped).
 if 'chatbot' not in st.session_state:
-    st.session_state.chatbot = RAGChatbot(use_simple_llm=True)
+    st.session_state.chatbot = RAGChatbot(use_simple_llm=True, registry=get_registry())
+    # Load the embedding model in the background while the page renders
+    st.session_state.chatbot.start_warm_up()
 
 if 'chat_history' not in st.session_state:
     st.session_state.chat_history = []
 
+# Per-stage latency histograms shared by all sessions; set RAG_METRICS_PORT
+# to also expose them to Prometheus at :port/metrics (on RAG_METRICS_HOST, localhost by default)
+metrics_port = os.environ.get("RAG_METRICS_PORT")
+stage_metrics = enable_tracing(prometheus_port=int(metrics_port) if metrics_port else None,
+                               prometheus_host=os.environ.get("RAG_METRICS_HOST", "127.0.0.1"))
+
 # Main UI
 st.title("🤖 RAG Q&A Chatbot")
 st.markdown("Upload documents and ask questions based on their content!")
@@ -91,6 +103,48 @@ with st.sidebar:
     else:
         st.warning("Folder does not exist")
     
+    # Parallel extraction (0 = load files one at a time)
+    st.session_state.chatbot.ingest_workers = st.number_input(
+        "Extraction workers:",
+        min_value=0,
+        max_value=os.cpu_count() or 1,
+        value=st.session_state.chatbot.ingest_workers,
+        help="Number of processes used to extract text from files and PDF page ranges"
+    )
+    
+    # Keyword matching helps identifier and exact-phrase questions
+    modes = ["dense", "hybrid", "bm25"]
+    st.session_state.chatbot.retrieval_mode = st.selectbox(
+        "Retrieval mode:",
+        modes,
+        index=modes.index(st.session_state.chatbot.retrieval_mode),
+        help="dense: embeddings only; bm25: keywords only; hybrid: reciprocal rank fusion of both"
+    )
+    
+    # Second stage: a cross-encoder picks the best chunks from a wider candidate set
+    st.session_state.chatbot.rerank = st.checkbox(
+        "Rerank with cross-encoder",
+        value=st.session_state.chatbot.rerank,
+        help=f"Score the top {st.session_state.chatbot.rerank_candidates} candidates with a cross-encoder "
+             f"(budget {st.session_state.chatbot.rerank_budget_ms:.0f} ms per question)"
+    )
+    st.session_state.chatbot.context_k = st.slider(
+        "Context chunks:",
+        min_value=1,
+        max_value=8,
+        value=st.session_state.chatbot.context_k,
+        help="Chunks passed to generation; fewer chunks generate faster"
+    )
+    
+    # Repeated boilerplate and overlapping windows are embedded only once
+    skip_duplicates = st.checkbox(
+        "Skip near-duplicate chunks",
+        value=st.session_state.chatbot.dedup_threshold is not None,
+        help="Chunks at least 90% similar (MinHash estimate) to an indexed chunk are not embedded; "
+             "the indexed chunk keeps their source references"
+    )
+    st.session_state.chatbot.dedup_threshold = 0.9 if skip_duplicates else None
+    
     # Load documents button
     if st.button("Load Documents"):
         if not os.path.exists(docs_folder):
@@ -101,6 +155,9 @@ with st.sidebar:
                 st.error("No .txt or .pdf files found in the folder.")
             else:
                 with st.spinner("Processing documents..."):
+                    # Reuse the saved index so only changed files are re-embedded
+                    if st.session_state.chatbot.vector_store is None and os.path.exists("vector_store"):
+                        st.session_state.chatbot.load_vector_store("vector_store")
                     success = st.session_state.chatbot.load_documents(docs_folder)
                     if success and st.session_state.chatbot.is_initialized:
                         st.success(f"Successfully loaded {len(files)} documents!")
@@ -123,6 +180,22 @@ with st.sidebar:
         st.success("✅ Chatbot Ready")
     else:
         st.warning("⚠️ Load documents first")
+    
+    if st.session_state.chatbot.timings.phases:
+        with st.expander("⏱️ Startup timings"):
+            st.code(st.session_state.chatbot.timings.report())
+    
+    if stage_metrics.names():
+        with st.expander("📊 Stage latency"):
+            st.code(stage_metrics.report())
+            for stage in stage_metrics.names():
+                *buckets, (_, overflow) = stage_metrics.histogram(stage)
+                st.caption(f"{stage} (count per bucket upper bound in ms)"
+                           + (f", {overflow} above {buckets[-1][0]:g} ms" if overflow else ""))
+                # Numeric keys keep the buckets in order; empty outer buckets are dropped
+                used = [i for i, (_, count) in enumerate(buckets) if count]
+                if used:
+                    st.bar_chart({"count": dict(buckets[used[0]:used[-1] + 1])})
 
 # Main chat interface
 st.header("💬 Chat Interface")
@@ -148,17 +221,18 @@ with col2:
 if ask_button and question:
     if st.session_state.chatbot.is_initialized:
         with st.spinner("Generating response..."):
-            # Get answer
-            answer = st.session_state.chatbot.ask_question(question)
+            # Display current Q&A, rendering the answer as it streams in
+            st.subheader("Current Response:")
+            st.write(f"**Question:** {question}")
+            answer_placeholder = st.empty()
+            answer = ""
+            for piece in st.session_state.chatbot.ask_question_stream(question):
+                answer += piece
+                answer_placeholder.markdown(f"**Answer:** {answer}")
             
             # Add to chat history
             st.session_state.chat_history.append((question, answer))
             
-            # Display current Q&A
-            st.subheader("Current Response:")
-            st.write(f"**Question:** {question}")
-            st.write(f"**Answer:** {answer}")
-            
             # Show context if requested
             if show_context:
                 st.subheader("Retrieved Context:")
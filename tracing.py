@@ -0,0 +1,264 @@
+"""Spans and counters around the RAG pipeline stages.
+
+Stages record into a process-wide Tracer that is disabled by default; a
+disabled tracer hands out one shared no-op span, so instrumented code pays
+only an attribute check. enable_tracing() turns it on with an in-memory
+histogram exporter, optionally a log line per span and a Prometheus text
+endpoint.
+
+    with get_tracer().span("search"):
+        ...
+"""
+import bisect
+import logging
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+# Pipeline stages in the order a question (or an ingested file) passes through them
+STAGES = ("extract", "chunk", "embed", "index_add", "embed_query", "search", "keyword_search",
+          "rerank", "context", "prefill", "generate")
+
+# Histogram bucket upper bounds in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "start")
+
+    def __init__(self, tracer: "Tracer", name: str):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # GeneratorExit from an abandoned stream is not an error
+        error = exc_type is not None and issubclass(exc_type, Exception)
+        self.tracer.record(self.name, time.perf_counter() - self.start, error)
+        return False
+
+
+class Tracer:
+    """Dispatches span durations and counter increments to exporters.
+
+    Exporters implement record(name, seconds, error) and count(name, value).
+    """
+
+    def __init__(self, enabled: bool = False, exporters: List = None):
+        self.enabled = enabled
+        self.exporters = list(exporters or [])
+
+    def span(self, name: str):
+        """Context manager timing one stage"""
+        return _Span(self, name) if self.enabled else _NOOP_SPAN
+
+    def record(self, name: str, seconds: float, error: bool = False):
+        """Record a duration measured elsewhere"""
+        if self.enabled:
+            for exporter in self.exporters:
+                exporter.record(name, seconds, error)
+
+    def count(self, name: str, value: int = 1):
+        """Increment a counter"""
+        if self.enabled:
+            for exporter in self.exporters:
+                exporter.count(name, value)
+
+
+class LogExporter:
+    """One log line per span"""
+
+    def __init__(self, logger: logging.Logger = None, level: int = logging.INFO):
+        self.logger = logger or logging.getLogger("rag.trace")
+        self.level = level
+
+    def record(self, name: str, seconds: float, error: bool):
+        self.logger.log(self.level, "span=%s ms=%.2f%s", name, seconds * 1000, " error" if error else "")
+
+    def count(self, name: str, value: int):
+        pass
+
+
+class HistogramExporter:
+    """Cumulative bucket counts per span name plus a window of recent durations for percentiles"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, window: int = 1024):
+        self.buckets = tuple(sorted(buckets))
+        self.window = window
+        self._lock = threading.Lock()
+        self._bucket_counts: Dict[str, List[int]] = {}
+        self._sums: Dict[str, float] = {}
+        self._errors: Dict[str, int] = {}
+        self._recent: Dict[str, deque] = {}
+        self.counters: Dict[str, int] = {}
+
+    def record(self, name: str, seconds: float, error: bool):
+        with self._lock:
+            if name not in self._bucket_counts:
+                # The extra slot counts durations above the last bound
+                self._bucket_counts[name] = [0] * (len(self.buckets) + 1)
+                self._sums[name] = 0.0
+                self._errors[name] = 0
+                self._recent[name] = deque(maxlen=self.window)
+            self._bucket_counts[name][bisect.bisect_left(self.buckets, seconds)] += 1
+            self._sums[name] += seconds
+            self._errors[name] += error
+            self._recent[name].append(seconds)
+
+    def count(self, name: str, value: int):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self._bucket_counts.clear()
+            self._sums.clear()
+            self._errors.clear()
+            self._recent.clear()
+            self.counters.clear()
+
+    def names(self) -> List[str]:
+        """Recorded span names, known stages first"""
+        with self._lock:
+            names = list(self._bucket_counts)
+        order = {stage: i for i, stage in enumerate(STAGES)}
+        return sorted(names, key=lambda name: (order.get(name, len(order)), name))
+
+    def histogram(self, name: str) -> List[Tuple[float, int]]:
+        """(bucket upper bound in ms, count) pairs, not cumulative; the last bound is inf"""
+        with self._lock:
+            counts = list(self._bucket_counts.get(name, []))
+        bounds = [bound * 1000 for bound in self.buckets] + [float("inf")]
+        return list(zip(bounds, counts))
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Count, errors, mean and recent p50/p95/p99 in ms per span name"""
+        result = {}
+        for name in self.names():
+            with self._lock:
+                recent = sorted(self._recent[name])
+                count = sum(self._bucket_counts[name])
+                total, errors = self._sums[name], self._errors[name]
+
+            def percentile(p: float) -> float:
+                return recent[min(int(p / 100 * len(recent)), len(recent) - 1)] * 1000
+
+            result[name] = {
+                'count': count,
+                'errors': errors,
+                'mean_ms': total / count * 1000,
+                'p50_ms': percentile(50),
+                'p95_ms': percentile(95),
+                'p99_ms': percentile(99)
+            }
+        return result
+
+    def report(self) -> str:
+        """Render the summary as one line per stage"""
+        lines = [f"{'stage':<16}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}"]
+        for name, row in self.summary().items():
+            lines.append(f"{name:<16}{row['count']:>7}{row['p50_ms']:>8.1f}ms{row['p95_ms']:>8.1f}ms{row['p99_ms']:>8.1f}ms")
+        with self._lock:
+            counters = dict(self.counters)
+        lines.extend(f"{name:<16}{value:>7}" for name, value in sorted(counters.items()))
+        return "\n".join(lines)
+
+    def prometheus_text(self) -> str:
+        """Metrics in the Prometheus text exposition format"""
+        lines = ["# HELP rag_stage_seconds Latency of RAG pipeline stages",
+                 "# TYPE rag_stage_seconds histogram"]
+        errors = []
+        for name in self.names():
+            with self._lock:
+                counts = list(self._bucket_counts[name])
+                total, error_count = self._sums[name], self._errors[name]
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'rag_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'rag_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {sum(counts)}')
+            lines.append(f'rag_stage_seconds_sum{{stage="{name}"}} {total}')
+            lines.append(f'rag_stage_seconds_count{{stage="{name}"}} {sum(counts)}')
+            errors.append(f'rag_stage_errors_total{{stage="{name}"}} {error_count}')
+        lines += ["# HELP rag_stage_errors_total Stage spans that raised", "# TYPE rag_stage_errors_total counter"] + errors
+        with self._lock:
+            counters = dict(self.counters)
+        lines += ["# HELP rag_events_total Pipeline event counters", "# TYPE rag_events_total counter"]
+        lines += [f'rag_events_total{{name="{name}"}} {value}' for name, value in sorted(counters.items())]
+        return "\n".join(lines) + "\n"
+
+
+def serve_prometheus(exporter: HistogramExporter, host: str = "127.0.0.1", port: int = 9100) -> ThreadingHTTPServer:
+    """Serve GET /metrics from a daemon thread"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = exporter.prometheus_text().encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+_tracer = Tracer()
+_histograms: Optional[HistogramExporter] = None
+_prometheus: Optional[ThreadingHTTPServer] = None
+_setup_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    """The process-wide tracer"""
+    return _tracer
+
+
+def enable_tracing(log: bool = False, prometheus_port: int = None,
+                   prometheus_host: str = "127.0.0.1") -> HistogramExporter:
+    """Turn on the process tracer and return its histogram exporter.
+
+    Safe to call repeatedly (e.g. on every Streamlit rerun); the log exporter
+    and the Prometheus endpoint are only added once.
+    """
+    global _histograms, _prometheus
+    with _setup_lock:
+        if _histograms is None:
+            _histograms = HistogramExporter()
+            _tracer.exporters.append(_histograms)
+        if log and not any(isinstance(e, LogExporter) for e in _tracer.exporters):
+            _tracer.exporters.append(LogExporter())
+        if prometheus_port is not None and _prometheus is None:
+            _prometheus = serve_prometheus(_histograms, prometheus_host, prometheus_port)
+        _tracer.enabled = True
+        return _histograms
+
+
+def disable_tracing():
+    """Stop recording; exporters keep what they have"""
+    _tracer.enabled = False
@@ -1,67 +1,368 @@
 import faiss
 import numpy as np
 import pickle
-from sentence_transformers import SentenceTransformer
-from typing import List, Tuple
+import json
+import time
+from typing import Dict, List, Sequence, Tuple
 import os
+from embedding_cache import EmbeddingCache, DEFAULT_CACHE_DIR
+from index_factory import (build_index, train_index, search_parameters, recall_report, rescore, compression_report,
+                           DEFAULT_INDEX_PARAMS, LOSSY_INDEX_TYPES)
+from chunk_store import ChunkList
+from bm25_index import BM25Index, reciprocal_rank_fusion
+from metadata_store import MetadataStore
+from quantization import load_quantized
+from startup_timing import rss_bytes
+
+# Flat codes, HNSW storage and IVF lists are mapped from the file instead of read
+MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
 
 class VectorStore:
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
-        self.embedding_model = SentenceTransformer(model_name)
-        self.dimension = self.embedding_model.get_sentence_embedding_dimension()
-        self.index = faiss.IndexFlatIP(self.dimension)  # Inner product for cosine similarity
-        self.documents = []
-        self.embeddings = []
-    
-    def add_documents(self, documents: List[str]):
-        """Add documents to the vector store"""
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", cache_dir: str = DEFAULT_CACHE_DIR,
+                 index_type: str = "flat", index_params: Dict = None, keep_vectors: bool = None,
+                 quantize: bool = False, rescore_factor: int = 0):
+        # The model is loaded on first use so loading a saved store stays fast
+        self.model_name = model_name
+        self.quantize = quantize
+        self._embedding_model = None
+        # Persistent cache so unchanged chunks are never re-encoded; int8 vectors are cached separately
+        cache_name = f"{model_name}-int8" if quantize else model_name
+        self.embedding_cache = EmbeddingCache(cache_name, cache_dir, normalized=True) if cache_dir else None
+        # Inner product for cosine similarity; "ivf_flat", "ivf_pq" and "hnsw" trade recall for speed,
+        # "fp16" and "sq8" store 2- or 1-byte codes per dimension instead of 4
+        self.index_type = index_type
+        self.index_params = {**DEFAULT_INDEX_PARAMS, **(index_params or {})}
+        self._index = None
+        # Set while the index is memory-mapped from this file; it is re-read before writes
+        self._mmap_path = None
+        self.documents = ChunkList()
+        # Keyword index over the same chunks, for exact-term and hybrid retrieval
+        self._bm25 = BM25Index()
+        # Per-chunk source/page/offset columns used by search filters
+        self._metadata = MetadataStore()
+        # Saved keyword index and metadata are read on first use
+        self._saved_prefix = None
+        # Mode, seconds and RSS of the last load()
+        self.load_stats = {}
+        # Raw vectors are only kept when the index cannot reconstruct them exactly;
+        # once saved they are memory-mapped rather than held in memory
+        self.keep_vectors = index_type in LOSSY_INDEX_TYPES if keep_vectors is None else keep_vectors
+        self._vectors = []
+        # With kept vectors, fetch k * rescore_factor hits from the index and
+        # re-rank them by exact inner product (0 disables)
+        self.rescore_factor = rescore_factor
+    
+    @property
+    def embedding_model(self):
+        """SentenceTransformer model, loaded on first access"""
+        if self._embedding_model is None:
+            from sentence_transformers import SentenceTransformer
+            if self.quantize:
+                self._embedding_model = load_quantized(self.model_name, lambda: SentenceTransformer(self.model_name, device="cpu"))
+            else:
+                self._embedding_model = SentenceTransformer(self.model_name)
+        return self._embedding_model
+    
+    @property
+    def dimension(self) -> int:
+        if self._index is not None:
+            return self._index.d
+        return self.embedding_model.get_sentence_embedding_dimension()
+    
+    @property
+    def index(self) -> faiss.Index:
+        """FAISS index, built empty on first access unless one was loaded"""
+        if self._index is None:
+            self._index = build_index(self.index_type, self.dimension, self.index_params)
+        return self._index
+    
+    @index.setter
+    def index(self, index: faiss.Index):
+        self._index = index
+        self._mmap_path = None
+    
+    @property
+    def bm25(self) -> BM25Index:
+        """Keyword index, read from the saved store (or rebuilt for older stores) on first use"""
+        if self._bm25 is None:
+            if BM25Index.exists(self._saved_prefix):
+                self._bm25 = BM25Index.load(self._saved_prefix)
+            else:
+                self._bm25 = BM25Index()
+                self._bm25.add(self.documents)
+        return self._bm25
+    
+    @property
+    def metadata(self) -> MetadataStore:
+        """Metadata columns, read from the saved store on first use"""
+        if self._metadata is None:
+            if MetadataStore.exists(self._saved_prefix):
+                self._metadata = MetadataStore.load(self._saved_prefix)
+            else:
+                self._metadata = MetadataStore()
+                self._metadata.extend([None] * len(self.documents))
+        return self._metadata
+    
+    def _ensure_writable(self):
+        """Replace a memory-mapped index with an in-memory copy before modifying it"""
+        if self._mmap_path is not None:
+            self.index = faiss.read_index(self._mmap_path)
+    
+    def add_documents(self, documents: List[str], metadatas: List[Dict] = None):
+        """Add documents, with optional metadata dicts such as DocumentProcessor's"""
         # Generate embeddings
-        embeddings = self.embedding_model.encode(documents, normalize_embeddings=True)
-        
-        # Add to FAISS index
-        self.index.add(embeddings.astype(np.float32))
+        self.add_vectors(documents, self._encode_documents(documents), metadatas)
+    
+    def add_vectors(self, documents: List[str], embeddings: np.ndarray, metadatas: List[Dict] = None):
+        """Add documents with precomputed normalized embeddings"""
+        # Add to FAISS index, training IVF indexes on the first batch
+        embeddings = embeddings.astype(np.float32)
+        self._ensure_writable()
+        train_index(self.index, embeddings, self.index_params["train_size"], self.index_params["sq_min_train"])
+        self.index.add(embeddings)
         
-        # Store documents and embeddings
+        # Store documents (and raw vectors for lossy indexes)
         self.documents.extend(documents)
-        self.embeddings.extend(embeddings)
+        self.bm25.add(documents)
+        self.metadata.extend(metadatas or [None] * len(documents))
+        if self.keep_vectors:
+            self._vectors.append(embeddings)
     
-    def search(self, query: str, k: int = 5) -> List[Tuple[str, float]]:
-        """Search for similar documents"""
-        # Generate query embedding
-        query_embedding = self.embedding_model.encode([query], normalize_embeddings=True)
+    def get_vectors(self) -> np.ndarray:
+        """Return all stored vectors, e.g. for re-indexing or recall measurement"""
+        if self.keep_vectors:
+            if not self._vectors:
+                return np.empty((0, self.dimension), dtype=np.float32)
+            return np.concatenate(self._vectors)
+        if isinstance(self.index, faiss.IndexIVF):
+            self.index.make_direct_map()
+        return self.index.reconstruct_n(0, self.index.ntotal)
+    
+    def _vector_rows(self, ids: np.ndarray) -> np.ndarray:
+        """Kept full-precision vectors for the given ids; a saved store only pages in those rows"""
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(self._vectors) == 1:
+            return np.asarray(self._vectors[0][ids])
+        # Gather from each kept batch (e.g. the saved file plus later additions) without concatenating
+        ends = np.cumsum([len(vectors) for vectors in self._vectors])
+        segments = np.searchsorted(ends, ids, side='right')
+        rows = np.empty((len(ids), self.index.d), dtype=np.float32)
+        for segment in np.unique(segments):
+            selected = segments == segment
+            start = ends[segment - 1] if segment else 0
+            rows[selected] = self._vectors[segment][ids[selected] - start]
+        return rows
+    
+    def _encode_documents(self, documents: List[str], batch_size: int = 32) -> np.ndarray:
+        """Encode documents, going through the embedding cache when enabled"""
+        encode = lambda texts: self.embedding_model.encode(texts, batch_size=batch_size, normalize_embeddings=True)
+        if self.embedding_cache:
+            return self.embedding_cache.embed(documents, encode)
+        return encode(documents)
+    
+    def search(self, query: str, k: int = 5, nprobe: int = None, ef_search: int = None,
+               where: Dict = None) -> List[Tuple[str, float]]:
+        """Search for similar documents.
         
-        # Search in FAISS index
-        scores, indices = self.index.search(query_embedding.astype(np.float32), k)
+        nprobe (IVF) and ef_search (HNSW) override the index defaults for this query.
+        where is a MetadataStore filter, e.g. {"source": "a.pdf", "page": {"$lte": 3}}.
+        """
+        return self.search_batch([query], k, nprobe=nprobe, ef_search=ef_search, where=where)[0]
+    
+    def search_batch(self, queries: List[str], k: int = 5, batch_size: int = 256,
+                     nprobe: int = None, ef_search: int = None, where: Dict = None) -> List[List[Tuple[str, float]]]:
+        """Search for many queries at once.
         
-        # Return documents with scores
+        Each micro-batch of batch_size queries is encoded in one call and
+        searched with one FAISS call; results match search() per query.
+        """
         results = []
-        for score, idx in zip(scores[0], indices[0]):
-            if idx < len(self.documents):
-                results.append((self.documents[idx], float(score)))
+        for start in range(0, len(queries), batch_size):
+            batch = queries[start:start + batch_size]
+            
+            # Generate query embeddings
+            query_embeddings = self.embedding_model.encode(batch, batch_size=len(batch), normalize_embeddings=True)
+            results.extend(self.search_vectors(query_embeddings, k, nprobe, ef_search, where))
         
         return results
     
+    def search_vectors(self, query_embeddings: np.ndarray, k: int = 5, nprobe: int = None,
+                       ef_search: int = None, where: Dict = None) -> List[List[Tuple[str, float]]]:
+        """Search with precomputed normalized query embeddings, one result list per row.
+        
+        A where filter is applied inside the FAISS scan through an ID
+        selector, so flat indexes still return k hits when k chunks match.
+        With rescore_factor set on a store that keeps its vectors, scores are
+        exact inner products of the re-ranked top candidates.
+        """
+        selector = bitmap = None
+        if where:
+            mask = self.metadata.mask(where)
+            if not mask.any():
+                return [[] for _ in range(len(query_embeddings))]
+            bitmap = np.packbits(mask, bitorder='little')
+            selector = faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bitmap))
+        params = search_parameters(self.index, nprobe, ef_search, selector)
+        query_embeddings = np.asarray(query_embeddings, dtype=np.float32)
+        if self.rescore_factor and self.keep_vectors:
+            # Cheap pass over the compressed codes, exact scores for the survivors
+            _, candidates = self.index.search(query_embeddings, k * self.rescore_factor, params=params)
+            scores, indices = rescore(query_embeddings, candidates, self._vector_rows, k)
+        else:
+            scores, indices = self.index.search(query_embeddings, k, params=params)
+        
+        # Return documents with scores (approximate indexes pad missing hits with -1)
+        return [
+            [(self.documents[idx], float(score)) for score, idx in zip(row_scores, row_indices)
+             if 0 <= idx < len(self.documents)]
+            for row_scores, row_indices in zip(scores, indices)
+        ]
+    
+    def _dense_ids(self, query: str, k: int, params=None) -> List[Tuple[int, float]]:
+        """(id, score) pairs of the top-k dense hits for one query"""
+        query_embedding = self.embedding_model.encode([query], normalize_embeddings=True)
+        scores, indices = self.index.search(query_embedding.astype(np.float32), k, params=params)
+        return [(int(idx), float(score)) for score, idx in zip(scores[0], indices[0])
+                if 0 <= idx < len(self.documents)]
+    
+    def keyword_search(self, query: str, k: int = 5) -> List[Tuple[str, float]]:
+        """BM25-only search; no embedding is computed"""
+        return [(self.documents[idx], score) for idx, score in self.bm25.search(query, k)]
+    
+    def hybrid_search(self, query: str, k: int = 5, candidates: int = None, rrf_k: int = 60,
+                      nprobe: int = None, ef_search: int = None) -> List[Tuple[str, float]]:
+        """Fuse the dense and BM25 rankings with reciprocal rank fusion.
+        
+        Each retriever contributes its top ``candidates`` (default 4 * k);
+        scores are fused RRF scores, higher is better.
+        """
+        candidates = candidates or 4 * k
+        dense = self._dense_ids(query, candidates, search_parameters(self.index, nprobe, ef_search))
+        keyword = self.bm25.search(query, candidates)
+        fused = reciprocal_rank_fusion([[idx for idx, _ in dense], [idx for idx, _ in keyword]], rrf_k)
+        return [(self.documents[idx], score) for idx, score in fused[:k]]
+    
+    def prefiltered_search(self, query: str, k: int = 5, candidates: int = 100) -> List[Tuple[str, float]]:
+        """Dense scoring of the top BM25 candidates only.
+        
+        BM25 acts as a cheap first pass; candidate vectors are reconstructed
+        from the index and scored exactly, so no ANN probing is involved.
+        Falls back to plain dense search when the query shares no terms
+        with the corpus.
+        """
+        keyword = self.bm25.search(query, candidates)
+        if not keyword:
+            return self.search(query, k)
+        ids = np.array([idx for idx, _ in keyword], dtype=np.int64)
+        if self.keep_vectors:
+            vectors = self._vector_rows(ids)
+        else:
+            if isinstance(self.index, faiss.IndexIVF):
+                self.index.make_direct_map()
+            vectors = self.index.reconstruct_batch(ids)
+        query_embedding = self.embedding_model.encode([query], normalize_embeddings=True)[0]
+        scores = vectors @ query_embedding.astype(np.float32)
+        top = np.argsort(-scores, kind='stable')[:k]
+        return [(self.documents[int(ids[i])], float(scores[i])) for i in top]
+    
     def save(self, filepath: str):
-        """Save vector store to disk"""
-        data = {
-            'documents': self.documents,
-            'embeddings': self.embeddings
-        }
+        """Save vector store to disk.
+        
+        Writes {filepath}.faiss, the chunk texts as {filepath}.chunks plus
+        {filepath}.offsets.npy, the BM25 index as {filepath}.bm25.npz and
+        {filepath}.bm25.json, metadata columns as {filepath}.meta.npz and
+        {filepath}.meta.json, settings in {filepath}.json and, for lossy
+        indexes only, the raw vectors as {filepath}.vectors.npy.
+        """
+        # Save FAISS index; replacing the file keeps any existing memory mapping of it valid
+        faiss.write_index(self.index, f"{filepath}.faiss.tmp")
+        os.replace(f"{filepath}.faiss.tmp", f"{filepath}.faiss")
+        
+        # Save chunk texts, keyword index and metadata columns
+        self.documents.save(filepath)
+        self.bm25.save(filepath)
+        self.metadata.save(filepath)
         
-        # Save FAISS index
-        faiss.write_index(self.index, f"{filepath}.faiss")
+        if self.keep_vectors:
+            with open(f"{filepath}.vectors.npy.tmp", 'wb') as f:
+                np.save(f, self.get_vectors())
+            self._vectors = []
+            os.replace(f"{filepath}.vectors.npy.tmp", f"{filepath}.vectors.npy")
+            self._vectors = [np.load(f"{filepath}.vectors.npy", mmap_mode='r')]
+        elif os.path.exists(f"{filepath}.vectors.npy"):
+            os.remove(f"{filepath}.vectors.npy")
         
         # Save metadata
-        with open(f"{filepath}.pkl", 'wb') as f:
-            pickle.dump(data, f)
+        with open(f"{filepath}.json", 'w', encoding='utf-8') as f:
+            json.dump({
+                'index_type': self.index_type,
+                'index_params': self.index_params,
+                'keep_vectors': self.keep_vectors,
+                'rescore_factor': self.rescore_factor
+            }, f, indent=2)
     
-    def load(self, filepath: str):
-        """Load vector store from disk"""
+    def load(self, filepath: str, mmap: bool = False):
+        """Load vector store from disk.
+        
+        By default everything is read into memory. With mmap=True (opt-in,
+        like RAGChatbot.load_vector_store and --mmap) the FAISS index data,
+        chunk texts and raw vectors are memory-mapped and paged in when
+        accessed, so load time does not grow with the corpus and processes
+        opening the same store share the page cache; the keyword index and
+        metadata are read on first use either way. Stores saved as a single
+        pickle are still readable.
+        """
+        start = time.perf_counter()
+        
         # Load FAISS index
-        self.index = faiss.read_index(f"{filepath}.faiss")
+        self.index = faiss.read_index(f"{filepath}.faiss", MMAP_FLAGS if mmap else 0)
+        self._mmap_path = f"{filepath}.faiss" if mmap else None
+        
+        if ChunkList.exists(filepath):
+            self.documents = ChunkList.open(filepath, mmap=mmap)
+            with open(f"{filepath}.json", 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        else:
+            # Legacy layout: documents and embeddings pickled together
+            with open(f"{filepath}.pkl", 'rb') as f:
+                data = pickle.load(f)
+            self.documents = ChunkList(data['documents'])
+            data['keep_vectors'] = False
+        
+        # Stores saved before the keyword index or metadata existed get them rebuilt on first use
+        self._saved_prefix = filepath
+        self._bm25 = None
+        self._metadata = None
+        
+        self.index_type = data.get('index_type', 'flat')
+        self.index_params = {**DEFAULT_INDEX_PARAMS, **data.get('index_params', {})}
+        self.keep_vectors = data.get('keep_vectors', False)
+        self.rescore_factor = data.get('rescore_factor', self.rescore_factor)
+        self._vectors = []
+        if self.keep_vectors:
+            self._vectors = [np.load(f"{filepath}.vectors.npy", mmap_mode='r' if mmap else None)]
         
-        # Load metadata
-        with open(f"{filepath}.pkl", 'rb') as f:
-            data = pickle.load(f)
-            self.documents = data['documents']
-            self.embeddings = data['embeddings']
+        # Restore default query-time settings
+        if self.index_type in ("ivf_flat", "ivf_pq"):
+            faiss.extract_index_ivf(self.index).nprobe = self.index_params["nprobe"]
+        elif self.index_type == "hnsw":
+            self.index.hnsw.efSearch = self.index_params["ef_search"]
+        
+        self.load_stats = {
+            'mode': 'mmap' if mmap else 'read',
+            'seconds': time.perf_counter() - start,
+            'rss_bytes': rss_bytes()
+        }
+    
+    def recall_report(self, queries: List[str], k: int = 10, nprobe_values: Sequence[int] = (1, 4, 16, 64),
+                      ef_search_values: Sequence[int] = (16, 32, 64, 128)) -> List[Dict]:
+        """Compare recall@k and latency of this index against exact flat search"""
+        query_embeddings = self.embedding_model.encode(queries, normalize_embeddings=True)
+        return recall_report(self.index, self.get_vectors(), query_embeddings,
+                             k, nprobe_values, ef_search_values)
+    
+    def compression_report(self, queries: List[str], k: int = 10, index_types: Sequence[str] = ("flat", "fp16", "sq8"),
+                           rescore_factors: Sequence[int] = (2, 4)) -> List[Dict]:
+        """Bytes per vector, recall@k and latency of compressed flat indexes over this store's vectors"""
+        query_embeddings = self.embedding_model.encode(queries, normalize_embeddings=True)
+        return compression_report(self.get_vectors(), query_embeddings, k, index_types, rescore_factors)